@@ -87,7 +87,7 @@ export default function CheckoutPage() {
          * → Stripeが決済の準備をする
          * → client_secretを受け取る
          */
-        const result = await createPaymentIntent(totalPrice);
+        const result = await createPaymentIntent(totalPrice, crypto.randomUUID());
         setClientSecret(result.clientSecret);
         setPaymentIntentId(result.paymentIntentId);
         setLoading(false);
@@ -137,7 +137,8 @@ export default function CheckoutPage() {
       };
       
       // バックエンドに注文保存を依頼
-      await createOrder(orderData);
+      // PaymentIntentごとに1注文なので、そのIDをIdempotency-Keyにする
+      await createOrder(orderData, `order-${paymentIntent.id}`);
       
       // カートクリア
       clearCart();
@@ -1,54 +1,106 @@
 """Flaskアプリケーションパッケージ"""
+import logging
 from flask import Flask, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
 from config import Config
 from app.models import db
+from app.db_engine import init_engine_options
+from app.db_routing import replica_router
+from app.logging_config import init_logging
+from app.json_provider import init_json_provider
+from app.services.catalog_cache import catalog_cache
+from app.services.search_index import search_index
+from app.services.password_hasher import password_hasher
+from app.services.user_cache import user_cache
+from app.services.stripe_gateway import stripe_gateway
+from app.services.stripe_events import event_consumer
+from app.services.request_metrics import request_metrics
+from app.services.rate_limit import rate_limiter
+
+# 認証失敗のログ（件数が多いため LOG_SAMPLE_RATES で間引く）
+jwt_logger = logging.getLogger('app.jwt')
+
 
 def create_app(config_class=Config):
     """Flaskアプリケーションファクトリ"""
     app = Flask(__name__)
     app.config.from_object(config_class)
+    init_logging(app)
+    init_json_provider(app)
     
     # 拡張機能の初期化
+    init_engine_options(app)
     db.init_app(app)
-    CORS(app, origins=app.config['CORS_ORIGINS'])
+    replica_router.init_app(app)
+    CORS(app, origins=app.config['CORS_ORIGINS'], expose_headers=app.config['CORS_EXPOSE_HEADERS'])
     jwt = JWTManager(app)
     Migrate(app, db)
+    catalog_cache.init_app(app)
+    search_index.init_app(app)
+    password_hasher.init_app(app)
+    user_cache.init_app(app)
+    stripe_gateway.init_app(app)
+    event_consumer.init_app(app)
+    request_metrics.init_app(app)
+    rate_limiter.init_app(app)
     
     # JWTエラーハンドラー
     from flask import jsonify as flask_jsonify
     
     @jwt.unauthorized_loader
     def unauthorized_callback(error_string):
-        print(f'JWT unauthorized: {error_string}')
+        jwt_logger.info('JWT unauthorized: %s', error_string)
         return flask_jsonify({'error': 'Token required'}), 401
     
     @jwt.invalid_token_loader
     def invalid_token_callback(error_string):
-        print(f'JWT invalid token: {error_string}')
+        jwt_logger.info('JWT invalid token: %s', error_string)
         return flask_jsonify({'error': 'Invalid token'}), 422
     
     @jwt.expired_token_loader
     def expired_token_callback(jwt_header, jwt_data):
-        print(f'JWT expired: {jwt_data}')
+        # クレーム全体は出さない
+        jwt_logger.info('JWT expired', extra={'user_id': jwt_data.get('sub'), 'jti': jwt_data.get('jti')})
         return flask_jsonify({'error': 'Token expired'}), 401
     
+    @jwt.token_in_blocklist_loader
+    def check_token_version(jwt_header, jwt_data):
+        """トークンバージョンが現在値と異なる（降格・失効済み）トークンを拒否"""
+        record = user_cache.get(int(jwt_data['sub']))
+        if not record:
+            return True
+        return jwt_data.get('tv', 0) != record['tokenVersion']
+    
+    @jwt.revoked_token_loader
+    def revoked_token_callback(jwt_header, jwt_data):
+        jwt_logger.info('JWT revoked', extra={'user_id': jwt_data.get('sub'), 'jti': jwt_data.get('jti')})
+        return flask_jsonify({'error': 'Token revoked'}), 401
+    
     # ブループリント登録
     from app.routes.auth import auth_bp
     from app.routes.products import products_bp
     from app.routes.orders import orders_bp
     from app.routes.stripe_payment import stripe_payment_bp
+    from app.routes.images import images_bp
+    from app.routes.monitoring import monitoring_bp, metrics_bp
+    from app.routes.analytics import analytics_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(products_bp, url_prefix='/api/products')
     app.register_blueprint(orders_bp, url_prefix='/api/orders')
     app.register_blueprint(stripe_payment_bp, url_prefix='/api/stripe')
+    app.register_blueprint(images_bp, url_prefix='/api/images')
+    app.register_blueprint(monitoring_bp, url_prefix='/api/monitoring')
+    app.register_blueprint(analytics_bp, url_prefix='/api/admin/analytics')
+    app.register_blueprint(metrics_bp)
+    
+    # CLIコマンド登録
+    from app.commands import register_commands
+    register_commands(app)
     
-    # データベーステーブル作成
-    with app.app_context():
-        db.create_all()
+    # スキーマはワーカー起動時には作らない（デプロイ時に flask db upgrade を実行する）
     
     return app
 
@@ -0,0 +1,142 @@
+"""Flask CLIコマンド"""
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from app.models import db, Product, User, IdempotencyKey
+from app.services.catalog_cache import catalog_cache
+from app.services.stripe_events import drain as drain_stripe_events, expire_pending_orders
+from app.services.user_cache import user_cache
+from app.services.image_store import store_data_url
+from app.services.sales_rollup import backfill as backfill_sales
+
+images_cli = AppGroup('images', help='商品画像の管理')
+users_cli = AppGroup('users', help='ユーザーの管理')
+stripe_cli = AppGroup('stripe', help='Stripe連携の管理')
+idempotency_cli = AppGroup('idempotency', help='Idempotency-Keyの管理')
+analytics_cli = AppGroup('analytics', help='売上集計の管理')
+
+
+@images_cli.command('migrate')
+@click.option('--batch-size', default=100, show_default=True, help='1トランザクションで処理する件数')
+def migrate_images(batch_size):
+    """DB内のBase64画像を画像ストアに移し、URLに置き換える"""
+    last_id = 0
+    migrated = 0
+    failed = 0
+    
+    while True:
+        # 1バッチ分のIDと画像列だけを取得（idのキーセットで進める）
+        rows = (
+            db.session.query(Product.id, Product.image_url)
+            .filter(Product.id > last_id, Product.image_url.like('data:%'))
+            .order_by(Product.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        
+        for product_id, image_url in rows:
+            try:
+                new_url = store_data_url(image_url)
+            except ValueError as e:
+                failed += 1
+                click.echo(f'商品ID {product_id}: {e}', err=True)
+                continue
+            db.session.query(Product).filter(Product.id == product_id).update(
+                {Product.image_url: new_url},
+                synchronize_session=False
+            )
+            migrated += 1
+        
+        db.session.commit()
+        catalog_cache.invalidate()
+        last_id = rows[-1].id
+        click.echo(f'{migrated}件移行済み（商品ID {last_id} まで）')
+    
+    click.echo(f'完了: {migrated}件移行, {failed}件失敗')
+
+
+@users_cli.command('set-admin')
+@click.argument('email')
+@click.option('--revoke', is_flag=True, help='管理者権限を外す')
+def set_admin(email, revoke):
+    """管理者権限を付与・剥奪する（発行済みトークンは失効させる）"""
+    user = User.query.filter_by(email=email).first()
+    if not user:
+        raise click.ClickException(f'ユーザーが見つかりません: {email}')
+    
+    user.is_admin = not revoke
+    # 古い is_admin クレームを持つトークンを無効化
+    user.token_version = (user.token_version or 0) + 1
+    db.session.commit()
+    user_cache.invalidate()
+    click.echo(f'{email}: is_admin={user.is_admin}（発行済みトークンを失効しました）')
+
+
+@users_cli.command('revoke-tokens')
+@click.argument('email')
+def revoke_tokens(email):
+    """ユーザーの発行済みトークンをすべて失効させる"""
+    user = User.query.filter_by(email=email).first()
+    if not user:
+        raise click.ClickException(f'ユーザーが見つかりません: {email}')
+    
+    user.token_version = (user.token_version or 0) + 1
+    db.session.commit()
+    user_cache.invalidate()
+    click.echo(f'{email}: 発行済みトークンを失効しました')
+
+
+@stripe_cli.command('process-events')
+@click.option('--limit', default=1000, show_default=True, help='処理する最大件数')
+def process_stripe_events(limit):
+    """処理待ちのWebhookイベントを処理する（バックグラウンド処理の取りこぼし用）"""
+    processed = drain_stripe_events(limit)
+    click.echo(f'{processed}件のイベントを処理しました')
+
+
+@stripe_cli.command('expire-pending')
+@click.option('--limit', default=1000, show_default=True, help='確認する最大件数')
+def expire_pending_stripe_orders(limit):
+    """STRIPE_PENDING_ORDER_TTL を過ぎた保留中の注文をStripeに確認して確定・キャンセルする"""
+    expired = expire_pending_orders(limit)
+    click.echo(f'{expired}件の保留中の注文を片付けました')
+
+
+@idempotency_cli.command('prune')
+@click.option('--hours', type=int, default=None, help='これより古いキーを削除（デフォルト: IDEMPOTENCY_KEY_TTL_HOURS）')
+def prune_idempotency_keys(hours):
+    """期限切れのIdempotency-Keyを削除する"""
+    hours = hours or current_app.config['IDEMPOTENCY_KEY_TTL_HOURS']
+    cutoff = datetime.utcnow() - timedelta(hours=hours)
+    deleted = IdempotencyKey.query.filter(
+        IdempotencyKey.created_at < cutoff,
+        IdempotencyKey.status == 'completed'
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f'{deleted}件のキーを削除しました')
+
+
+@analytics_cli.command('backfill')
+@click.option('--from', 'start', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='開始日（集計日、デフォルト: 最初の注文）')
+@click.option('--to', 'end', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='終了日（集計日、デフォルト: 最後の注文）')
+@click.option('--chunk-days', type=click.IntRange(min=1), default=7, show_default=True, help='1トランザクションで作り直す日数')
+def backfill_sales_rollups(start, end, chunk_days):
+    """注文履歴から売上集計を作り直す（導入時・不整合の修復・ANALYTICS_UTC_OFFSET_HOURS の変更時）"""
+    processed = backfill_sales(
+        start.date() if start else None,
+        end.date() if end else None,
+        chunk_days=chunk_days
+    )
+    click.echo(f'{processed}件の注文を集計しました')
+
+
+def register_commands(app):
+    """CLIコマンドをアプリに登録"""
+    app.cli.add_command(images_cli)
+    app.cli.add_command(users_cli)
+    app.cli.add_command(stripe_cli)
+    app.cli.add_command(idempotency_cli)
+    app.cli.add_command(analytics_cli)
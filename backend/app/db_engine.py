@@ -0,0 +1,140 @@
+"""
+データベースエンジン設定
+
+Gunicornのワーカー数とPostgreSQLの max_connections から接続プールの大きさを決め、
+pre-ping・recycle・サーバー側 statement_timeout を設定する。
+DATABASE_REPLICA_URLS のレプリカは SQLALCHEMY_BINDS（replica_0, ...）に同じ設定で追加する。
+接続プールの取得待ち時間を計測し（プロセス内の集計と /metrics の全ワーカー合計）、fork後の子プロセスでは親の接続を破棄する。
+"""
+import os
+import threading
+import time
+import weakref
+from sqlalchemy.pool import QueuePool
+from app.models import db
+from app.db_routing import REPLICA_BIND_PREFIX
+from app.services.request_metrics import request_metrics
+
+# create_app() で作られたアプリ（fork後のプール破棄に使う）
+_apps = weakref.WeakSet()
+
+
+class PoolMetrics:
+    """接続プールの取得待ち時間（このプロセス分）"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+    
+    def record(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            if seconds > self.wait_seconds_max:
+                self.wait_seconds_max = seconds
+    
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'checkouts': self.checkouts,
+                'waitSecondsTotal': self.wait_seconds_total,
+                'waitSecondsMax': self.wait_seconds_max,
+                'waitSecondsAvg': self.wait_seconds_total / self.checkouts if self.checkouts else 0.0,
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """接続取得（空きを待つ時間を含む）にかかった時間を記録するQueuePool"""
+    
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            seconds = time.perf_counter() - started
+            pool_metrics.record(seconds)
+            request_metrics.record_pool_wait(seconds)
+
+
+def connection_budget(config):
+    """
+    1ワーカープロセスあたりに使える接続数
+    
+    (max_connections - 予約分) をワーカー数で割る
+    """
+    available = config['PG_MAX_CONNECTIONS'] - config['DB_RESERVED_CONNECTIONS']
+    return max(1, available // max(1, config['GUNICORN_WORKERS']))
+
+
+def worker_concurrency(config):
+    """1ワーカープロセスが同時に処理するリクエスト数（ワーカー種別ごと）"""
+    if config['GUNICORN_WORKER_CLASS'] == 'gevent':
+        return config['GUNICORN_WORKER_CONNECTIONS']
+    # sync は threads=1。threads>1 ならGunicornが gthread に切り替える
+    return config['GUNICORN_THREADS']
+
+
+def build_engine_options(config, uri=None):
+    """SQLALCHEMY_ENGINE_OPTIONS を接続先（未指定ならプライマリ）に合わせて生成"""
+    uri = uri or config['SQLALCHEMY_DATABASE_URI']
+    
+    if uri.startswith('sqlite'):
+        # SQLiteは接続プールの大きさではなく、ロック待ちのタイムアウトだけ設定
+        return {'connect_args': {'timeout': config['DB_STATEMENT_TIMEOUT_MS'] / 1000}}
+    
+    budget = connection_budget(config)
+    # 常駐させるのは同時リクエスト数 + バックグラウンド処理1本分まで
+    # （gevent では接続数の上限が先に効き、超えた分は pool_timeout まで待つ）
+    pool_size = min(budget, worker_concurrency(config) + 1)
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': pool_size,
+        'max_overflow': budget - pool_size,
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+    if uri.startswith('postgresql'):
+        options['connect_args'] = {
+            'connect_timeout': config['DB_CONNECT_TIMEOUT'],
+            # 1文の実行時間をサーバー側で制限（遅いクエリでワーカーを占有しない）
+            'options': f'-c statement_timeout={config["DB_STATEMENT_TIMEOUT_MS"]}',
+        }
+    return options
+
+
+def replica_binds(config):
+    """DATABASE_REPLICA_URLS → SQLALCHEMY_BINDS に追加する項目（接続プールはレプリカごとに同じ大きさ）"""
+    urls = [url.strip() for url in config['DATABASE_REPLICA_URLS'].split(',') if url.strip()]
+    return {
+        f'{REPLICA_BIND_PREFIX}{i}': {'url': url, **build_engine_options(config, url)}
+        for i, url in enumerate(urls)
+    }
+
+
+def init_engine_options(app):
+    """db.init_app() より前に呼ぶ。明示的な設定があればそちらを優先"""
+    if not app.config.get('SQLALCHEMY_ENGINE_OPTIONS'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = build_engine_options(app.config)
+    replicas = replica_binds(app.config)
+    if replicas:
+        app.config['SQLALCHEMY_BINDS'] = {**app.config.get('SQLALCHEMY_BINDS', {}), **replicas}
+    _apps.add(app)
+
+
+def dispose_engines_after_fork():
+    """
+    fork直後の子プロセスで、親から引き継いだ接続プールを破棄する
+    
+    close=False で親プロセスの接続は閉じずに手放し、子は新しく接続し直す（Gunicornの post_fork から呼ぶ）
+    """
+    for app in list(_apps):
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
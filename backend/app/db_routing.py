@@ -0,0 +1,230 @@
+"""
+読み取りレプリカへの振り分け
+
+DATABASE_REPLICA_URLS を設定すると、@read_replica を付けた読み取り専用APIのSQLをレプリカで実行する。
+- リクエスト中に書き込み（flush・INSERT/UPDATE/DELETE）が始まったら、以降はプライマリ
+- ユーザー自身の書き込みから DB_READ_YOUR_WRITES_SECONDS の間は、そのユーザーの読み取りもプライマリ
+  （作成直後の注文が一覧に出るように）。最終書き込み時刻は DB_STICKY_FILE で全ワーカーと共有する
+- カタログは商品の変更（管理画面での作成・更新・削除、一括インポート）から同じ間、プライマリから充填する
+  （古い値をキャッシュに入れない）。注文・キャンセルによる在庫だけの変更ではレプリカのままにし
+  （注文のたびにプライマリに向けない）、その間にレプリカから充填したキャッシュは同じ期間で捨てる。
+  在庫の表示は少し遅れることがあるが、注文時の在庫引当はプライマリで行う
+- レプリカの遅延を DB_REPLICA_CHECK_INTERVAL ごとに測り、DB_REPLICA_MAX_LAG_SECONDS を超えた・接続できない・
+  プライマリからWALを受信していない（pg_stat_wal_receiver がストリーミング中でない）レプリカは使わない
+  （使えるものがなければプライマリ）。レプリカで接続エラーが起きたらプライマリで1回やり直す
+
+text() で書いた書き込みは検出しないため、書き込みはORMかCore（insert/update/delete）で行う。
+"""
+import hashlib
+import logging
+import random
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, has_app_context
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from app.utils.shared_memory import SharedCounterArray
+
+logger = logging.getLogger(__name__)
+
+# SQLALCHEMY_BINDS でのレプリカのキー（replica_0, replica_1, ...）
+REPLICA_BIND_PREFIX = 'replica_'
+# 商品の変更を表すキー
+CATALOG = 'catalog'
+# 注文・キャンセルによる在庫だけの変更を表すキー
+CATALOG_STOCK = 'catalog_stock'
+
+# プライマリ自身なら0。WALレシーバーがプライマリからストリーミングしていなければ NULL（使わない。
+# 受信が止まると受信済みと適用済みの位置が揃い、遅れていても0に見えるため）。
+# 受信済みのWALを全て適用済みなら0、そうでなければ最後に適用したトランザクションからの経過秒数
+# （書き込みのないプライマリでも遅延が増え続けて見えないように）
+_POSTGRES_LAG = text(
+    'SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 '
+    "WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL "
+    'WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+
+class RoutingSession(Session):
+    """@read_replica の中ではレプリカのエンジンを返すセッション"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            if self._flushing or getattr(clause, 'is_dml', False):
+                # 書き込みが始まったら、自分の書き込みを読めるよう以降はプライマリ
+                g.db_replica = None
+                g.db_wrote = True
+            else:
+                replica = g.get('db_replica')
+                if replica is not None:
+                    return current_app.extensions['sqlalchemy'].engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _user_key():
+    try:
+        identity = get_jwt_identity()
+    except RuntimeError:  # JWTを検証していないリクエスト
+        return None
+    return f'user:{identity}' if identity is not None else None
+
+
+class ReplicaRouter:
+    """レプリカの遅延の確認と、リクエストごとの振り分け先の決定"""
+    
+    def __init__(self, app=None):
+        self.keys = []
+        self.sticky = None
+        self.max_lag = 0.0
+        self.check_interval = 0.0
+        self.sticky_seconds = 0.0
+        # バインドキー → (確認した時刻, 遅延秒数。接続できなければ None)
+        self._lag = {}
+        self._check_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """db.init_app() の後に呼ぶ"""
+        config = app.config
+        self.keys = sorted(key for key in config.get('SQLALCHEMY_BINDS', {}) if key.startswith(REPLICA_BIND_PREFIX))
+        self.max_lag = config['DB_REPLICA_MAX_LAG_SECONDS']
+        self.check_interval = config['DB_REPLICA_CHECK_INTERVAL']
+        # 遅延の上限 + 確認間隔より短いと、期間が過ぎてもレプリカに書き込みが届いていないことがある
+        self.sticky_seconds = max(config['DB_READ_YOUR_WRITES_SECONDS'], self.max_lag + self.check_interval)
+        self._lag = {key: (float('-inf'), None) for key in self.keys}
+        self.sticky = None
+        app.extensions['replica_router'] = self
+        if not self.keys:
+            return
+        self.sticky = SharedCounterArray(config['DB_STICKY_FILE'], config['DB_STICKY_SLOTS'])
+        app.after_request(self._after_request)
+    
+    def _slot(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') % self.sticky.size
+    
+    def mark_written(self, key):
+        """key（ユーザー・CATALOG）への書き込みを記録し、しばらく読み取りをプライマリに向ける"""
+        if self.sticky is None or key is None:
+            return
+        self.sticky.set_max(self._slot(key), int(time.time() * 1_000_000))
+    
+    def recently_written(self, key):
+        """key への書き込みから読み書き一貫の期間内か（レプリカがなければ False）"""
+        return self.sticky is not None and self._recently_written((key,))
+    
+    def _recently_written(self, keys):
+        # 別のキーと同じ位置になった場合はプライマリに倒れるだけ（安全側）
+        threshold = int((time.time() - self.sticky_seconds) * 1_000_000)
+        return any(self.sticky.get(self._slot(key)) > threshold for key in keys if key is not None)
+    
+    def _check(self, key, engine):
+        try:
+            with engine.connect() as conn:
+                if engine.dialect.name == 'postgresql':
+                    lag = conn.execute(_POSTGRES_LAG).scalar()
+                    lag = None if lag is None else float(lag)
+                else:
+                    conn.execute(text('SELECT 1'))
+                    lag = 0.0
+        except SQLAlchemyError as e:
+            lag = None
+            error = str(e).splitlines()[0]
+        else:
+            error = None if lag is not None else 'WALレシーバーがストリーミングしていません'
+        
+        usable = lag is not None and lag <= self.max_lag
+        checked, previous = self._lag[key]
+        # 初回は使えないときだけ出す
+        was_usable = checked == float('-inf') or (previous is not None and previous <= self.max_lag)
+        if usable != was_usable:
+            # 状態が変わったときだけ出す（確認のたびには出さない）
+            if usable:
+                logger.info('レプリカの使用を再開します', extra={'bind': key, 'lag_seconds': lag})
+            else:
+                logger.warning('レプリカを使用しません', extra={'bind': key, 'lag_seconds': lag, 'error': error})
+        self._lag[key] = (time.monotonic(), lag)
+    
+    def _refresh(self):
+        """確認間隔を過ぎたレプリカの遅延を測る（同時に測るのはプロセス内で1スレッドだけ）"""
+        now = time.monotonic()
+        if all(now - checked < self.check_interval for checked, _ in self._lag.values()):
+            return
+        if not self._check_lock.acquire(blocking=False):
+            return
+        try:
+            engines = current_app.extensions['sqlalchemy'].engines
+            for key in self.keys:
+                if now - self._lag[key][0] >= self.check_interval:
+                    self._check(key, engines[key])
+        finally:
+            self._check_lock.release()
+    
+    def mark_down(self, key):
+        """レプリカを次の確認まで使わない"""
+        logger.warning('レプリカでエラーが発生したため次の確認まで使用しません', extra={'bind': key})
+        self._lag[key] = (time.monotonic(), None)
+    
+    def route(self, scopes=()):
+        """このリクエストの読み取りに使うレプリカのバインドキー（プライマリなら None）"""
+        if not self.keys:
+            return None
+        if self._recently_written((*scopes, _user_key())):
+            return None
+        self._refresh()
+        usable = [key for key, (_, lag) in self._lag.items() if lag is not None and lag <= self.max_lag]
+        return random.choice(usable) if usable else None
+    
+    def status(self):
+        """レプリカごとの遅延（このプロセスが最後に測った値）"""
+        now = time.monotonic()
+        return {
+            key: {
+                'lagSeconds': lag,
+                'usable': lag is not None and lag <= self.max_lag,
+                'checkedSecondsAgo': round(now - checked, 1) if checked != float('-inf') else None,
+            }
+            for key, (checked, lag) in self._lag.items()
+        }
+    
+    def _after_request(self, response):
+        if g.get('db_wrote') and response.status_code < 400:
+            self.mark_written(_user_key())
+        return response
+
+
+replica_router = ReplicaRouter()
+
+
+def read_replica(*scopes):
+    """
+    読み取り専用のルート関数のSQLをレプリカで実行するデコレーター
+    
+    scopes: 最近書き込まれていたらプライマリを使うキー（CATALOG など）。ログイン中のユーザー自身の書き込みは常に見る。
+    JWTを使うルートでは @jwt_required() の内側に置く
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            replica = replica_router.route(scopes)
+            if replica is None:
+                return fn(*args, **kwargs)
+            g.db_replica = replica
+            try:
+                return fn(*args, **kwargs)
+            except OperationalError:
+                if g.get('db_replica') != replica:
+                    raise  # プライマリに切り替わった後のエラー
+                replica_router.mark_down(replica)
+                current_app.extensions['sqlalchemy'].session.rollback()
+                g.db_replica = None
+                return fn(*args, **kwargs)
+            finally:
+                g.db_replica = None
+        return wrapper
+    return decorator
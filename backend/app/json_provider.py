@@ -0,0 +1,85 @@
+"""
+JSONプロバイダー
+
+jsonify・request.get_json・キャッシュのシリアライズはすべて app.json を通る。
+orjson があれば使い（Cで実装、bytesを直接生成）、なければ標準の json を使う。
+どちらも datetime は ISO 8601 文字列で出力するため、シリアライザーは
+isoformat() を呼ばずに datetime をそのまま渡してよい。
+"""
+import datetime
+import decimal
+import uuid
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+try:
+    import orjson
+except ImportError:  # 任意の依存（なければ標準のjsonを使う）
+    orjson = None
+
+
+def _default(obj):
+    """両プロバイダー共通の追加型の変換"""
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """標準の json を使うプロバイダー（キーの並べ替え・ASCIIエスケープはしない）"""
+    default = staticmethod(_default)
+    ensure_ascii = False
+    sort_keys = False
+    
+    def dumps_bytes(self, obj):
+        """レスポンス本文用に bytes で返す"""
+        return self.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+class OrjsonProvider(JSONProvider):
+    """orjson を使うプロバイダー"""
+    mimetype = 'application/json'
+    sort_keys = False
+    compact = None
+    
+    def _options(self, indent=False):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+    
+    def dumps_bytes(self, obj, indent=False):
+        """レスポンス本文用に bytes で返す"""
+        return orjson.dumps(obj, default=_default, option=self._options(indent))
+    
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj, indent=bool(kwargs.get('indent'))).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(
+            self.dumps_bytes(obj, indent=indent) + b'\n',
+            mimetype=self.mimetype
+        )
+
+
+def init_json_provider(app):
+    """JSON_PROVIDER（auto / orjson / stdlib）に従ってプロバイダーを設定"""
+    name = app.config['JSON_PROVIDER']
+    if name == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_PROVIDER=orjson ですが orjson がインストールされていません')
+    if name in ('auto', 'orjson') and orjson is not None:
+        app.json = OrjsonProvider(app)
+    else:
+        app.json = StdlibJSONProvider(app)
@@ -0,0 +1,267 @@
+"""
+ログ設定
+
+リクエストスレッドではログをキューに積むだけにし、書き込み（JSON化・stdoutへの出力）は
+ワーカープロセスごとのバックグラウンドスレッド（QueueListener）で行う。
+stdout（パイプ・Dockerのログドライバー）が詰まってもリクエストの処理は待たされない。
+キューが溢れたら待たずに新しいログを捨て、捨てた件数を後で警告として出す。
+
+- 1行1JSON（LOG_FORMAT=text で人間向けの1行形式）。リクエスト中のログには request_id が付く
+- アクセスログ（app.access）に処理時間・ステータスを出す。request_id は X-Request-ID ヘッダーを引き継ぐ（なければ生成）
+- LOG_SAMPLE_RATES のロガーはERROR未満を確率的に間引く（残したログには sample_rate が付く）
+- パスワード・トークン・Stripeのキーなどはキー名とパターンで伏せる
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+from app.utils.client_ip import client_ip
+
+try:
+    import orjson
+except ImportError:  # 任意の依存（なければ標準のjsonを使う）
+    orjson = None
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# 引き継ぐ request_id（これ以外の形式なら生成し直す）
+REQUEST_ID_PATTERN = re.compile(r'[\w.-]{1,64}')
+REDACTED = '[REDACTED]'
+# このキー名（部分一致、大文字小文字無視）の値は伏せる
+SECRET_KEYS = re.compile(r'pass(word)?|secret|token|authorization|api_?key|cookie|card|cvc', re.IGNORECASE)
+# 文字列中に現れたら伏せるパターン
+SECRET_PATTERNS = (
+    re.compile(r'\b(?:sk|rk)_(?:live|test)_[0-9A-Za-z]+'),
+    re.compile(r'\bwhsec_[0-9A-Za-z]+'),
+    re.compile(r'\bpi_[0-9A-Za-z]+_secret_[0-9A-Za-z]+'),
+    re.compile(r'\beyJ[\w-]+\.[\w-]+\.[\w-]+'),  # JWT
+    re.compile(r'(?i)\bBearer\s+\S+'),
+)
+# LogRecord の標準属性（これ以外は extra として出力する）
+_STANDARD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+access_logger = logging.getLogger('app.access')
+
+
+def redact_text(text):
+    for pattern in SECRET_PATTERNS:
+        text = pattern.sub(REDACTED, text)
+    return text
+
+
+def redact(value, key=None):
+    """辞書・リストをたどって秘密の値を伏せる"""
+    if key is not None and SECRET_KEYS.search(key):
+        return REDACTED
+    if isinstance(value, dict):
+        return {k: redact(v, str(k)) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, str):
+        return redact_text(value)
+    return value
+
+
+def _dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, default=str).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, default=str)
+
+
+class JsonFormatter(logging.Formatter):
+    """1レコード = 1行のJSON（extra の項目もトップレベルに出す）"""
+    
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': redact_text(record.getMessage()),
+            'pid': record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                entry[key] = redact(value, key)
+        if record.exc_text:
+            entry['exc'] = redact_text(record.exc_text)
+        return _dumps(entry)
+
+
+class TextFormatter(logging.Formatter):
+    """開発用の1行形式（伏せ字は JSON と同じ）"""
+    
+    def __init__(self):
+        super().__init__('[%(asctime)s] %(levelname)s %(name)s: %(message)s')
+    
+    def format(self, record):
+        line = redact_text(super().format(record))
+        extra = {
+            key: redact(value, key) for key, value in vars(record).items()
+            if key not in _STANDARD_ATTRS and not key.startswith('_')
+        }
+        return f'{line} {_dumps(extra)}' if extra else line
+
+
+class ContextFilter(logging.Filter):
+    """
+    ログを出したスレッドで request_id などを付け、LOG_SAMPLE_RATES に従って間引く
+    
+    キューに積む前に呼ばれるため、間引いたログはJSON化もされない
+    """
+    
+    def __init__(self, sample_rates):
+        super().__init__()
+        self.sample_rates = sample_rates
+    
+    def _sample_rate(self, name):
+        # 最も長く一致するロガー名の設定（app.jwt なら app.jwt.xxx にも効く）
+        while name:
+            if name in self.sample_rates:
+                return self.sample_rates[name]
+            name = name.rpartition('.')[0]
+        return None
+    
+    def filter(self, record):
+        if record.levelno < logging.ERROR:
+            rate = self._sample_rate(record.name)
+            if rate is not None:
+                if random.random() >= rate:
+                    return False
+                record.sample_rate = rate
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.method = request.method
+            record.path = request.path
+        return True
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """
+    上限付きキューに積むハンドラー（溢れたら捨てる）
+    
+    書き込みスレッドはプロセスごとに起動する（preload_app のfork後は子で起動し直す）
+    """
+    
+    def __init__(self, handler, maxsize):
+        super().__init__(queue.Queue(maxsize))
+        self.target = handler
+        self.dropped = 0
+        self._listener = None
+        self._listener_pid = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.stop)
+    
+    def _ensure_listener(self):
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+        with self._start_lock:
+            if self._listener_pid != pid:
+                if self._listener_pid is not None:
+                    # 親プロセスのキューに残った分は親が書くので、子は空のキューで始める
+                    self.queue = queue.Queue(self.queue.maxsize)
+                    self.dropped = 0
+                self._listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+                self._listener.start()
+                self._listener_pid = pid
+    
+    def prepare(self, record):
+        # 引数・例外はこのスレッドで文字列にしておく（後で値が変わっても出力が変わらないように）。
+        # JSON化・伏せ字の処理は書き込みスレッドで行う
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+    
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                    'msg': f'ログのキューが溢れたため{dropped}件を破棄しました',
+                }))
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+    
+    def stop(self):
+        """キューに残ったログを書き出して書き込みスレッドを止める"""
+        if self._listener is not None and self._listener_pid == os.getpid():
+            self._listener.stop()
+            self._listener_pid = None
+
+
+def parse_sample_rates(raw):
+    """'app.access=0.1,app.jwt=0.01' → {ロガー名: 残す割合}"""
+    rates = {}
+    for part in filter(None, (p.strip() for p in raw.split(','))):
+        name, _, rate = part.partition('=')
+        rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+def _build_handler(config):
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(TextFormatter() if config['LOG_FORMAT'] == 'text' else JsonFormatter())
+    handler = BackgroundQueueHandler(stream, config['LOG_QUEUE_SIZE']) if config['LOG_ASYNC'] else stream
+    handler.addFilter(ContextFilter(parse_sample_rates(config['LOG_SAMPLE_RATES'])))
+    return handler
+
+
+def _before_request():
+    request_id = request.headers.get(REQUEST_ID_HEADER, '')
+    g.request_id = request_id if REQUEST_ID_PATTERN.fullmatch(request_id) else uuid.uuid4().hex
+    g.request_started = time.perf_counter()
+
+
+def _after_request(response):
+    if 'request_id' not in g:
+        return response
+    response.headers[REQUEST_ID_HEADER] = g.request_id
+    duration_ms = round((time.perf_counter() - g.request_started) * 1000, 2)
+    # 5xx は必ず出す（間引かない）
+    level = logging.ERROR if response.status_code >= 500 else logging.INFO
+    if access_logger.isEnabledFor(level):
+        access_logger.log(level, '%s %s %s', request.method, request.path, response.status_code, extra={
+            'status': response.status_code,
+            'duration_ms': duration_ms,
+            'endpoint': request.endpoint,
+            'remote_addr': client_ip(),
+        })
+    return response
+
+
+def init_logging(app):
+    """
+    ルートロガーにハンドラーを1つだけ設定（create_app() の最初に呼ぶ）
+    
+    Flask・ライブラリのログもルートロガー経由で同じ形式になる
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, BackgroundQueueHandler):
+            handler.stop()
+        root.removeHandler(handler)
+    root.addHandler(_build_handler(app.config))
+    root.setLevel(app.config['LOG_LEVEL'])
+    app.logger.removeHandler(default_handler)
+    access_logger.disabled = not app.config['LOG_ACCESS']
+    
+    # 他のフックより先に登録する（before_request が途中で応答を返しても request_id を付ける）
+    app.before_request(_before_request)
+    app.after_request(_after_request)
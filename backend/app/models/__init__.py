@@ -1,11 +1,17 @@
 from flask_sqlalchemy import SQLAlchemy
+from app.db_routing import RoutingSession
 
-db = SQLAlchemy()
+# 読み取りレプリカへの振り分けは RoutingSession で行う（app/db_routing.py）
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 from app.models.user import User
 from app.models.product import Product
 from app.models.order import Order, OrderItem
+from app.models.stripe_event import StripeEvent
+from app.models.idempotency_key import IdempotencyKey
+from app.models.sales_rollup import DailySales, DailyProductSales, DailyCategorySales
 
-__all__ = ['db', 'User', 'Product', 'Order', 'OrderItem']
+__all__ = ['db', 'User', 'Product', 'Order', 'OrderItem', 'StripeEvent', 'IdempotencyKey',
+           'DailySales', 'DailyProductSales', 'DailyCategorySales']
 
 
@@ -0,0 +1,21 @@
+from datetime import datetime
+from app.models import db
+
+class IdempotencyKey(db.Model):
+    """Idempotency-Keyモデル（リクエストの指紋と、完了したレスポンスを保存）"""
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'scope', 'key', name='uq_idempotency_keys_user_scope_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    scope = db.Column(db.String(100), nullable=False)  # エンドポイント識別子
+    key = db.Column(db.String(255), nullable=False)
+    request_fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress, completed
+    response_status = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    response_mimetype = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    completed_at = db.Column(db.DateTime)
@@ -4,30 +4,47 @@ from app.models import db
 class Order(db.Model):
     """注文モデル"""
     __tablename__ = 'orders'
+    __table_args__ = (
+        # 注文履歴のキーセットページネーション (user_id, created_at DESC, id DESC) 用
+        db.Index('ix_orders_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     total = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(50), default='pending')  # pending, paid, shipped, delivered, cancelled
-    stripe_payment_intent_id = db.Column(db.String(255))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    stripe_payment_intent_id = db.Column(db.String(255), index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # 売上集計のバックフィル用
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # リレーション
     items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
     
-    def to_dict(self):
-        """辞書形式に変換"""
-        return {
+    # APIのフィールド名 → カラム属性名（カラムタプルでの一覧で使用）
+    API_FIELDS = {
+        'id': 'id',
+        'userId': 'user_id',
+        'total': 'total',
+        'status': 'status',
+        'stripePaymentIntentId': 'stripe_payment_intent_id',
+        'createdAt': 'created_at',
+        'updatedAt': 'updated_at',
+    }
+    
+    def to_dict(self, include_items=True):
+        """辞書形式に変換（include_items=Falseなら明細を含めない）"""
+        result = {
             'id': self.id,
             'userId': self.user_id,
             'total': self.total,
             'status': self.status,
             'stripePaymentIntentId': self.stripe_payment_intent_id,
-            'items': [item.to_dict() for item in self.items],
             'createdAt': self.created_at.isoformat() if self.created_at else None,
             'updatedAt': self.updated_at.isoformat() if self.updated_at else None
         }
+        if include_items:
+            result['items'] = [item.to_dict() for item in self.items]
+        return result
 
 
 class OrderItem(db.Model):
@@ -35,15 +52,26 @@ class OrderItem(db.Model):
     __tablename__ = 'order_items'
     
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     product_name = db.Column(db.String(200), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
+    category = db.Column(db.String(100))  # 注文時点の商品カテゴリ（キャンセル時に同じ売上集計から差し引く）
     
     # リレーション
     product = db.relationship('Product', backref='order_items')
     
+    # APIのフィールド名 → カラム属性名（カラムタプルでの一覧で使用）
+    API_FIELDS = {
+        'id': 'id',
+        'orderId': 'order_id',
+        'productId': 'product_id',
+        'productName': 'product_name',
+        'quantity': 'quantity',
+        'price': 'price',
+    }
+    
     def to_dict(self):
         """辞書形式に変換"""
         return {
@@ -4,16 +4,33 @@ from app.models import db
 class Product(db.Model):
     """商品モデル"""
     __tablename__ = 'products'
+    __table_args__ = (
+        # 一覧のキーセットページネーション (created_at DESC, id DESC) 用
+        db.Index('ix_products_created_at_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
-    price = db.Column(db.Float, nullable=False)
+    price = db.Column(db.Float, nullable=False, index=True)
     description = db.Column(db.Text)
-    image_url = db.Column(db.Text)  # Base64画像を保存
+    image_url = db.Column(db.Text)  # 画像URL（アップロード画像は /api/images/<hash>.<ext>）
     stock = db.Column(db.Integer, default=0)
-    category = db.Column(db.String(100))
+    category = db.Column(db.String(100), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    # APIのフィールド名 → カラム属性名（fields= による射影・カラムタプルでの一覧で使用）
+    API_FIELDS = {
+        'id': 'id',
+        'name': 'name',
+        'price': 'price',
+        'description': 'description',
+        'imageUrl': 'image_url',
+        'stock': 'stock',
+        'category': 'category',
+        'createdAt': 'created_at',
+        'updatedAt': 'updated_at',
+    }
     
     def to_dict(self):
         """辞書形式に変換"""
@@ -28,5 +45,3 @@ class Product(db.Model):
             'createdAt': self.created_at.isoformat() if self.created_at else None,
             'updatedAt': self.updated_at.isoformat() if self.updated_at else None
         }
-
-
@@ -0,0 +1,32 @@
+from app.models import db
+
+class DailySales(db.Model):
+    """日別の売上集計（注文作成・キャンセルと同じトランザクションで更新）"""
+    __tablename__ = 'daily_sales'
+    
+    day = db.Column(db.Date, primary_key=True)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class DailyProductSales(db.Model):
+    """商品×日別の売上集計（商品削除後も残すため外部キーは張らない）"""
+    __tablename__ = 'daily_product_sales'
+    
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True, index=True)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class DailyCategorySales(db.Model):
+    """カテゴリ×日別の売上集計（カテゴリは注文時点の order_items.category。未記録の古い明細だけ現在の商品のもの）"""
+    __tablename__ = 'daily_category_sales'
+    
+    day = db.Column(db.Date, primary_key=True)
+    category = db.Column(db.String(100), primary_key=True)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,30 @@
+from datetime import datetime
+from app.models import db
+
+class StripeEvent(db.Model):
+    """Stripe Webhookイベントモデル（イベントIDで重複排除し、処理キューとしても使う）"""
+    __tablename__ = 'stripe_events'
+    
+    id = db.Column(db.String(255), primary_key=True)  # Stripeのイベントid (evt_...)
+    type = db.Column(db.String(100), nullable=False)
+    payment_intent_id = db.Column(db.String(255), index=True)
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)  # pending, processing, processed, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)
+    processed_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        """辞書形式に変換"""
+        return {
+            'id': self.id,
+            'type': self.type,
+            'paymentIntentId': self.payment_intent_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'lastError': self.last_error,
+            'createdAt': self.created_at.isoformat() if self.created_at else None,
+            'processedAt': self.processed_at.isoformat() if self.processed_at else None
+        }
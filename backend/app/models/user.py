@@ -1,6 +1,6 @@
 from datetime import datetime
 from app.models import db
-import bcrypt
+from app.services.password_hasher import password_hasher
 
 class User(db.Model):
     """ユーザーモデル"""
@@ -11,24 +11,24 @@ class User(db.Model):
     password_hash = db.Column(db.String(255), nullable=False)
     display_name = db.Column(db.String(100))
     is_admin = db.Column(db.Boolean, default=False)
+    # 増やすと発行済みのJWTがすべて無効になる（降格・強制ログアウト用）
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # リレーション
     orders = db.relationship('Order', backref='user', lazy=True)
     
     def set_password(self, password):
-        """パスワードをハッシュ化して保存"""
-        self.password_hash = bcrypt.hashpw(
-            password.encode('utf-8'),
-            bcrypt.gensalt()
-        ).decode('utf-8')
+        """パスワードをハッシュ化して保存（bcryptはハッシュ用スレッドプールで実行）"""
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
         """パスワード検証"""
-        return bcrypt.checkpw(
-            password.encode('utf-8'),
-            self.password_hash.encode('utf-8')
-        )
+        return password_hasher.verify(password, self.password_hash)
+    
+    def password_needs_rehash(self):
+        """保存済みハッシュの work factor が現在の設定と異なるか"""
+        return password_hasher.needs_rehash(self.password_hash)
     
     def to_dict(self):
         """辞書形式に変換"""
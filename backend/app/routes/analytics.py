@@ -0,0 +1,218 @@
+"""売上分析API（管理者のみ。売上集計テーブルだけを読む）"""
+from datetime import date, datetime, timedelta
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required
+from sqlalchemy import func, select
+from app.models import db, Product, DailySales, DailyProductSales, DailyCategorySales
+from app.routes.products import require_admin
+from app.services.sales_rollup import sales_day
+from app.utils.pagination import parse_limit
+
+analytics_bp = Blueprint('analytics', __name__)
+
+SORT_KEYS = ('revenue', 'units', 'orders')
+
+
+def _parse_range(args):
+    """
+    from / to（YYYY-MM-DD、両端を含む）を解釈
+    
+    未指定なら今日（集計日）までの ANALYTICS_DEFAULT_DAYS 日間
+    """
+    config = current_app.config
+    try:
+        end = date.fromisoformat(args['to']) if args.get('to') else sales_day(datetime.utcnow())
+        start = (
+            date.fromisoformat(args['from']) if args.get('from')
+            else end - timedelta(days=config['ANALYTICS_DEFAULT_DAYS'] - 1)
+        )
+    except ValueError:
+        raise ValueError('日付は YYYY-MM-DD 形式で指定してください')
+    if start > end:
+        raise ValueError('from は to 以前の日付を指定してください')
+    if (end - start).days + 1 > config['ANALYTICS_MAX_DAYS']:
+        raise ValueError(f'期間は{config["ANALYTICS_MAX_DAYS"]}日以内で指定してください')
+    return start, end
+
+
+def _parse_sort(raw):
+    sort = raw or 'revenue'
+    if sort not in SORT_KEYS:
+        raise ValueError(f'sort は {" / ".join(SORT_KEYS)} のいずれかを指定してください')
+    return sort
+
+
+def _totals(model):
+    """集計列の合計（SELECT用）"""
+    return (
+        func.sum(model.units).label('units'),
+        func.sum(model.revenue).label('revenue'),
+        func.sum(model.order_count).label('orders'),
+    )
+
+
+def _range_dict(start, end):
+    return {'from': start.isoformat(), 'to': end.isoformat()}
+
+
+def _row_totals(row):
+    return {'units': row.units or 0, 'revenue': row.revenue or 0, 'orders': row.orders or 0}
+
+
+@analytics_bp.route('/daily', methods=['GET'])
+@jwt_required()
+def get_daily_sales():
+    """
+    日別の売上推移と期間合計
+    
+    クエリパラメータ:
+    - from, to: 集計日（YYYY-MM-DD、両端を含む）。未指定なら直近 ANALYTICS_DEFAULT_DAYS 日
+    売上のない日は0件として返す
+    """
+    error_response = require_admin()
+    if error_response:
+        return error_response
+    
+    try:
+        start, end = _parse_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    rows = db.session.execute(
+        select(DailySales.day, DailySales.units, DailySales.revenue, DailySales.order_count)
+        .where(DailySales.day >= start, DailySales.day <= end)
+    ).all()
+    by_day = {row.day: row for row in rows}
+    
+    days = []
+    totals = {'units': 0, 'revenue': 0, 'orders': 0}
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        row = by_day.get(day)
+        entry = {
+            'date': day.isoformat(),
+            'units': row.units if row else 0,
+            'revenue': row.revenue if row else 0,
+            'orders': row.order_count if row else 0,
+        }
+        days.append(entry)
+        for key in totals:
+            totals[key] += entry[key]
+    
+    return jsonify({**_range_dict(start, end), 'totals': totals, 'days': days}), 200
+
+
+@analytics_bp.route('/products', methods=['GET'])
+@jwt_required()
+def get_product_sales():
+    """
+    期間内の商品別売上ランキング
+    
+    クエリパラメータ:
+    - from, to: 集計日（日別と同じ）
+    - sort: revenue（デフォルト）/ units / orders
+    - limit: 件数（デフォルト20、最大 PRODUCTS_MAX_PAGE_SIZE）
+    """
+    error_response = require_admin()
+    if error_response:
+        return error_response
+    
+    try:
+        start, end = _parse_range(request.args)
+        sort = _parse_sort(request.args.get('sort'))
+        limit = parse_limit(
+            request.args.get('limit'),
+            default=20,
+            maximum=current_app.config['PRODUCTS_MAX_PAGE_SIZE']
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    ranked = (
+        select(DailyProductSales.product_id, *_totals(DailyProductSales))
+        .where(DailyProductSales.day >= start, DailyProductSales.day <= end)
+        .group_by(DailyProductSales.product_id)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(ranked, Product.name, Product.category)
+        .outerjoin(Product, Product.id == ranked.c.product_id)
+        .order_by(ranked.c[sort].desc(), ranked.c.product_id)
+        .limit(limit)
+    ).all()
+    
+    products = [
+        {
+            'productId': row.product_id,
+            # 削除済みの商品は名前・カテゴリなし
+            'productName': row.name,
+            'category': row.category,
+            **_row_totals(row),
+        }
+        for row in rows
+    ]
+    return jsonify({**_range_dict(start, end), 'sort': sort, 'products': products}), 200
+
+
+@analytics_bp.route('/products/<int:product_id>', methods=['GET'])
+@jwt_required()
+def get_product_daily_sales(product_id):
+    """商品1件の日別売上（from, to は日別と同じ。売上のない日は含めない）"""
+    error_response = require_admin()
+    if error_response:
+        return error_response
+    
+    try:
+        start, end = _parse_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    rows = db.session.execute(
+        select(DailyProductSales.day, DailyProductSales.units, DailyProductSales.revenue,
+               DailyProductSales.order_count)
+        .where(
+            DailyProductSales.product_id == product_id,
+            DailyProductSales.day >= start,
+            DailyProductSales.day <= end
+        )
+        .order_by(DailyProductSales.day)
+    ).all()
+    
+    days = [
+        {'date': row.day.isoformat(), 'units': row.units, 'revenue': row.revenue, 'orders': row.order_count}
+        for row in rows
+    ]
+    return jsonify({**_range_dict(start, end), 'productId': product_id, 'days': days}), 200
+
+
+@analytics_bp.route('/categories', methods=['GET'])
+@jwt_required()
+def get_category_sales():
+    """
+    期間内のカテゴリ別売上
+    
+    クエリパラメータ:
+    - from, to: 集計日（日別と同じ）
+    - sort: revenue（デフォルト）/ units / orders
+    """
+    error_response = require_admin()
+    if error_response:
+        return error_response
+    
+    try:
+        start, end = _parse_range(request.args)
+        sort = _parse_sort(request.args.get('sort'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    totals = _totals(DailyCategorySales)
+    order_column = {'units': totals[0], 'revenue': totals[1], 'orders': totals[2]}[sort]
+    rows = db.session.execute(
+        select(DailyCategorySales.category, *totals)
+        .where(DailyCategorySales.day >= start, DailyCategorySales.day <= end)
+        .group_by(DailyCategorySales.category)
+        .order_by(order_column.desc(), DailyCategorySales.category)
+    ).all()
+    
+    categories = [{'category': row.category, **_row_totals(row)} for row in rows]
+    return jsonify({**_range_dict(start, end), 'sort': sort, 'categories': categories}), 200
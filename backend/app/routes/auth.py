@@ -1,11 +1,41 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from app.db_routing import read_replica
 from app.models import db, User
+from app.services.password_hasher import HasherBusy
+from app.services.rate_limit import rate_limit, BY_EMAIL, ON_AUTH_FAILURE
+from app.services.user_cache import user_cache
 from config import Config
 
 auth_bp = Blueprint('auth', __name__)
 
+
+def issue_token(user):
+    """
+    JWTトークン発行（identityは文字列にする）
+    
+    権限と表示名をクレームに含め、管理者チェックのたびにDBを引かないようにする。
+    tv（トークンバージョン）が現在値と一致しないトークンは無効として扱われる
+    """
+    return create_access_token(
+        identity=str(user.id),
+        additional_claims={
+            'is_admin': bool(user.is_admin),
+            'display_name': user.display_name,
+            'tv': user.token_version or 0
+        }
+    )
+
+
+@auth_bp.errorhandler(HasherBusy)
+def handle_hasher_busy(error):
+    """ハッシュ計算の待ち行列が溢れた場合は早めに503を返す"""
+    response = jsonify({'error': 'アクセスが集中しています。しばらくしてから再度お試しください'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 @auth_bp.route('/register', methods=['POST'])
+@rate_limit('register')
 def register():
     """新規ユーザー登録"""
     data = request.get_json()
@@ -40,8 +70,8 @@ def register():
     db.session.add(user)
     db.session.commit()
     
-    # JWTトークン発行（identityは文字列にする）
-    access_token = create_access_token(identity=str(user.id))
+    # JWTトークン発行
+    access_token = issue_token(user)
     
     return jsonify({
         'token': access_token,
@@ -50,6 +80,7 @@ def register():
 
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limit('login', per_user_key=BY_EMAIL, charge_user_if=ON_AUTH_FAILURE)
 def login():
     """ログイン"""
     data = request.get_json()
@@ -68,8 +99,13 @@ def login():
     if not user or not user.check_password(password):
         return jsonify({'error': 'メールアドレスまたはパスワードが間違っています'}), 401
     
-    # JWTトークン発行（identityは文字列にする）
-    access_token = create_access_token(identity=str(user.id))
+    # work factor の設定が変わっていれば、平文が手元にあるこのタイミングで再ハッシュ
+    if user.password_needs_rehash():
+        user.set_password(password)
+        db.session.commit()
+    
+    # JWTトークン発行
+    access_token = issue_token(user)
     
     return jsonify({
         'token': access_token,
@@ -79,14 +115,16 @@ def login():
 
 @auth_bp.route('/me', methods=['GET'])
 @jwt_required()
+@read_replica()
 def get_current_user():
     """現在のユーザー情報取得"""
     user_id = get_jwt_identity()
-    user = User.query.get(int(user_id))  # 文字列を整数に変換
+    record = user_cache.get(int(user_id))  # 文字列を整数に変換
     
-    if not user:
+    if not record:
         return jsonify({'error': 'ユーザーが見つかりません'}), 404
     
-    return jsonify(user.to_dict()), 200
+    user = {k: v for k, v in record.items() if k != 'tokenVersion'}
+    return jsonify(user), 200
 
 
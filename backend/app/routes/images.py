@@ -0,0 +1,28 @@
+"""商品画像配信API"""
+from flask import Blueprint, jsonify, send_file
+from app.services.image_store import resolve_image_name
+
+images_bp = Blueprint('images', __name__)
+
+# 内容ハッシュがURLに含まれるため、同じURLの内容は変わらない
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+
+@images_bp.route('/<string:name>', methods=['GET'])
+def get_image(name):
+    """画像取得（ファイルをストリーミングで返す）"""
+    resolved = resolve_image_name(name)
+    if not resolved:
+        return jsonify({'error': '画像が見つかりません'}), 404
+    
+    path, mime, digest = resolved
+    response = send_file(
+        path,
+        mimetype=mime,
+        etag=digest,
+        max_age=IMMUTABLE_MAX_AGE,
+        conditional=True
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,51 @@
+"""監視用API"""
+import hmac
+from flask import Blueprint, Response, current_app, jsonify, request
+from flask_jwt_extended import jwt_required
+from app.db_engine import pool_metrics
+from app.db_routing import replica_router
+from app.models import db
+from app.routes.products import require_admin
+from app.services.request_metrics import request_metrics
+
+monitoring_bp = Blueprint('monitoring', __name__)
+# Prometheus のスクレイプ用（/api の外。nginx は /api/ だけをバックエンドに流すため外部からは届かない）
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@monitoring_bp.route('/db-pool', methods=['GET'])
+@jwt_required()
+def get_db_pool_stats():
+    """DB接続プールの状態と取得待ち時間・レプリカの遅延（管理者のみ、応答したワーカー分）"""
+    error_response = require_admin()
+    if error_response:
+        return error_response
+    
+    stats = pool_metrics.snapshot()
+    stats['pool'] = db.engine.pool.status()
+    if replica_router.keys:
+        stats['replicas'] = replica_router.status()
+        for key, replica in stats['replicas'].items():
+            replica['pool'] = db.engines[key].pool.status()
+    return jsonify(stats), 200
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    リクエスト計測（全ワーカー合計）を Prometheus のテキスト形式で返す
+    
+    METRICS_TOKEN を設定した場合は Authorization: Bearer <METRICS_TOKEN> が必要
+    """
+    if not request_metrics.enabled:
+        return jsonify({'error': 'メトリクスは無効です'}), 404
+    
+    token = current_app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return Response(
+        request_metrics.store(current_app).render(),
+        mimetype='text/plain; version=0.0.4',
+        headers={'Cache-Control': 'no-store'}
+    )
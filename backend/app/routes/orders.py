@@ -1,12 +1,51 @@
+import math
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import db, Order, OrderItem, Product
-import stripe
+from sqlalchemy import and_, insert, or_, select
+from sqlalchemy.orm import selectinload
+from app.db_routing import read_replica
+from app.models import db, Order, OrderItem
+from app.services.catalog_cache import catalog_cache
+from app.services.idempotency import idempotent, store_response
+from app.services.sales_rollup import product_categories, record_order
+from app.services.inventory import (
+    merge_quantities, reserve_stock, ProductNotFound, InsufficientStock
+)
+from app.services.stripe_events import event_consumer
+from app.services.stripe_gateway import stripe_gateway, PaymentGatewayError
+from app.utils.conditional import collection_validators, row_validators
+from app.utils.pagination import encode_cursor, decode_cursor, parse_limit
+from app.utils.serialization import api_columns, rows_to_dicts
 
 orders_bp = Blueprint('orders', __name__)
 
+# 注文はユーザー固有のため共有キャッシュには保存させない
+PRIVATE_CACHE_CONTROL = 'private, no-cache'
+
+def _parse_items(items):
+    """注文明細を検証して型をそろえる（不正なら ValueError / TypeError / KeyError）"""
+    if not isinstance(items, list):
+        raise TypeError('明細はリストである必要があります')
+    parsed = []
+    for item in items:
+        name = item['productName']
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError('商品名が必要です')
+        price = float(item['price'])
+        if not math.isfinite(price) or price < 0:
+            raise ValueError('価格が不正です')
+        parsed.append({
+            'productId': int(item['productId']),
+            'productName': name,
+            'quantity': int(item['quantity']),
+            'price': price,
+        })
+    return parsed
+
+
 @orders_bp.route('', methods=['POST'])
 @jwt_required()
+@idempotent('orders.create')
 def create_order():
     """
     注文作成
@@ -16,6 +55,11 @@ def create_order():
     2. Stripe APIで決済が本当に成功したか検証（セキュリティ）
     3. 検証成功したら注文をDBに保存
     4. 在庫を減算
+    
+    STRIPE_ORDER_FINALIZATION=webhook の場合、2はStripeへ問い合わせず、
+    未確認の注文はpendingで作成してWebhook（payment_intent.succeeded）で確定する
+    
+    Idempotency-Keyヘッダー付きの再送には、最初のレスポンスをそのまま返す
     """
     user_id = int(get_jwt_identity())
     data = request.get_json()
@@ -24,86 +68,196 @@ def create_order():
     if not data or not data.get('items') or not data.get('total'):
         return jsonify({'error': '注文データが不正です'}), 400
     
+    # 明細は在庫を引き当てる前にまとめて検証する（引当後に不正が見つかって500にならないように）
+    try:
+        items = _parse_items(data['items'])
+        quantities = merge_quantities(items)
+        total = float(data['total'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': '注文データが不正です'}), 400
+    
     payment_intent_id = data.get('stripePaymentIntentId')
     
     # Stripe決済の検証（重要なセキュリティチェック）
+    status = 'paid'
     if payment_intent_id:
         try:
-            stripe.api_key = current_app.config['STRIPE_SECRET_KEY']
-            payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+            if current_app.config['STRIPE_ORDER_FINALIZATION'] == 'webhook':
+                # Webhookモード: Stripeへは問い合わせない。未確認なら保留（pending）で作成し、
+                # payment_intent.succeeded イベントの処理時に確定する
+                payment_intent = stripe_gateway.cached_intent(payment_intent_id)
+                if payment_intent is None:
+                    status = 'pending'
+            else:
+                # /verify-payment で検証済みならキャッシュから返り、Stripeへの再問い合わせは発生しない
+                payment_intent = stripe_gateway.verify_payment_intent(payment_intent_id)
             
-            # 決済が成功しているか確認
-            if payment_intent.status != 'succeeded':
-                return jsonify({'error': '決済が完了していません'}), 400
-            
-            # 金額が一致するか確認（改ざん防止）
-            if payment_intent.amount != int(data['total']):
-                return jsonify({'error': '決済金額が一致しません'}), 400
+            if payment_intent is not None:
+                # 決済が成功しているか確認
+                if not payment_intent.succeeded:
+                    return jsonify({'error': '決済が完了していません'}), 400
+                
+                # 金額が一致するか確認（改ざん防止。モック決済は金額を持たない）
+                if payment_intent.amount is not None and payment_intent.amount != int(total):
+                    return jsonify({'error': '決済金額が一致しません'}), 400
                 
-        except stripe.error.StripeError as e:
+        except PaymentGatewayError as e:
             return jsonify({'error': f'決済の検証に失敗しました: {str(e)}'}), 400
     
+    # 在庫引当（1クエリで取得・1本の条件付きUPDATEで減算）
+    try:
+        reserve_stock(quantities)
+    except ProductNotFound as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 404
+    except InsufficientStock as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    
     # 注文作成
     order = Order(
         user_id=user_id,
-        total=data['total'],
-        status='paid',
+        total=total,
+        status=status,
         stripe_payment_intent_id=payment_intent_id
     )
     db.session.add(order)
     db.session.flush()  # IDを取得するためflush
     
-    # 注文明細作成と在庫減算
-    for item_data in data['items']:
-        # 商品取得
-        product = Product.query.get(item_data['productId'])
-        if not product:
-            db.session.rollback()
-            return jsonify({'error': f'商品ID {item_data["productId"]} が見つかりません'}), 404
-        
-        # 在庫チェック
-        if product.stock < item_data['quantity']:
-            db.session.rollback()
-            return jsonify({'error': f'{product.name} の在庫が不足しています'}), 400
-        
-        # 在庫減算
-        product.stock -= item_data['quantity']
-        
-        # 注文明細作成
-        order_item = OrderItem(
-            order_id=order.id,
-            product_id=item_data['productId'],
-            product_name=item_data['productName'],
-            quantity=item_data['quantity'],
-            price=item_data['price']
-        )
-        db.session.add(order_item)
+    # 注文明細を一括INSERT（売上集計用に注文時点のカテゴリも記録）
+    categories = product_categories(quantities)
+    db.session.execute(insert(OrderItem), [
+        {
+            'order_id': order.id,
+            'product_id': item_data['productId'],
+            'product_name': item_data['productName'],
+            'quantity': item_data['quantity'],
+            'price': item_data['price'],
+            'category': categories.get(item_data['productId'])
+        }
+        for item_data in items
+    ])
     
+    # 売上集計も同じトランザクションで加算
+    record_order(order.created_at, [
+        (item_data['productId'], item_data['quantity'], item_data['price'], categories.get(item_data['productId']))
+        for item_data in items
+    ])
+    
+    # Idempotency-Keyの完了も同じトランザクションで保存（コミット後に落ちても、再送で二重に注文しない）
+    response = store_response((jsonify(order.to_dict()), 201))
     db.session.commit()
+    # 在庫が変わったのでカタログキャッシュを無効化
+    catalog_cache.invalidate(stock_only=True)
+    
+    if status == 'pending':
+        # 決済イベントが先に処理済みの場合に備えて、イベント処理スレッドに照合させる
+        event_consumer.notify()
     
-    return jsonify(order.to_dict()), 201
+    return response
 
 
 @orders_bp.route('', methods=['GET'])
 @jwt_required()
+@read_replica()
 def get_orders():
-    """自分の注文一覧取得"""
+    """
+    自分の注文一覧取得
+    
+    クエリパラメータ:
+    - summary=true: 明細を含まない注文ヘッダーのみ返す（注文一覧ページ用）
+    - limit, cursor: キーセットページネーション（次ページのカーソルは X-Next-Cursor ヘッダー）。
+      limit 未指定なら ORDERS_DEFAULT_PAGE_SIZE 件（全件は返さない）
+    """
     user_id = int(get_jwt_identity())
-    orders = Order.query.filter_by(user_id=user_id).order_by(Order.created_at.desc()).all()
+    summary = request.args.get('summary', '').lower() in ('1', 'true', 'yes')
+    try:
+        limit = parse_limit(
+            request.args.get('limit'),
+            default=current_app.config['ORDERS_DEFAULT_PAGE_SIZE'],
+            maximum=current_app.config['ORDERS_MAX_PAGE_SIZE']
+        )
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    query = Order.query.filter_by(user_id=user_id)
+    
+    # 条件付きGET: 集約クエリだけで変更有無を判定し、未変更なら304
+    validators = collection_validators(query, Order.updated_at, f'orders-{user_id}')
+    if validators.matches():
+        return validators.not_modified(PRIVATE_CACHE_CONTROL)
+    
+    if after:
+        created_at, last_id = after
+        query = query.filter(or_(
+            Order.created_at < created_at,
+            and_(Order.created_at == created_at, Order.id < last_id)
+        ))
+    
+    # (user_id, created_at, id) の複合インデックスを逆順に走査
+    query = query.order_by(Order.created_at.desc(), Order.id.desc())
     
-    return jsonify([o.to_dict() for o in orders]), 200
+    # 一覧は読み取り専用のため、ORMオブジェクトを作らずカラムのタプルで取得
+    # （カーソル生成用の created_at, id は末尾に追加）
+    keys, columns = api_columns(Order, extra=(Order.created_at, Order.id))
+    query = query.with_entities(*columns)
+    
+    # 次ページの有無を判定するため1件多く取得
+    rows = query.limit(limit + 1).all()
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    
+    orders = rows_to_dicts(keys, rows)
+    if not summary:
+        items = _items_by_order([order['id'] for order in orders])
+        for order in orders:
+            order['items'] = items.get(order['id'], [])
+    
+    response = jsonify(orders)
+    if has_next:
+        created_at, last_id = rows[-1][-2:]
+        response.headers['X-Next-Cursor'] = encode_cursor(created_at, last_id)
+    return validators.apply(response, PRIVATE_CACHE_CONTROL), 200
+
+
+def _items_by_order(order_ids):
+    """明細を1回の SELECT ... IN でまとめて取得し、注文IDごとの辞書リストにする"""
+    if not order_ids:
+        return {}
+    keys, columns = api_columns(OrderItem)
+    rows = db.session.execute(
+        select(*columns)
+        .where(OrderItem.order_id.in_(order_ids))
+        .order_by(OrderItem.id)
+    ).all()
+    items = {}
+    for item in rows_to_dicts(keys, rows):
+        items.setdefault(item['orderId'], []).append(item)
+    return items
 
 
 @orders_bp.route('/<int:order_id>', methods=['GET'])
 @jwt_required()
+@read_replica()
 def get_order(order_id):
     """注文詳細取得"""
     user_id = int(get_jwt_identity())
-    order = Order.query.filter_by(id=order_id, user_id=user_id).first()
+    order = (
+        Order.query
+        .options(selectinload(Order.items))
+        .filter_by(id=order_id, user_id=user_id)
+        .first()
+    )
     
     if not order:
         return jsonify({'error': '注文が見つかりません'}), 404
     
-    return jsonify(order.to_dict()), 200
+    validators = row_validators(order.id, order.updated_at, 'order')
+    if validators.matches():
+        return validators.not_modified(PRIVATE_CACHE_CONTROL)
+    
+    return validators.apply(jsonify(order.to_dict()), PRIVATE_CACHE_CONTROL), 200
 
 
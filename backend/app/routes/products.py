@@ -1,34 +1,269 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import db, Product, User
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
+from sqlalchemy import and_, or_, select
+from app.db_routing import CATALOG, read_replica
+from app.models import db, Product
+from app.services.catalog_cache import catalog_cache, CachedResponse
+from app.services.image_store import store_data_url
+from app.services.product_bulk import CONTENT_TYPES, detect_format, export_products, import_products
+from app.services.search_index import search_index
+from app.services.user_cache import user_cache
+from app.utils.conditional import collection_validators, row_validators
+from app.utils.pagination import encode_cursor, decode_cursor, parse_limit
+from app.utils.serialization import api_columns, rows_to_dicts
 from datetime import datetime
 
 products_bp = Blueprint('products', __name__)
 
+# 存在しない商品もキャッシュするための番兵
+NOT_FOUND = object()
+
 def require_admin():
-    """管理者権限チェック"""
-    user_id = int(get_jwt_identity())
-    user = User.query.get(user_id)
-    if not user or not user.is_admin:
+    """
+    管理者権限チェック
+    
+    JWTの is_admin クレームで判定する（トークンバージョンはJWT検証時に確認済み）。
+    クレームを持たない旧トークンのみユーザーキャッシュを参照する
+    """
+    is_admin = get_jwt().get('is_admin')
+    if is_admin is None:
+        record = user_cache.get(int(get_jwt_identity()))
+        is_admin = bool(record and record['is_admin'])
+    if not is_admin:
         return jsonify({'error': '管理者権限が必要です'}), 403
     return None
 
 
+def _parse_fields(raw):
+    """fields= パラメータを解釈（未指定ならNone = 全フィールド）"""
+    if not raw:
+        return None
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in Product.API_FIELDS]
+    if unknown:
+        raise ValueError(f'不明なフィールドです: {", ".join(unknown)}')
+    return fields
+
+
+def _parse_bool(raw):
+    return raw is not None and raw.lower() in ('1', 'true', 'yes')
+
+
+def _apply_product_filters(query, args):
+    """category / 価格帯 / 在庫ありフィルタをSQLに反映"""
+    category = args.get('category')
+    if category:
+        query = query.filter(Product.category == category)
+    min_price = args.get('minPrice', type=float)
+    if min_price is not None:
+        query = query.filter(Product.price >= min_price)
+    max_price = args.get('maxPrice', type=float)
+    if max_price is not None:
+        query = query.filter(Product.price <= max_price)
+    if _parse_bool(args.get('inStock')):
+        query = query.filter(Product.stock > 0)
+    return query
+
+
 @products_bp.route('', methods=['GET'])
+@read_replica(CATALOG)
 def get_products():
-    """商品一覧取得"""
-    products = Product.query.order_by(Product.created_at.desc()).all()
-    return jsonify([p.to_dict() for p in products]), 200
+    """
+    商品一覧取得
+    
+    クエリパラメータ:
+    - category, minPrice, maxPrice, inStock: 絞り込み（SQLで実行）
+    - fields: 返すフィールドをカンマ区切りで指定（指定カラムのみSELECT）
+    - limit, cursor: キーセットページネーション（次ページのカーソルは X-Next-Cursor ヘッダー）。
+      limit 未指定なら PRODUCTS_DEFAULT_PAGE_SIZE 件（全件は返さない）
+    """
+    try:
+        fields = _parse_fields(request.args.get('fields'))
+        limit = parse_limit(
+            request.args.get('limit'),
+            default=current_app.config['PRODUCTS_DEFAULT_PAGE_SIZE'],
+            maximum=current_app.config['PRODUCTS_MAX_PAGE_SIZE']
+        )
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    key = ('list', tuple(sorted(request.args.items(multi=True))))
+    cached = catalog_cache.get_or_fill(
+        key,
+        lambda: _load_products(request.args, fields, limit, after)
+    )
+    return cached.to_response()
+
+
+def _load_products(args, fields, limit, after):
+    """商品一覧をDBから取得してシリアライズ（キャッシュミス時のみ実行）"""
+    query = _apply_product_filters(Product.query, args)
+    
+    # 条件付きGET用の検証子は集約クエリで生成
+    validators = collection_validators(query, Product.updated_at, 'products')
+    
+    if after:
+        created_at, last_id = after
+        query = query.filter(or_(
+            Product.created_at < created_at,
+            and_(Product.created_at == created_at, Product.id < last_id)
+        ))
+    
+    query = query.order_by(Product.created_at.desc(), Product.id.desc())
+    
+    # ORMオブジェクトを作らず、必要なカラムだけをタプルで取得
+    # （カーソル生成用の created_at, id は末尾に追加）
+    keys, columns = api_columns(Product, fields, extra=(Product.created_at, Product.id))
+    query = query.with_entities(*columns)
+    
+    # 次ページの有無を判定するため1件多く取得
+    rows = query.limit(limit + 1).all()
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    
+    body = rows_to_dicts(keys, rows)
+    
+    headers = {}
+    if has_next:
+        created_at, last_id = rows[-1][-2:]
+        headers['X-Next-Cursor'] = encode_cursor(created_at, last_id)
+    return CachedResponse.from_json(body, validators, headers)
+
+
+@products_bp.route('/search', methods=['GET'])
+def search_products():
+    """
+    商品検索
+    
+    クエリパラメータ:
+    - q: 検索語（空白区切りはAND。商品名・カテゴリ・説明の部分一致、カタカナ/ひらがな・全角/半角は区別しない）
+    - fields: 返すフィールドをカンマ区切りで指定
+    - limit: 返す件数（デフォルト20）
+    関連度順に返し、総ヒット数は X-Total-Count ヘッダー
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': '検索語が必要です'}), 400
+    try:
+        fields = _parse_fields(request.args.get('fields'))
+        limit = parse_limit(
+            request.args.get('limit'),
+            default=20,
+            maximum=current_app.config['SEARCH_MAX_RESULTS']
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    total, product_ids = search_index.search(query, limit)
+    
+    # 本文は最新の在庫・価格を返すためDBから取得し、検索順に並べる
+    keys, columns = api_columns(Product, fields, extra=(Product.id,))
+    rows = db.session.execute(select(*columns).where(Product.id.in_(product_ids))).all() if product_ids else []
+    by_id = {row[-1]: row for row in rows}
+    body = rows_to_dicts(keys, (by_id[i] for i in product_ids if i in by_id))
+    
+    response = jsonify(body)
+    response.headers['X-Total-Count'] = str(total)
+    return response, 200
+
+
+@products_bp.route('/search/stats', methods=['GET'])
+@jwt_required()
+def get_search_stats():
+    """検索インデックスの統計取得（管理者のみ、応答したワーカー分）"""
+    error_response = require_admin()
+    if error_response:
+        return error_response
+    
+    return jsonify(search_index.stats()), 200
 
 
 @products_bp.route('/<int:product_id>', methods=['GET'])
+@read_replica(CATALOG)
 def get_product(product_id):
     """商品詳細取得"""
+    cached = catalog_cache.get_or_fill(('detail', product_id), lambda: _load_product(product_id))
+    if cached is NOT_FOUND:
+        return jsonify({'error': '商品が見つかりません'}), 404
+    
+    return cached.to_response()
+
+
+def _load_product(product_id):
+    """商品詳細をDBから取得してシリアライズ（キャッシュミス時のみ実行）"""
     product = Product.query.get(product_id)
     if not product:
-        return jsonify({'error': '商品が見つかりません'}), 404
+        return NOT_FOUND
+    validators = row_validators(product.id, product.updated_at, 'product')
+    return CachedResponse.from_json(product.to_dict(), validators)
+
+
+@products_bp.route('/cache/stats', methods=['GET'])
+@jwt_required()
+def get_cache_stats():
+    """カタログキャッシュの統計取得（管理者のみ、応答したワーカー分）"""
+    error_response = require_admin()
+    if error_response:
+        return error_response
     
-    return jsonify(product.to_dict()), 200
+    return jsonify(catalog_cache.stats()), 200
+
+
+@products_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_all_products():
+    """
+    全商品のエクスポート（管理者のみ）
+    
+    クエリパラメータ:
+    - format: csv（デフォルト）または jsonl
+    - fields: 出力するフィールドをカンマ区切りで指定
+    全件をメモリに載せず、サーバーサイドカーソルから読みながらストリームで返す
+    """
+    error_response = require_admin()
+    if error_response:
+        return error_response
+    
+    try:
+        fmt = detect_format(request.args.get('format', 'csv'), None)
+        fields = _parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    filename = f'products-{datetime.utcnow():%Y%m%d%H%M%S}.{fmt}'
+    return Response(
+        stream_with_context(export_products(fmt, fields)),
+        content_type=CONTENT_TYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+
+@products_bp.route('/bulk', methods=['POST'])
+@jwt_required()
+def bulk_import_products():
+    """
+    商品の一括インポート（管理者のみ）
+    
+    本文は CSV（ヘッダー行あり）または JSON Lines。形式は ?format= か Content-Type で指定。
+    id のある行は更新、ない行は作成。不正な行は飛ばして行番号つきのエラーを返す
+    """
+    error_response = require_admin()
+    if error_response:
+        return error_response
+    
+    try:
+        fmt = detect_format(request.args.get('format'), request.mimetype)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    report, changed = import_products(request.stream, fmt)
+    if changed:
+        # 検索インデックスは次の検索時に updated_at の差分で取り込む
+        catalog_cache.invalidate()
+    
+    return jsonify(report.to_dict()), 200
 
 
 @products_bp.route('', methods=['POST'])
@@ -45,17 +280,25 @@ def create_product():
     if not data or not data.get('name') or not data.get('price'):
         return jsonify({'error': '商品名と価格が必要です'}), 400
     
+    # Base64画像は画像ストアに保存し、DBにはURLのみ保存
+    try:
+        image_url = store_data_url(data.get('imageUrl', ''))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     product = Product(
         name=data['name'],
         price=data['price'],
         description=data.get('description', ''),
-        image_url=data.get('imageUrl', ''),
+        image_url=image_url,
         stock=data.get('stock', 0),
         category=data.get('category', '')
     )
     
     db.session.add(product)
     db.session.commit()
+    catalog_cache.invalidate()
+    search_index.upsert(product)
     
     return jsonify(product.to_dict()), 201
 
@@ -74,6 +317,13 @@ def update_product(product_id):
     
     data = request.get_json()
     
+    # Base64画像は画像ストアに保存し、DBにはURLのみ保存
+    if 'imageUrl' in data:
+        try:
+            image_url = store_data_url(data['imageUrl'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
     # 更新
     if 'name' in data:
         product.name = data['name']
@@ -82,7 +332,7 @@ def update_product(product_id):
     if 'description' in data:
         product.description = data['description']
     if 'imageUrl' in data:
-        product.image_url = data['imageUrl']
+        product.image_url = image_url
     if 'stock' in data:
         product.stock = data['stock']
     if 'category' in data:
@@ -91,6 +341,8 @@ def update_product(product_id):
     product.updated_at = datetime.utcnow()
     
     db.session.commit()
+    catalog_cache.invalidate()
+    search_index.upsert(product)
     
     return jsonify(product.to_dict()), 200
 
@@ -109,6 +361,8 @@ def delete_product(product_id):
     
     db.session.delete(product)
     db.session.commit()
+    catalog_cache.invalidate()
+    search_index.remove(product_id)
     
     return jsonify({'message': '商品を削除しました'}), 200
 
@@ -1,13 +1,21 @@
 """Stripe決済API"""
+import logging
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-import stripe
-import os
+from app.services.idempotency import idempotent, HEADER as IDEMPOTENCY_HEADER
+from app.services.rate_limit import rate_limit, BY_JWT_USER
+from app.services.stripe_events import record_event, event_consumer
+from app.services.stripe_gateway import (
+    stripe_gateway, MOCK_INTENT_PREFIX, PaymentGatewayError, WebhookSignatureError
+)
 
 stripe_payment_bp = Blueprint('stripe_payment', __name__)
+logger = logging.getLogger(__name__)
 
 @stripe_payment_bp.route('/create-payment-intent', methods=['POST'])
 @jwt_required()
+@idempotent('stripe.create_payment_intent')
+@rate_limit('payment', per_user_key=BY_JWT_USER)  # 再送（保存済みレスポンスの返却）ではトークンを使わない
 def create_payment_intent():
     """
     決済Intent作成
@@ -17,15 +25,14 @@ def create_payment_intent():
     2. Stripe APIにPaymentIntentを作成依頼
     3. client_secretをフロントエンドに返す
     4. フロントエンドがこのclient_secretを使ってカード決済
+    
+    Idempotency-Keyヘッダー付きの再送には同じPaymentIntentを返す
+    （キーはStripeにも渡すため、Stripe側でも二重作成されない）
     """
     try:
-        print('=== PaymentIntent作成リクエスト受信 ===')
-        
         # リクエストデータ取得
         data = request.get_json()
-        print(f'リクエストデータ: {data}')
         amount = data.get('amount')  # 円単位
-        print(f'金額: {amount}円')
         
         # バリデーション
         if not amount or amount <= 0:
@@ -34,26 +41,16 @@ def create_payment_intent():
         # ログインユーザーID取得（文字列なので整数に変換）
         user_id = int(get_jwt_identity())
         
-        # Stripe APIキー確認
-        stripe_secret_key = current_app.config.get('STRIPE_SECRET_KEY', '')
-        print(f'Stripe APIキー: {stripe_secret_key}')
-        
         # 本物のStripeキーがある場合は実際のAPIを呼び出す
-        if stripe_secret_key and stripe_secret_key.startswith('sk_') and not 'dummy' in stripe_secret_key.lower():
-            stripe.api_key = stripe_secret_key
-            
-            # PaymentIntent作成（Stripe APIへのリクエスト）
-            payment_intent = stripe.PaymentIntent.create(
-                amount=int(amount),  # 円単位
-                currency='jpy',      # 日本円
+        if stripe_gateway.enabled:
+            # PaymentIntent作成（Stripe APIへのリクエスト、タイムアウト・リトライ付き）
+            payment_intent = stripe_gateway.create_payment_intent(
+                amount,  # 円単位
                 metadata={
                     'user_id': user_id,  # 注文者情報
                     'integration_check': 'accept_a_payment'
                 },
-                # 自動決済方法を有効化
-                automatic_payment_methods={
-                    'enabled': True
-                }
+                idempotency_key=request.headers.get(IDEMPOTENCY_HEADER)
             )
             
             # client_secretをフロントエンドに返す
@@ -67,27 +64,26 @@ def create_payment_intent():
             mock_payment_intent_id = f'pi_mock_{uuid.uuid4().hex[:24]}'
             mock_client_secret = f'{mock_payment_intent_id}_secret_{uuid.uuid4().hex[:32]}'
             
-            print(f'⚠️  モック決済モード: amount={amount}円, user_id={user_id}')
+            logger.info('モック決済モードでPaymentIntentを作成', extra={'amount': amount, 'user_id': user_id})
             
             return jsonify({
                 'clientSecret': mock_client_secret,
                 'paymentIntentId': mock_payment_intent_id
             }), 200
         
-    except stripe.error.StripeError as e:
+    except PaymentGatewayError as e:
         # Stripe APIエラー
-        print(f'❌ Stripe APIエラー: {str(e)}')
+        logger.warning('Stripe APIエラー: %s', e)
         return jsonify({'error': str(e)}), 400
     except Exception as e:
         # その他のエラー
-        import traceback
-        print(f'❌ 決済準備エラー: {str(e)}')
-        print(traceback.format_exc())
+        logger.exception('決済準備エラー')
         return jsonify({'error': '決済の準備に失敗しました', 'detail': str(e)}), 500
 
 
 @stripe_payment_bp.route('/verify-payment', methods=['POST'])
 @jwt_required()
+@rate_limit('payment', per_user_key=BY_JWT_USER)
 def verify_payment():
     """
     決済検証
@@ -104,17 +100,13 @@ def verify_payment():
         if not payment_intent_id:
             return jsonify({'error': 'paymentIntentIdが必要です'}), 400
         
-        stripe_secret_key = current_app.config.get('STRIPE_SECRET_KEY', '')
-        
         # 本物のStripeキーがある場合は実際のAPIを呼び出す
-        if stripe_secret_key and stripe_secret_key.startswith('sk_') and not 'dummy' in stripe_secret_key.lower():
-            stripe.api_key = stripe_secret_key
-            
-            # Stripe APIで決済状態を確認
-            payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+        if stripe_gateway.enabled:
+            # Stripe APIで決済状態を確認（成功済みならキャッシュされ、注文作成時の再取得が不要になる）
+            payment_intent = stripe_gateway.verify_payment_intent(payment_intent_id)
             
             # 決済が成功しているか確認
-            if payment_intent.status == 'succeeded':
+            if payment_intent.succeeded:
                 return jsonify({
                     'verified': True,
                     'amount': payment_intent.amount,
@@ -127,8 +119,8 @@ def verify_payment():
                 }), 400
         else:
             # モックモード：モックPaymentIntentの場合は常に成功とする
-            if payment_intent_id.startswith('pi_mock_'):
-                print(f'⚠️  モック決済検証: payment_intent_id={payment_intent_id}')
+            if payment_intent_id.startswith(MOCK_INTENT_PREFIX):
+                logger.info('モック決済を検証', extra={'payment_intent_id': payment_intent_id})
                 return jsonify({
                     'verified': True,
                     'amount': 0,  # モックなので金額は0
@@ -140,13 +132,41 @@ def verify_payment():
                     'status': 'unknown'
                 }), 400
             
-    except stripe.error.StripeError as e:
+    except PaymentGatewayError as e:
         return jsonify({'error': str(e)}), 400
-    except Exception as e:
-        print(f'決済検証エラー: {str(e)}')
+    except Exception:
+        logger.exception('決済検証エラー')
         return jsonify({'error': '決済の検証に失敗しました'}), 500
 
 
+@stripe_payment_bp.route('/webhook', methods=['POST'])
+def stripe_webhook():
+    """
+    Stripe Webhook受信
+    
+    説明:
+    1. Stripe-Signatureヘッダーで署名を検証（ローカル計算のみ、外部通信なし）
+    2. イベントをイベントIDで重複排除して記録
+    3. すぐに200を返し、注文の確定はバックグラウンドで行う
+    """
+    webhook_secret = current_app.config.get('STRIPE_WEBHOOK_SECRET', '')
+    if not webhook_secret:
+        return jsonify({'error': 'Webhookが設定されていません'}), 503
+    
+    payload = request.get_data(as_text=True)
+    sig_header = request.headers.get('Stripe-Signature', '')
+    
+    try:
+        stripe_gateway.construct_webhook_event(payload, sig_header, webhook_secret)
+    except WebhookSignatureError:
+        return jsonify({'error': '署名の検証に失敗しました'}), 400
+    
+    if record_event(payload):
+        event_consumer.notify()
+    
+    return jsonify({'received': True}), 200
+
+
 @stripe_payment_bp.route('/config', methods=['GET'])
 def get_stripe_config():
     """
@@ -0,0 +1 @@
+# アプリケーションサービスパッケージ
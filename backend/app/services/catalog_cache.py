@@ -0,0 +1,170 @@
+"""
+商品カタログのワーカー内キャッシュ
+
+シリアライズ済みの商品レスポンスを各ワーカーのメモリに保持する。
+全ワーカーで共有するカタログバージョン（SharedCounter）を商品・在庫の
+更新時に加算し、バージョンが変わったエントリは無効として扱う。
+大きなレスポンスは gzip / brotli の圧縮済みバイト列も一緒に保持し、
+圧縮はカタログの変更ごとに1回だけ行う。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, g
+from app.db_routing import CATALOG, CATALOG_STOCK, replica_router
+from app.utils.compression import compress_variants, negotiate_encoding
+from app.utils.shared_memory import SharedCounter
+
+
+class CachedResponse:
+    """キャッシュに保存するシリアライズ済みレスポンス（encodings は圧縮済みの表現）"""
+    __slots__ = ('body', 'validators', 'headers', 'encodings')
+    
+    def __init__(self, body, validators, headers=None, encodings=None):
+        self.body = body
+        self.validators = validators
+        self.headers = headers or {}
+        self.encodings = encodings or {}
+    
+    @classmethod
+    def from_json(cls, data, validators, headers=None):
+        body = current_app.json.dumps_bytes(data) + b'\n'
+        config = current_app.config
+        # キャッシュしない場合は毎回圧縮することになるため圧縮しない
+        encodings = compress_variants(
+            body,
+            config['CATALOG_COMPRESS_MIN_BYTES'],
+            config['CATALOG_GZIP_LEVEL'],
+            config['CATALOG_BROTLI_QUALITY']
+        ) if config['CATALOG_COMPRESS_ENABLED'] and config['CATALOG_CACHE_ENABLED'] else {}
+        return cls(body, validators, headers, encodings)
+    
+    def to_response(self):
+        """Flaskレスポンスに変換（検証子が一致すれば304。圧縮済みの表現があれば Accept-Encoding で選ぶ）"""
+        if self.validators.matches():
+            return self._vary(self.validators.not_modified())
+        encoding = negotiate_encoding(self.encodings) if self.encodings else None
+        body = self.encodings[encoding] if encoding else self.body
+        response = current_app.response_class(body, mimetype='application/json')
+        response.headers.update(self.headers)
+        if encoding:
+            response.content_encoding = encoding
+        return self.validators.apply(self._vary(response))
+    
+    def _vary(self, response):
+        # 圧縮の有無でレスポンスが変わるため、共有キャッシュがエンコーディングごとに分けて保存するようにする
+        if self.encodings:
+            response.vary.add('Accept-Encoding')
+        return response
+
+
+class _Entry:
+    __slots__ = ('version', 'value', 'expires')
+    
+    def __init__(self, version, value, expires=None):
+        self.version = version
+        self.value = value
+        self.expires = expires  # time.monotonic() の期限（None なら次の無効化まで）
+
+
+class CatalogCache:
+    """バージョン無効化方式のread-throughキャッシュ"""
+    
+    def __init__(self, app=None):
+        self.enabled = False
+        self.max_entries = 0
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._entries_lock = threading.Lock()
+        self._fill_locks = {}
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.enabled = app.config['CATALOG_CACHE_ENABLED']
+        self.max_entries = app.config['CATALOG_CACHE_MAX_ENTRIES']
+        self.version = SharedCounter(app.config['CATALOG_VERSION_FILE'])
+        app.extensions['catalog_cache'] = self
+    
+    def get_or_fill(self, key, fill):
+        """
+        キャッシュから値を返す。無効または未登録ならfill()で生成して保存
+        
+        同じキーの同時ミスはキーごとのロックで直列化し（single-flight）、
+        ワーカー内では最初の1リクエストだけがDBに問い合わせる
+        """
+        if not self.enabled:
+            return fill()
+        
+        # fill()より前にバージョンを読む。fill中に更新があれば次回は不一致になる
+        version = self.version.value
+        value = self._lookup(key, version)
+        if value is not None:
+            return value
+        
+        lock = self._fill_locks.setdefault(key, threading.Lock())
+        with lock:
+            version = self.version.value
+            value = self._lookup(key, version)
+            if value is not None:
+                return value
+            
+            self.misses += 1
+            value = fill()
+            self._store(key, version, value, self._fill_expiry())
+        return value
+    
+    def _fill_expiry(self):
+        # 在庫の変更がまだ届いていないかもしれないレプリカから充填した値は、届いた頃に捨てる
+        if g.get('db_replica') is not None and replica_router.recently_written(CATALOG_STOCK):
+            return time.monotonic() + replica_router.sticky_seconds
+        return None
+    
+    def _lookup(self, key, version):
+        with self._entries_lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                return None
+            if entry.expires is not None and entry.expires <= time.monotonic():
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+    
+    def _store(self, key, version, value, expires=None):
+        with self._entries_lock:
+            self._entries[key] = _Entry(version, value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._fill_locks.pop(evicted, None)
+    
+    def invalidate(self, stock_only=False):
+        """
+        カタログバージョンを進め、全ワーカーのキャッシュを無効化
+        
+        stock_only: 注文・キャンセルによる在庫だけの変更（カタログの読み取りはレプリカのまま）
+        """
+        if self.version is not None:
+            self.version.increment()
+        # 商品の変更はレプリカに届くまでプライマリから充填する（古い値をキャッシュに入れない）
+        replica_router.mark_written(CATALOG_STOCK if stock_only else CATALOG)
+    
+    def stats(self):
+        """監視用の統計情報（このワーカー分）"""
+        total = self.hits + self.misses
+        return {
+            'pid': os.getpid(),
+            'enabled': self.enabled,
+            'version': self.version.value if self.version else None,
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': self.hits / total if total else 0.0,
+        }
+
+
+catalog_cache = CatalogCache()
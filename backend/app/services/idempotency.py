@@ -0,0 +1,187 @@
+"""
+Idempotency-Key 対応
+
+同じ Idempotency-Key で再送されたリクエストには、最初のリクエストのレスポンスを返す。
+キーはリクエスト本文の指紋（SHA-256）と一緒に保存し、別の内容での再利用は422で拒否する。
+最初のリクエストが処理中に届いた重複は、完了を待ってから同じレスポンスを返す。
+
+DBに書き込むビューは、コミットの直前に store_response() を呼んでレスポンスを同じトランザクションで保存する
+（注文作成など）。呼ばないビューのレスポンスはビューの後に別トランザクションで保存するため、
+ビューのコミットから保存までの間にプロセスが落ちると、キーは処理中のまま残り、
+IDEMPOTENCY_LOCK_TIMEOUT の後の再送でビューがもう一度実行される
+（PaymentIntent作成はStripeにも同じキーを渡すため、やり直しても二重にはならない）。
+"""
+import hashlib
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import current_app, g, jsonify, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from app.models import db, IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+
+def _lookup(user_id, scope, key):
+    return (
+        IdempotencyKey.query
+        .filter_by(user_id=user_id, scope=scope, key=key)
+        .populate_existing()
+        .first()
+    )
+
+
+def _replay(record):
+    response = current_app.response_class(
+        record.response_body,
+        status=record.response_status,
+        mimetype=record.response_mimetype
+    )
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _acquire(user_id, scope, key, fingerprint):
+    """
+    キーを確保する
+    
+    戻り値: (確保したレコード, None) または (None, 返すべきレスポンス)
+    """
+    config = current_app.config
+    deadline = time.monotonic() + config['IDEMPOTENCY_WAIT_TIMEOUT']
+    delay = 0.02
+    
+    while True:
+        record = IdempotencyKey(
+            user_id=user_id,
+            scope=scope,
+            key=key,
+            request_fingerprint=fingerprint
+        )
+        db.session.add(record)
+        try:
+            db.session.commit()
+            return record, None
+        except IntegrityError:
+            db.session.rollback()
+        
+        existing = _lookup(user_id, scope, key)
+        if existing is None:
+            # 直前に削除された（前回の処理が失敗した）ので取り直す
+            continue
+        if existing.request_fingerprint != fingerprint:
+            return None, (jsonify({'error': 'Idempotency-Keyが別のリクエストで使用されています'}), 422)
+        if existing.status == 'completed':
+            return None, _replay(existing)
+        
+        # 処理中のまま放置されたキー（ワーカー停止など）は引き継ぐ
+        stale_before = datetime.utcnow() - timedelta(seconds=config['IDEMPOTENCY_LOCK_TIMEOUT'])
+        if existing.created_at < stale_before:
+            result = db.session.execute(
+                update(IdempotencyKey)
+                .where(
+                    IdempotencyKey.id == existing.id,
+                    IdempotencyKey.status == 'in_progress',
+                    IdempotencyKey.created_at == existing.created_at
+                )
+                .values(created_at=datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            if result.rowcount == 1:
+                return db.session.get(IdempotencyKey, existing.id), None
+            continue
+        
+        # 最初のリクエストの完了を待つ
+        if time.monotonic() >= deadline:
+            return None, (jsonify({'error': '同じリクエストを処理中です'}), 409)
+        db.session.rollback()
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+def _complete(record_id, response):
+    """レスポンスを保存（5xx・429はキーを削除して再試行を許可）"""
+    db.session.rollback()
+    record = db.session.get(IdempotencyKey, record_id)
+    if record is None or record.status == 'completed':
+        # store_response() でビューと一緒にコミット済み
+        return
+    if response.status_code >= 500 or response.status_code == 429:
+        db.session.delete(record)
+    else:
+        for name, value in _completed_values(response).items():
+            setattr(record, name, value)
+    db.session.commit()
+
+
+def _completed_values(response):
+    return {
+        'status': 'completed',
+        'response_status': response.status_code,
+        'response_body': response.get_data(as_text=True),
+        'response_mimetype': response.mimetype,
+        'completed_at': datetime.utcnow(),
+    }
+
+
+def store_response(rv):
+    """
+    ビューの書き込みと同じトランザクションでレスポンスを保存する（ビューがコミットの直前に呼ぶ）
+    
+    コミット後にプロセスが落ちても、再送にはこのレスポンスを返し、処理をやり直さない。
+    Idempotency-Keyのないリクエストでは何もしない。戻り値: ビューが返すレスポンス
+    """
+    response = current_app.make_response(rv)
+    record_id = g.get('idempotency_record_id')
+    if record_id is not None:
+        db.session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.id == record_id)
+            .values(**_completed_values(response))
+            .execution_options(synchronize_session=False)
+        )
+    return response
+
+
+def idempotent(scope):
+    """
+    Idempotency-Key ヘッダーに対応させるデコレーター（@jwt_required の内側で使う）
+    
+    ヘッダーがなければ通常どおり処理する
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return view(*args, **kwargs)
+            if len(key) > 255:
+                return jsonify({'error': 'Idempotency-Keyが長すぎます'}), 400
+            
+            user_id = int(get_jwt_identity())
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+            record, early_response = _acquire(user_id, scope, key, fingerprint)
+            if early_response is not None:
+                return early_response
+            
+            record_id = record.id
+            g.idempotency_record_id = record_id
+            try:
+                response = current_app.make_response(view(*args, **kwargs))
+            except Exception:
+                db.session.rollback()
+                # コミット後の例外では、保存済みのレスポンスを残す（再送で処理をやり直さない）
+                db.session.query(IdempotencyKey).filter_by(
+                    id=record_id, status='in_progress'
+                ).delete()
+                db.session.commit()
+                raise
+            finally:
+                g.idempotency_record_id = None
+            _complete(record_id, response)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,121 @@
+"""
+商品画像ストア
+
+アップロードされたBase64画像（data URL）を一度だけデコードし、
+内容のSHA-256ハッシュをキーとしてローカルディスクに保存する。
+DBには短いURL（/api/images/<hash>.<ext>）だけを残す。
+"""
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+from flask import current_app
+
+IMAGE_URL_PREFIX = '/api/images/'
+
+# 受け付けるMIMEタイプ → 拡張子
+MIME_EXTENSIONS = {
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/jpg': 'jpg',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+}
+EXTENSION_MIMES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+}
+
+_DATA_URL_RE = re.compile(r'^data:(?P<mime>[\w/+.-]+);base64,', re.IGNORECASE)
+_IMAGE_NAME_RE = re.compile(r'^(?P<digest>[0-9a-f]{64})\.(?P<ext>[a-z]+)$')
+
+
+def is_data_url(value):
+    """Base64のdata URLかどうか"""
+    return bool(value) and value.startswith('data:')
+
+
+def _storage_dir():
+    return current_app.config['IMAGE_STORAGE_DIR']
+
+
+def image_path(digest, ext):
+    """ハッシュと拡張子から保存先パスを返す（先頭2文字でディレクトリ分割）"""
+    return os.path.join(_storage_dir(), digest[:2], f'{digest}.{ext}')
+
+
+def store_image_bytes(data, ext):
+    """画像バイト列を保存してURLを返す（同一内容は一度だけ書き込む）"""
+    digest = hashlib.sha256(data).hexdigest()
+    path = image_path(digest, ext)
+    
+    if not os.path.exists(path):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # 一時ファイルに書いてからrenameすることで、読み込み途中の不完全なファイルを見せない
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    return f'{IMAGE_URL_PREFIX}{digest}.{ext}'
+
+
+def store_data_url(value):
+    """
+    data URLをデコードして保存し、画像URLを返す
+    
+    data URL以外（既存のURLや空文字）はそのまま返す。
+    不正なdata URLの場合は ValueError を送出する
+    """
+    if not is_data_url(value):
+        return value
+    
+    match = _DATA_URL_RE.match(value)
+    if not match:
+        raise ValueError('画像データの形式が不正です')
+    
+    ext = MIME_EXTENSIONS.get(match.group('mime').lower())
+    if not ext:
+        raise ValueError('対応していない画像形式です')
+    
+    max_bytes = current_app.config['IMAGE_MAX_BYTES']
+    encoded = value[match.end():]
+    # デコード前に概算サイズで弾く
+    if len(encoded) * 3 // 4 > max_bytes:
+        raise ValueError('画像サイズが大きすぎます')
+    
+    try:
+        data = base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError('画像データのデコードに失敗しました') from e
+    
+    return store_image_bytes(data, ext)
+
+
+def resolve_image_name(name):
+    """
+    /api/images/<name> のnameから (保存パス, MIMEタイプ, ハッシュ) を返す
+    
+    不正な名前や存在しない画像の場合は None
+    """
+    match = _IMAGE_NAME_RE.match(name)
+    if not match:
+        return None
+    digest, ext = match.group('digest'), match.group('ext')
+    mime = EXTENSION_MIMES.get(ext)
+    if not mime:
+        return None
+    path = image_path(digest, ext)
+    if not os.path.isfile(path):
+        return None
+    return path, mime, digest
@@ -0,0 +1,100 @@
+"""
+在庫引当
+
+カート内の商品を1クエリで取得し（id順に行ロック）、在庫減算は
+「stock >= 数量」を条件にした1本のUPDATEで行う。
+並行する注文があっても在庫がマイナスになる（売り越す）ことはない。
+"""
+from datetime import datetime
+from sqlalchemy import case, update
+from app.models import db, Product
+
+
+class StockError(Exception):
+    """在庫引当の失敗"""
+
+
+class ProductNotFound(StockError):
+    def __init__(self, product_id):
+        super().__init__(f'商品ID {product_id} が見つかりません')
+        self.product_id = product_id
+
+
+class InsufficientStock(StockError):
+    def __init__(self, product_name):
+        super().__init__(f'{product_name} の在庫が不足しています')
+        self.product_name = product_name
+
+
+def merge_quantities(items):
+    """注文明細を商品IDごとの数量に集約（同じ商品が複数行あっても1回で引当）"""
+    quantities = {}
+    for item in items:
+        product_id = int(item['productId'])
+        quantity = int(item['quantity'])
+        if quantity <= 0:
+            raise ValueError('数量は1以上である必要があります')
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def reserve_stock(quantities):
+    """
+    在庫を引き当てる（呼び出し側のトランザクション内で実行）
+    
+    quantities: {商品ID: 数量}
+    戻り値: {商品ID: 商品名}
+    失敗時は StockError を送出する（呼び出し側でrollbackすること）
+    """
+    product_ids = sorted(quantities)
+    
+    # 1クエリで全商品を取得。id順にロックしてデッドロックを避ける（PostgreSQL）
+    rows = (
+        db.session.query(Product.id, Product.name)
+        .filter(Product.id.in_(product_ids))
+        .order_by(Product.id)
+        .with_for_update()
+        .all()
+    )
+    names = {row.id: row.name for row in rows}
+    for product_id in product_ids:
+        if product_id not in names:
+            raise ProductNotFound(product_id)
+    
+    # 全明細を1本の条件付きUPDATEで減算
+    quantity_expr = case(quantities, value=Product.id)
+    result = db.session.execute(
+        update(Product)
+        .where(Product.id.in_(product_ids), Product.stock >= quantity_expr)
+        .values(stock=Product.stock - quantity_expr, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    
+    if result.rowcount != len(product_ids):
+        # 失敗時のみ、どの商品が不足しているかを調べる
+        short = (
+            db.session.query(Product.name)
+            .filter(Product.id.in_(product_ids), Product.stock < quantity_expr)
+            .order_by(Product.id)
+            .first()
+        )
+        raise InsufficientStock(short.name if short else '商品')
+    
+    return names
+
+
+def release_stock(quantities):
+    """
+    引き当てた在庫を戻す（決済失敗・キャンセル時。呼び出し側のトランザクション内で実行）
+    
+    quantities: {商品ID: 数量}
+    """
+    if not quantities:
+        return
+    quantity_expr = case(quantities, value=Product.id)
+    db.session.execute(
+        update(Product)
+        .where(Product.id.in_(sorted(quantities)))
+        .values(stock=Product.stock + quantity_expr, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,126 @@
+"""
+パスワードハッシュ（bcrypt）
+
+bcryptの計算はリクエストスレッドではなく、サイズ上限付きのスレッドプールで行う。
+bcryptは計算中にGILを解放するため、同じプロセスの他のスレッドは処理を続けられる。
+geventワーカーではスレッドもグリーンレットに置き換わるため、geventのネイティブスレッドプールを使う
+（計算中もハブが止まらず、他のリクエストを処理できる）。
+待ち行列の深さにも上限を設け、ログインが殺到したときは早めに HasherBusy を送出する。
+
+リクエストスレッドは計算の終わりを待つため、sync ワーカーではその間ワーカー自体が塞がる
+（他のリクエストを並行して処理できるのは gthread・gevent ワーカー。docker-compose のデフォルトは gthread）。
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from app.services.request_metrics import request_metrics
+from app.utils.workers import gevent_patched
+
+
+def _make_executor(max_workers):
+    if gevent_patched():
+        from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+        return NativeThreadPoolExecutor(max_workers=max_workers)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bcrypt')
+
+
+class HasherBusy(Exception):
+    """ハッシュ計算の待ち行列が上限に達している"""
+
+
+def hash_rounds(password_hash):
+    """ハッシュ文字列（$2b$12$...）から work factor を取り出す"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """上限付きスレッドプールでbcryptを実行する"""
+    
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.pool_size = 2
+        self.max_pending = 16
+        self.timeout = 10
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+        self._slots = None
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.rounds = app.config['BCRYPT_ROUNDS']
+        self.pool_size = app.config['BCRYPT_POOL_SIZE']
+        self.max_pending = app.config['BCRYPT_MAX_PENDING']
+        self.timeout = app.config['BCRYPT_TIMEOUT']
+        # 実行中 + 待機中の合計を max_pending に制限
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        app.extensions['password_hasher'] = self
+    
+    def _get_executor(self):
+        # fork後の子プロセスでは親のスレッドは存在しないため、プロセスごとに作り直す
+        pid = os.getpid()
+        if self._executor is None or self._executor_pid != pid:
+            with self._executor_lock:
+                if self._executor is None or self._executor_pid != pid:
+                    self._executor = _make_executor(self.pool_size)
+                    self._executor_pid = pid
+        return self._executor
+    
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy('パスワード処理が混み合っています')
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # 枠は計算が終わった（または取り消した）時点で返す。タイムアウトで待つのをやめても、
+        # 待ち行列・実行中に残っている間は枠を使い続けるため、上限 max_pending が守られる
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            # 待ち行列で待つ時間も含めてリクエストの bcrypt 時間に数える
+            with request_metrics.timed('bcrypt'):
+                return future.result(timeout=self.timeout)
+        except FutureTimeoutError as e:
+            # まだ待ち行列にあれば取り消す（実行中のものは止められないので終わるまで枠を使う）
+            future.cancel()
+            raise HasherBusy('パスワード処理がタイムアウトしました') from e
+    
+    def hash(self, password):
+        """パスワードをハッシュ化（設定の work factor を使用）"""
+        return self._submit(self._hash, password, self.rounds)
+    
+    def verify(self, password, password_hash):
+        """パスワードを検証"""
+        return self._submit(self._verify, password, password_hash)
+    
+    def needs_rehash(self, password_hash):
+        """保存済みハッシュの work factor が設定と異なるか"""
+        return hash_rounds(password_hash) != self.rounds
+    
+    def preload(self):
+        """bcrypt を読み込んでおく（preload_app 時にマスタープロセスで呼ぶ）"""
+        import bcrypt  # noqa: F401
+    
+    @staticmethod
+    def _hash(password, rounds):
+        import bcrypt
+        return bcrypt.hashpw(
+            password.encode('utf-8'),
+            bcrypt.gensalt(rounds=rounds)
+        ).decode('utf-8')
+    
+    @staticmethod
+    def _verify(password, password_hash):
+        import bcrypt
+        return bcrypt.checkpw(
+            password.encode('utf-8'),
+            password_hash.encode('utf-8')
+        )
+
+
+password_hasher = PasswordHasher()
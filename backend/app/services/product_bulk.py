@@ -0,0 +1,317 @@
+"""
+商品の一括インポート・エクスポート
+
+インポートはリクエスト本文（CSV / JSON Lines）をストリームのまま1行ずつ読み、
+検証済みの行を BULK_IMPORT_BATCH_SIZE 件ごとにまとめて executemany で追加・更新し、
+バッチごとにコミットする。本文全体や全行をメモリに載せない。
+- id のある行は既存商品の更新（指定されたフィールドのみ）、ない行は新規作成
+- createdAt / updatedAt は読み飛ばす（エクスポートした内容をそのまま戻せる）
+- 不正な行は飛ばして、行番号とエラー内容を報告する
+
+エクスポートはサーバーサイドカーソル（yield_per）で少しずつ取り出し、
+まとめた行ごとにチャンクとして返す。
+"""
+import csv
+import io
+import math
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from app.models import db, Product
+from app.services.image_store import store_data_url
+from app.utils.serialization import api_columns
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+}
+
+# Content-Type → 形式（?format= の指定がないとき）
+_FORMATS_BY_MIME = {
+    'text/csv': 'csv',
+    'application/csv': 'csv',
+    'application/x-ndjson': 'jsonl',
+    'application/jsonl': 'jsonl',
+    'application/x-jsonlines': 'jsonl',
+}
+
+# インポートで書き込めるAPIフィールド（id は更新対象の指定にだけ使う）
+IMPORT_FIELDS = ('name', 'price', 'description', 'imageUrl', 'stock', 'category')
+
+# エクスポートで1チャンクにまとめる目安のバイト数
+_CHUNK_BYTES = 64 * 1024
+
+
+class RowError(ValueError):
+    """1行分の検証エラー"""
+
+
+def detect_format(requested, mimetype):
+    """?format= または Content-Type から形式を決める（不明なら ValueError）"""
+    fmt = requested or _FORMATS_BY_MIME.get(mimetype)
+    if fmt not in FORMATS:
+        raise ValueError('形式は csv または jsonl を指定してください')
+    return fmt
+
+
+def _read_csv(stream):
+    """(行番号, 辞書) を順に返す。CSVの空欄は未指定として扱う"""
+    text = io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    for record in reader:
+        if None in record:
+            yield reader.line_num, RowError('列数がヘッダーより多いです')
+            continue
+        yield reader.line_num, {k: v for k, v in record.items() if v not in ('', None)}
+
+
+def _read_jsonl(stream):
+    """(行番号, 辞書) を順に返す。空行は飛ばす"""
+    loads = current_app.json.loads
+    for line_no, line in enumerate(io.BufferedReader(stream), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = loads(line)
+        except ValueError:
+            yield line_no, RowError('JSONとして解釈できません')
+            continue
+        if not isinstance(record, dict):
+            yield line_no, RowError('1行に1つのJSONオブジェクトが必要です')
+            continue
+        yield line_no, record
+
+
+def _to_number(value, cast, label):
+    if isinstance(value, bool):
+        raise RowError(f'{label}が不正です')
+    try:
+        number = cast(value)
+    except (TypeError, ValueError):
+        raise RowError(f'{label}が不正です')
+    if not math.isfinite(number):
+        raise RowError(f'{label}が不正です')
+    if number < 0:
+        raise RowError(f'{label}は0以上で指定してください')
+    return number
+
+
+def _to_text(value, label, max_length=None):
+    if not isinstance(value, str):
+        value = str(value)
+    if max_length is not None and len(value) > max_length:
+        raise RowError(f'{label}は{max_length}文字以内で指定してください')
+    return value
+
+
+def _row_values(record):
+    """
+    1行を (商品ID or None, カラム名 → 値) に変換
+    
+    新規作成（id なし）では商品名と価格が必要
+    """
+    product_id = record.get('id')
+    if product_id is not None:
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            raise RowError('idが不正です')
+    
+    values = {}
+    if 'name' in record:
+        values['name'] = _to_text(record['name'], '商品名', 200)
+        if not values['name']:
+            raise RowError('商品名が必要です')
+    if 'price' in record:
+        values['price'] = _to_number(record['price'], float, '価格')
+    if 'stock' in record:
+        values['stock'] = _to_number(record['stock'], int, '在庫数')
+    if 'description' in record:
+        values['description'] = _to_text(record['description'] or '', '説明')
+    if 'category' in record:
+        values['category'] = _to_text(record['category'] or '', 'カテゴリ', 100)
+    if 'imageUrl' in record:
+        try:
+            values['image_url'] = store_data_url(_to_text(record['imageUrl'] or '', '画像URL'))
+        except ValueError as e:
+            raise RowError(str(e))
+    
+    if product_id is None:
+        if 'name' not in values or 'price' not in values:
+            raise RowError('商品名と価格が必要です')
+        values.setdefault('description', '')
+        values.setdefault('stock', 0)
+        values.setdefault('category', '')
+        values.setdefault('image_url', '')
+    elif not values:
+        raise RowError(f'更新するフィールドがありません（{", ".join(IMPORT_FIELDS)}）')
+    return product_id, values
+
+
+class ImportReport:
+    """インポート結果（エラーは BULK_IMPORT_MAX_ERRORS 件まで保持）"""
+    
+    def __init__(self, max_errors):
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+    
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'error': message})
+    
+    def to_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errorsTruncated': self.failed > len(self.errors),
+        }
+
+
+def _flush(batch, report):
+    """
+    1バッチ分を追加・更新してコミット
+    
+    更新対象のIDが存在しない行はエラーにする。DBエラーのときはバッチ全体をロールバックし、
+    バッチ内の全行を失敗として報告する
+    """
+    now = datetime.utcnow()
+    inserts = []
+    updates = {}
+    for line, product_id, values in batch:
+        values['updated_at'] = now
+        if product_id is None:
+            values['created_at'] = now
+            inserts.append(values)
+        elif product_id in updates:
+            # 同じIDが複数行あればまとめる（同じフィールドは後の行を優先）
+            lines, merged = updates[product_id]
+            lines.append(line)
+            merged.update(values)
+        else:
+            updates[product_id] = ([line], values)
+    
+    if updates:
+        existing = set(db.session.execute(
+            select(Product.id).where(Product.id.in_(updates.keys()))
+        ).scalars())
+        for product_id in updates.keys() - existing:
+            for line in updates.pop(product_id)[0]:
+                report.add_error(line, '商品が見つかりません')
+    
+    try:
+        if inserts:
+            db.session.execute(insert(Product), inserts)
+        if updates:
+            # ORMの主キー指定一括UPDATE（更新するカラムの組み合わせごとに executemany）
+            db.session.execute(
+                update(Product),
+                [{'id': product_id, **values} for product_id, (_, values) in updates.items()]
+            )
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        message = f'保存に失敗しました: {e.__class__.__name__}'
+        for line, product_id, _ in batch:
+            if product_id is None or product_id in updates:
+                report.add_error(line, message)
+        return False
+    
+    report.created += len(inserts)
+    report.updated += len(updates)
+    return True
+
+
+def import_products(stream, fmt):
+    """
+    CSV / JSON Lines のストリームから商品を一括で追加・更新する
+    
+    (ImportReport, 1件でも書き込んだか) を返す（書き込んだら呼び出し側でキャッシュを無効化する）
+    """
+    config = current_app.config
+    batch_size = config['BULK_IMPORT_BATCH_SIZE']
+    report = ImportReport(config['BULK_IMPORT_MAX_ERRORS'])
+    rows = _read_csv(stream) if fmt == 'csv' else _read_jsonl(stream)
+    
+    batch = []
+    changed = False
+    try:
+        for line, record in rows:
+            if isinstance(record, RowError):
+                report.add_error(line, str(record))
+                continue
+            try:
+                product_id, values = _row_values(record)
+            except RowError as e:
+                report.add_error(line, str(e))
+                continue
+            batch.append((line, product_id, values))
+            if len(batch) >= batch_size:
+                changed |= _flush(batch, report)
+                batch = []
+    except (UnicodeDecodeError, csv.Error) as e:
+        # 本文の途中で読めなくなった場合は、それまでの行だけを反映する
+        report.add_error(None, f'本文を読み込めません: {e}')
+    if batch:
+        changed |= _flush(batch, report)
+    return report, changed
+
+
+def _csv_chunks(keys, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(keys)
+    for row in rows:
+        writer.writerow(['' if v is None else v.isoformat() if isinstance(v, datetime) else v for v in row])
+        if buffer.tell() >= _CHUNK_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _jsonl_chunks(keys, rows):
+    dumps_bytes = current_app.json.dumps_bytes
+    chunk = []
+    size = 0
+    for row in rows:
+        line = dumps_bytes(dict(zip(keys, row)))
+        chunk.append(line)
+        size += len(line) + 1
+        if size >= _CHUNK_BYTES:
+            chunk.append(b'')
+            yield b'\n'.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        chunk.append(b'')
+        yield b'\n'.join(chunk)
+
+
+def export_products(fmt, fields=None):
+    """
+    全商品を id 順に CSV / JSON Lines のチャンクとして返すジェネレーター
+    
+    yield_per でサーバーサイドカーソル（PostgreSQL）を使い、一度に BULK_EXPORT_FETCH_SIZE 件ずつ取り出す。
+    リクエストコンテキスト内（stream_with_context）で消費すること
+    """
+    keys, columns = api_columns(Product, fields)
+    rows = db.session.execute(
+        select(*columns)
+        .order_by(Product.id)
+        .execution_options(yield_per=current_app.config['BULK_EXPORT_FETCH_SIZE'])
+    )
+    try:
+        if fmt == 'csv':
+            yield from _csv_chunks(keys, rows)
+        else:
+            yield from _jsonl_chunks(keys, rows)
+    finally:
+        rows.close()
@@ -0,0 +1,201 @@
+"""
+レート制限と負荷制限（ロードシェディング）
+
+レート制限:
+bcrypt を回すログイン・登録や、Stripeを呼ぶ決済APIに、IPごと・ユーザーごとのトークンバケットをかける。
+バケットは RATE_LIMIT_FILE を全Gunicornワーカーで mmap して共有する（外部サービス不要）。
+上限は '10/minute' の形式（10回まで連続で許し、6秒に1回ずつ回復）。超えたら429と Retry-After を返す。
+
+負荷制限:
+nginx がリクエストに付ける X-Request-Start（受け付けた時刻）から、ワーカーが処理を始めるまでの
+待ち時間を求め、予算を超えていたら処理せずに503を返す。待たされたリクエストを早く捨てて行列を縮め、
+カタログなど軽いリクエストまで巻き込まれないようにする。
+- レート制限のかかる重いAPI: LOAD_SHED_QUEUE_BUDGET_MS
+- それ以外: LOAD_SHED_MAX_QUEUE_MS（クライアントが諦めている可能性が高い待ち時間）
+"""
+import hashlib
+import logging
+import re
+import time
+from functools import wraps
+from flask import current_app, jsonify, request
+from flask_jwt_extended import get_jwt_identity
+from app.utils.client_ip import client_ip
+from app.utils.shared_memory import SharedTokenBuckets
+
+logger = logging.getLogger(__name__)
+
+QUEUE_START_HEADER = 'X-Request-Start'
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+_LIMIT_PATTERN = re.compile(r'\s*(\d+)\s*/\s*(second|minute|hour|day)\s*')
+
+
+def parse_limit(raw):
+    """'10/minute' → (回数, 秒)。空・'0' なら None（制限なし）"""
+    if not raw or raw.strip() == '0':
+        return None
+    match = _LIMIT_PATTERN.fullmatch(raw)
+    if not match:
+        raise ValueError(f'レート制限の形式が不正です: {raw}（例: 10/minute）')
+    count = int(match.group(1))
+    return (count, _PERIODS[match.group(2)]) if count else None
+
+
+def parse_queue_start(raw, now):
+    """
+    X-Request-Start（'t=1700000000.123' など）→ 受け付けた時刻（秒）
+    
+    秒・ミリ秒・マイクロ秒のどれでも受け付ける。解釈できなければ None
+    """
+    if not raw:
+        return None
+    try:
+        value = float(raw.strip().removeprefix('t='))
+    except ValueError:
+        return None
+    for divisor in (1, 1_000, 1_000_000):
+        started = value / divisor
+        # 現在時刻の前後1日以内のものだけを時刻とみなす
+        if abs(now - started) < 86400:
+            return started
+    return None
+
+
+def _too_many(retry_after, message):
+    response = jsonify({'error': message})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    return response
+
+
+class RateLimiter:
+    """ワーカー間で共有するトークンバケットでのレート制限と、待ち時間による負荷制限"""
+    
+    def __init__(self, app=None):
+        self.enabled = True
+        self.buckets = None
+        self.limits = {}
+        self.queue_budget = 0.0
+        self.max_queue = 0.0
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config['RATE_LIMIT_ENABLED']
+        self.buckets = SharedTokenBuckets(config['RATE_LIMIT_FILE'], config['RATE_LIMIT_SLOTS']) if self.enabled else None
+        # 起動時に設定の誤りに気づけるよう、ここで全て解釈しておく
+        self.limits = {
+            name: parse_limit(value) for name, value in config.items()
+            if name.startswith('RATE_LIMIT_') and name.endswith(('_PER_IP', '_PER_USER'))
+        }
+        self.queue_budget = config['LOAD_SHED_QUEUE_BUDGET_MS'] / 1000
+        self.max_queue = config['LOAD_SHED_MAX_QUEUE_MS'] / 1000
+        app.extensions['rate_limiter'] = self
+        if self.queue_budget or self.max_queue:
+            app.before_request(self._shed_load)
+    
+    def hit(self, limit_name, key, consume=True):
+        """
+        limit_name の制限で key のトークンを1つ取る（consume=False なら残りがあるかだけ見る）
+        
+        戻り値: (許可したか, 再試行までの秒数)
+        """
+        limit = self.limits.get(limit_name)
+        if not self.enabled or limit is None or not key:
+            return True, 0.0
+        count, period = limit
+        digest = hashlib.blake2b(f'{limit_name}\0{key}'.encode('utf-8'), digest_size=8).digest()
+        # 0 は空きバケットの印なので使わない
+        key_hash = int.from_bytes(digest, 'little', signed=True) or 1
+        return self.buckets.take(key_hash, count, count / period, int(time.time() * 1_000_000), consume)
+    
+    def _queue_limit(self):
+        """このリクエストに許す待ち時間（秒）。0なら制限なし"""
+        view = current_app.view_functions.get(request.endpoint)
+        if getattr(view, 'rate_limited', False) and self.queue_budget:
+            return self.queue_budget
+        return self.max_queue
+    
+    def _shed_load(self):
+        limit = self._queue_limit()
+        if not limit:
+            return None
+        now = time.time()
+        started = parse_queue_start(request.headers.get(QUEUE_START_HEADER), now)
+        if started is None:
+            return None
+        waited = now - started
+        if waited <= limit:
+            return None
+        logger.warning('待ち時間が予算を超えたため処理せずに返しました', extra={
+            'queue_ms': round(waited * 1000, 1), 'budget_ms': round(limit * 1000, 1)
+        })
+        response = jsonify({'error': 'ただいま混み合っています。しばらくしてから再試行してください'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+
+
+rate_limiter = RateLimiter()
+
+
+def _json_field(name):
+    def key():
+        data = request.get_json(silent=True)
+        value = data.get(name) if isinstance(data, dict) else None
+        return value.strip().lower() if isinstance(value, str) else None
+    return key
+
+
+def _jwt_user():
+    return get_jwt_identity()
+
+
+def _status(code):
+    def matches(response):
+        return response.status_code == code
+    return matches
+
+
+# ユーザーごとの制限のキー（per_user_key に渡す）
+BY_EMAIL = _json_field('email')
+BY_JWT_USER = _jwt_user
+# ユーザーごとの制限でトークンを使う応答（charge_user_if に渡す）
+ON_AUTH_FAILURE = _status(401)
+
+
+def rate_limit(scope, per_user_key=None, charge_user_if=None):
+    """
+    ルート関数にレート制限をかけるデコレーター
+    
+    RATE_LIMIT_<SCOPE>_PER_IP はクライアントIPごと、
+    RATE_LIMIT_<SCOPE>_PER_USER は per_user_key() の値（メールアドレス・ユーザーIDなど）ごとに数える。
+    charge_user_if を指定すると、ユーザーごとのトークンは応答がそれに当てはまったときだけ使う
+    （ログイン失敗だけを数え、他人がメールアドレスを指定して本人を締め出せないように）。
+    JWTのユーザーを使う場合は @jwt_required() の内側に置く
+    """
+    prefix = f'RATE_LIMIT_{scope.upper()}'
+    
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            user_key = per_user_key() if per_user_key is not None else None
+            allowed, retry_after = rate_limiter.hit(f'{prefix}_PER_IP', client_ip())
+            if allowed and user_key is not None:
+                allowed, retry_after = rate_limiter.hit(f'{prefix}_PER_USER', user_key, consume=charge_user_if is None)
+            if not allowed:
+                logger.info('レート制限', extra={'scope': scope, 'retry_after': round(retry_after, 1)})
+                return _too_many(retry_after, 'リクエストが多すぎます。しばらくしてから再試行してください')
+            if charge_user_if is None or user_key is None:
+                return fn(*args, **kwargs)
+            
+            response = current_app.make_response(fn(*args, **kwargs))
+            if charge_user_if(response):
+                rate_limiter.hit(f'{prefix}_PER_USER', user_key)
+            return response
+        
+        # 負荷制限で重いAPIとして扱う目印
+        wrapper.rate_limited = True
+        return wrapper
+    return decorator
@@ -0,0 +1,343 @@
+"""
+リクエストごとの性能計測
+
+1リクエストの処理時間・SQLの実行数と時間・Stripe呼び出し時間・bcrypt時間を記録し、
+- Server-Timing ヘッダーで返す（ブラウザの開発者ツールで内訳が見える）
+- 同じSQLが METRICS_N_PLUS_ONE_THRESHOLD 回を超えて実行されたら N+1 の疑いとしてログに出す
+- エンドポイントごとのヒストグラムに加算し、/metrics で Prometheus のテキスト形式で返す
+- DB接続プールの取得待ち時間（TimedQueuePool）も同じファイルのヒストグラムに加算する
+
+ヒストグラムは METRICS_DIR のファイルを全Gunicornワーカーで mmap して共有するため、
+どのワーカーが /metrics に応答しても全ワーカーの合計になる。
+ファイルへの加算はプロセス間ロック（flock）が要るため、各ワーカーはプロセス内で溜めて
+METRICS_FLUSH_INTERVAL 秒経った後のリクエストと終了時にまとめて書き込む（リクエストごとのシステムコールでGILを手放すと、
+スレッドワーカーではGILの取り直し待ちで他のリクエストが遅れる）。
+ファイルのレイアウト（エンドポイント一覧・バケット）が変わると別ファイルになる。
+"""
+import atexit
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from app.utils.shared_memory import SharedCounterArray
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+STATUS_CLASSES = ('2xx', '3xx', '4xx', '5xx')
+COMPONENTS = ('db', 'stripe', 'bcrypt')
+UNMATCHED = 'unmatched'
+# 時間の合計はマイクロ秒の整数で持つ
+_MICROS = 1_000_000
+
+
+class RequestTiming:
+    """1リクエスト分の計測値"""
+    __slots__ = ('started', 'queries', 'seconds', 'statements')
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.seconds = dict.fromkeys(COMPONENTS, 0.0)
+        self.statements = {}
+    
+    def add_query(self, statement, seconds):
+        self.queries += 1
+        self.seconds['db'] += seconds
+        self.statements[statement] = self.statements.get(statement, 0) + 1
+    
+    def most_repeated(self):
+        """最も多く実行されたSQLとその回数"""
+        if not self.statements:
+            return None, 0
+        statement = max(self.statements, key=self.statements.get)
+        return statement, self.statements[statement]
+
+
+def _current():
+    return g.get('_request_timing') if has_app_context() else None
+
+
+def _bucket_index(buckets, value):
+    """value が入る最初のバケット（どれにも入らなければ len(buckets) = +Inf）"""
+    for index, bound in enumerate(buckets):
+        if value <= bound:
+            return index
+    return len(buckets)
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsStore:
+    """
+    エンドポイント別ヒストグラムの共有カウンター上の配置
+    
+    エンドポイントごとに次の順で並べる:
+    - 処理時間: ステータス区分ごとに バケット（+Inf含む、累積しない） + 合計（μs）
+    - SQL数: バケット（+Inf含む） + 合計
+    - 内訳（db / stripe / bcrypt）の合計時間（μs）
+    - N+1 の疑いがあったリクエスト数
+    
+    最後に、全エンドポイント共通の接続プール取得待ち時間: バケット（+Inf含む） + 合計（μs）
+    """
+    
+    def __init__(self, directory, endpoints, flush_interval=1.0):
+        self.flush_interval = flush_interval
+        self.endpoints = sorted(set(endpoints) | {UNMATCHED})
+        self._duration_width = len(DURATION_BUCKETS) + 2
+        self._query_width = len(QUERY_BUCKETS) + 2
+        self._duration_offset = 0
+        self._query_offset = self._duration_width * len(STATUS_CLASSES)
+        self._component_offset = self._query_offset + self._query_width
+        self._n_plus_one_offset = self._component_offset + len(COMPONENTS)
+        self._block = self._n_plus_one_offset + 1
+        self._bases = {endpoint: i * self._block for i, endpoint in enumerate(self.endpoints)}
+        self._pool_offset = self._block * len(self.endpoints)
+        self._pool_width = len(POOL_WAIT_BUCKETS) + 2
+        
+        layout = repr((self.endpoints, DURATION_BUCKETS, QUERY_BUCKETS, STATUS_CLASSES, COMPONENTS,
+                       POOL_WAIT_BUCKETS))
+        digest = hashlib.sha1(layout.encode('utf-8')).hexdigest()[:12]
+        self.counters = SharedCounterArray(
+            os.path.join(directory, f'request_metrics-{digest}.bin'),
+            self._pool_offset + self._pool_width
+        )
+        self._pending = {}
+        self._pending_pid = os.getpid()
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+    
+    def record(self, endpoint, status_code, elapsed, timing, n_plus_one):
+        base = self._bases.get(endpoint, self._bases[UNMATCHED])
+        status_index = min(max(status_code // 100 - 2, 0), len(STATUS_CLASSES) - 1)
+        duration = base + self._duration_offset + status_index * self._duration_width
+        query = base + self._query_offset
+        component = base + self._component_offset
+        deltas = [
+            (duration + _bucket_index(DURATION_BUCKETS, elapsed), 1),
+            (duration + len(DURATION_BUCKETS) + 1, int(elapsed * _MICROS)),
+            (query + _bucket_index(QUERY_BUCKETS, timing.queries), 1),
+            (query + len(QUERY_BUCKETS) + 1, timing.queries),
+        ]
+        deltas.extend(
+            (component + i, int(timing.seconds[name] * _MICROS))
+            for i, name in enumerate(COMPONENTS) if timing.seconds[name]
+        )
+        if n_plus_one:
+            deltas.append((base + self._n_plus_one_offset, 1))
+        self._add(deltas)
+    
+    def record_pool_wait(self, seconds):
+        """接続プールからの接続取得1回分の待ち時間"""
+        self._add([
+            (self._pool_offset + _bucket_index(POOL_WAIT_BUCKETS, seconds), 1),
+            (self._pool_offset + len(POOL_WAIT_BUCKETS) + 1, int(seconds * _MICROS)),
+        ])
+    
+    def _add(self, deltas):
+        with self._lock:
+            pending = self._own_pending()
+            for index, delta in deltas:
+                pending[index] = pending.get(index, 0) + delta
+            due = time.monotonic() - self._flushed_at >= self.flush_interval
+        if due:
+            self.flush()
+    
+    def _own_pending(self):
+        # fork前（preload_app のウォームアップ）に溜めた分は親の分なので子では捨てる
+        pid = os.getpid()
+        if self._pending_pid != pid:
+            self._pending = {}
+            self._pending_pid = pid
+        return self._pending
+    
+    def flush(self):
+        """このプロセスで溜めた値を共有ファイルに加算"""
+        with self._lock:
+            pending = self._own_pending()
+            self._pending = {}
+            self._flushed_at = time.monotonic()
+        if pending:
+            self.counters.add(pending.items())
+    
+    def _histogram(self, lines, name, labels, buckets, values, scale=1):
+        """非累積のバケット値 → Prometheus のヒストグラム（件数0のシリーズは出さない）"""
+        count = sum(values[:len(buckets) + 1])
+        if not count:
+            return
+        prefix = f'{labels},' if labels else ''
+        suffix = f'{{{labels}}}' if labels else ''
+        cumulative = 0
+        for bound, value in zip((*buckets, None), values):
+            cumulative += value
+            le = '+Inf' if bound is None else repr(float(bound))
+            lines.append(f'{name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+        total = values[len(buckets) + 1]
+        lines.append(f'{name}_sum{suffix} {total / scale if scale != 1 else total}')
+        lines.append(f'{name}_count{suffix} {count}')
+    
+    def render(self):
+        """全ワーカー合計を Prometheus のテキスト形式で返す"""
+        self.flush()
+        values = self.counters.snapshot()
+        duration_lines, query_lines, component_lines, n_plus_one_lines = [], [], [], []
+        for endpoint in self.endpoints:
+            base = self._bases[endpoint]
+            label = f'endpoint="{_escape(endpoint)}"'
+            for i, status in enumerate(STATUS_CLASSES):
+                start = base + self._duration_offset + i * self._duration_width
+                self._histogram(duration_lines, 'http_request_duration_seconds', f'{label},status="{status}"',
+                                DURATION_BUCKETS, values[start:start + self._duration_width], _MICROS)
+            start = base + self._query_offset
+            self._histogram(query_lines, 'http_request_sql_queries', label,
+                            QUERY_BUCKETS, values[start:start + self._query_width])
+            for i, name in enumerate(COMPONENTS):
+                micros = values[base + self._component_offset + i]
+                if micros:
+                    component_lines.append(
+                        f'http_request_component_seconds_total{{{label},component="{name}"}} {micros / _MICROS}'
+                    )
+            n_plus_one = values[base + self._n_plus_one_offset]
+            if n_plus_one:
+                n_plus_one_lines.append(f'http_request_n_plus_one_total{{{label}}} {n_plus_one}')
+        pool_lines = []
+        self._histogram(pool_lines, 'db_pool_checkout_wait_seconds', '', POOL_WAIT_BUCKETS,
+                        values[self._pool_offset:self._pool_offset + self._pool_width], _MICROS)
+        
+        lines = [
+            '# HELP http_request_duration_seconds リクエストの処理時間（レスポンス本体のストリーミングを除く）',
+            '# TYPE http_request_duration_seconds histogram',
+            *duration_lines,
+            '# HELP http_request_sql_queries 1リクエストで実行したSQLの数',
+            '# TYPE http_request_sql_queries histogram',
+            *query_lines,
+            '# HELP http_request_component_seconds_total 処理時間のうちDB・Stripe・bcryptにかかった時間の合計',
+            '# TYPE http_request_component_seconds_total counter',
+            *component_lines,
+            '# HELP http_request_n_plus_one_total 同じSQLを閾値を超えて繰り返したリクエストの数',
+            '# TYPE http_request_n_plus_one_total counter',
+            *n_plus_one_lines,
+            '# HELP db_pool_checkout_wait_seconds DB接続プールから接続を取得するまでの待ち時間（全エンジン合計）',
+            '# TYPE db_pool_checkout_wait_seconds histogram',
+            *pool_lines,
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    """リクエスト計測のフックと、ワーカー間で共有するヒストグラム"""
+    
+    def __init__(self, app=None):
+        self.enabled = True
+        self.server_timing = True
+        self.n_plus_one_threshold = 10
+        self.directory = None
+        self.flush_interval = 1.0
+        self._store = None
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """db.init_app() の後に呼ぶ（エンジンにSQLの計測イベントを登録する）"""
+        self.enabled = app.config['METRICS_ENABLED']
+        self.server_timing = app.config['SERVER_TIMING_ENABLED']
+        self.n_plus_one_threshold = app.config['METRICS_N_PLUS_ONE_THRESHOLD']
+        self.directory = app.config['METRICS_DIR']
+        self.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+        self._store = None
+        app.extensions['request_metrics'] = self
+        if not self.enabled:
+            return
+        
+        from app.models import db
+        with app.app_context():
+            for engine in db.engines.values():
+                if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+                    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+                    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+    
+    def store(self, app):
+        """ヒストグラムの共有カウンター（エンドポイント一覧が確定した最初の使用時に作る）"""
+        if self._store is None:
+            self._store = MetricsStore(
+                self.directory,
+                [rule.endpoint for rule in app.url_map.iter_rules()],
+                self.flush_interval
+            )
+        return self._store
+    
+    def flush(self):
+        """溜めている値を共有ファイルに書き出す（ワーカー終了時）"""
+        if self._store is not None:
+            self._store.flush()
+    
+    def record_pool_wait(self, seconds):
+        """接続プールの取得待ち時間をワーカー間で共有するヒストグラムに加算（TimedQueuePool から呼ぶ）"""
+        if self.enabled and self.directory and has_app_context():
+            self.store(current_app).record_pool_wait(seconds)
+    
+    @contextmanager
+    def timed(self, component):
+        """ブロックの実行時間をリクエストの内訳（stripe / bcrypt）に加算"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            timing = _current()
+            if timing is not None:
+                timing.seconds[component] += time.perf_counter() - started
+    
+    def _before_request(self):
+        g._request_timing = RequestTiming()
+    
+    def _after_request(self, response):
+        timing = g.pop('_request_timing', None)
+        if timing is None:
+            return response
+        elapsed = time.perf_counter() - timing.started
+        
+        statement, repeated = timing.most_repeated()
+        n_plus_one = repeated > self.n_plus_one_threshold
+        if n_plus_one:
+            current_app.logger.warning(
+                'N+1の疑い: %s %s で同じSQLを%d回実行（全%d回）: %s',
+                request.method, request.path, repeated, timing.queries, ' '.join(statement.split())[:300]
+            )
+        
+        if self.server_timing:
+            entries = [
+                f'app;dur={elapsed * 1000:.1f}',
+                f'db;dur={timing.seconds["db"] * 1000:.1f};desc="{timing.queries} queries"',
+            ]
+            entries.extend(
+                f'{name};dur={timing.seconds[name] * 1000:.1f}'
+                for name in ('stripe', 'bcrypt') if timing.seconds[name]
+            )
+            response.headers['Server-Timing'] = ', '.join(entries)
+        
+        self.store(current_app).record(request.endpoint or UNMATCHED, response.status_code, elapsed,
+                                       timing, n_plus_one)
+        return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timing = _current()
+    started = getattr(context, '_metrics_started', None)
+    if timing is not None and started is not None:
+        timing.add_query(statement, time.perf_counter() - started)
+
+
+request_metrics = RequestMetrics()
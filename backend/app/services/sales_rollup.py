@@ -0,0 +1,171 @@
+"""
+売上の日別集計（ロールアップ）
+
+注文作成と同じトランザクションで、日別・商品×日別・カテゴリ×日別の集計行に
+数量・売上・注文数を加算する（INSERT ... ON CONFLICT DO UPDATE で原子的に加算）。
+注文がキャンセルされたら同じ値を減算するため、集計は「キャンセルされていない注文」の合計になる。
+分析APIは注文テーブルを走査せず、期間内の集計行だけを読む。
+
+集計日は注文日時（UTC）に ANALYTICS_UTC_OFFSET_HOURS を足した日付。
+カテゴリは注文時点のもの（order_items.category）。商品のカテゴリが後から変わっても、
+キャンセル・作り直しで注文時と同じ集計行を使う。
+過去分の作り直しは backfill()（flask analytics backfill）で行う。
+"""
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models import db, Order, OrderItem, Product, DailySales, DailyProductSales, DailyCategorySales
+
+_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+
+def _offset():
+    return timedelta(hours=current_app.config['ANALYTICS_UTC_OFFSET_HOURS'])
+
+
+def sales_day(created_at):
+    """注文日時（UTC）→ 集計日"""
+    return (created_at + _offset()).date()
+
+
+def day_start(day):
+    """集計日の始まり（UTC）"""
+    return datetime(day.year, day.month, day.day) - _offset()
+
+
+def _aggregate(orders):
+    """
+    注文の明細を集計キーごとに合計する
+    
+    orders: [(集計日, [(商品ID, 数量, 単価, カテゴリ), ...]), ...]
+    戻り値: (日別, 商品×日別, カテゴリ×日別) の {キー: [数量, 売上, 注文数]}
+    """
+    daily, by_product, by_category = {}, {}, {}
+    for day, lines in orders:
+        product_keys, category_keys = set(), set()
+        total = daily.setdefault(day, [0, 0.0, 0])
+        total[2] += 1
+        for product_id, quantity, price, category in lines:
+            revenue = price * quantity
+            total[0] += quantity
+            total[1] += revenue
+            for key, rows, seen in (
+                ((day, product_id), by_product, product_keys),
+                ((day, category or ''), by_category, category_keys),
+            ):
+                row = rows.setdefault(key, [0, 0.0, 0])
+                row[0] += quantity
+                row[1] += revenue
+                # 同じ注文内の同じ商品・カテゴリは注文数1とする
+                if key not in seen:
+                    seen.add(key)
+                    row[2] += 1
+    return daily, by_product, by_category
+
+
+def _add(model, key_names, totals, sign):
+    """集計行に加算（なければ作成）。キー順に書き込み、並行する注文同士のデッドロックを避ける"""
+    if not totals:
+        return
+    insert = _INSERTS[db.session.get_bind().dialect.name]
+    rows = [
+        dict(zip(key_names, key), units=sign * units, revenue=sign * revenue, order_count=sign * orders)
+        for key, (units, revenue, orders) in sorted(totals.items())
+    ]
+    # ORMの一括INSERTを通さず、テーブルに対する executemany にする
+    table = model.__table__
+    statement = insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(key_names),
+        set_={
+            'units': table.c.units + statement.excluded.units,
+            'revenue': table.c.revenue + statement.excluded.revenue,
+            'order_count': table.c.order_count + statement.excluded.order_count,
+        }
+    )
+    db.session.execute(statement, rows)
+
+
+def _write(orders, sign):
+    daily, by_product, by_category = _aggregate(orders)
+    _add(DailySales, ('day',), {(day,): v for day, v in daily.items()}, sign)
+    _add(DailyProductSales, ('day', 'product_id'), by_product, sign)
+    _add(DailyCategorySales, ('day', 'category'), by_category, sign)
+
+
+def product_categories(product_ids):
+    """{商品ID: 現在のカテゴリ}（注文作成時に明細へ記録する）"""
+    rows = db.session.execute(
+        select(Product.id, Product.category).where(Product.id.in_(sorted(product_ids)))
+    )
+    return dict(rows.all())
+
+
+def record_order(created_at, lines, sign=1):
+    """
+    1件の注文を集計に反映（呼び出し側のトランザクション内で実行）
+    
+    lines: [(商品ID, 数量, 単価, カテゴリ), ...]（カテゴリは注文時点のもの）
+    sign: 1 なら加算（注文作成）、-1 なら減算（キャンセル）
+    """
+    lines = list(lines)
+    if not lines:
+        return
+    _write([(sales_day(created_at), lines)], sign)
+
+
+def backfill(start=None, end=None, chunk_days=7):
+    """
+    注文履歴から集計を作り直す（start〜end の集計日。未指定なら注文の最初〜最後）
+    
+    chunk_days 日ずつ、その期間の集計行を削除 → キャンセル以外の注文明細を集計して書き込み → コミット。
+    期間ごとに1トランザクションのため、途中で止めても済んだ期間の集計は正しい。
+    戻り値: 処理した注文数
+    """
+    if chunk_days < 1:
+        raise ValueError('chunk_days は1以上にしてください')
+    if start is None or end is None:
+        first, last = db.session.execute(
+            select(func.min(Order.created_at), func.max(Order.created_at))
+        ).one()
+        if first is None:
+            return 0
+        start = start or sales_day(first)
+        end = end or sales_day(last)
+    
+    processed = 0
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+        for model in (DailySales, DailyProductSales, DailyCategorySales):
+            db.session.execute(delete(model).where(model.day >= chunk_start, model.day <= chunk_end))
+        
+        # 明細を流しながら読み、注文ごとにまとめる（カテゴリは注文時点のもの。記録前の明細は現在の商品のもの）
+        rows = db.session.execute(
+            select(Order.id, Order.created_at, OrderItem.product_id, OrderItem.quantity,
+                   OrderItem.price, func.coalesce(OrderItem.category, Product.category))
+            .join(OrderItem, OrderItem.order_id == Order.id)
+            .outerjoin(Product, Product.id == OrderItem.product_id)
+            .where(
+                Order.created_at >= day_start(chunk_start),
+                Order.created_at < day_start(chunk_end + timedelta(days=1)),
+                Order.status != 'cancelled'
+            )
+            .execution_options(yield_per=5000)
+        )
+        orders = {}
+        for order_id, created_at, product_id, quantity, price, category in rows:
+            order = orders.get(order_id)
+            if order is None:
+                order = orders[order_id] = (sales_day(created_at), [])
+            order[1].append((product_id, quantity, price, category))
+        _write(orders.values(), 1)
+        db.session.commit()
+        
+        processed += len(orders)
+        chunk_start = chunk_end + timedelta(days=1)
+    return processed
@@ -0,0 +1,254 @@
+"""
+商品検索のワーカー内インデックス
+
+商品名・カテゴリ・説明を正規化し、文字bigram（2文字ずつ）の転置インデックスを作る。
+日本語は単語に分かち書きできないため、単語ではなく文字の並びで引く。
+- 正規化: NFKC（全角英数・半角カナを統一）、大文字小文字、カタカナ → ひらがな
+- 検索語の各bigramを含む商品に絞り込んでから、部分一致を確認して順位付けする
+
+商品の作成・更新・削除ルートからそのワーカーのインデックスを直接更新し、
+他のワーカーはカタログバージョン（catalog_cache.version）の変化を見て、
+updated_at 以降に変わった商品だけを取り込み直す。
+削除は updated_at に残らないため、全ワーカーで共有する削除回数（SEARCH_DELETIONS_FILE）が
+変わったときだけ商品IDの集合を突き合わせて取り除く。
+"""
+import heapq
+import re
+import threading
+import unicodedata
+from array import array
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from app.models import db, Product
+from app.services.catalog_cache import catalog_cache
+from app.utils.shared_memory import SharedCounter
+
+# カタカナ（ァ〜ヶ）→ ひらがな
+_KANA_FOLD = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+_SEPARATORS = re.compile(r'[\W_]+')
+_FIELD_SEPARATOR = '\x1f'
+
+# フィールドごとの重み（商品名・カテゴリ・説明の順に探し、最初に一致したもの）
+NAME_WEIGHT = 10
+NAME_PREFIX_BONUS = 5
+CATEGORY_WEIGHT = 5
+DESCRIPTION_WEIGHT = 2
+
+
+def normalize(text):
+    """検索用に正規化"""
+    return unicodedata.normalize('NFKC', text or '').casefold().translate(_KANA_FOLD)
+
+
+def segments(normalized):
+    """空白・記号で区切った語のリスト"""
+    return [s for s in _SEPARATORS.split(normalized) if s]
+
+
+def bigrams(normalized):
+    """文字bigramの集合（1文字だけの語はその文字）"""
+    grams = set()
+    for segment in segments(normalized):
+        if len(segment) == 1:
+            grams.add(segment)
+        else:
+            grams.update(segment[i:i + 2] for i in range(len(segment) - 1))
+    return grams
+
+
+class SearchIndex:
+    """
+    文字bigramの転置インデックス
+    
+    ポスティング（bigram → 商品ID）は追記のみの array で持ち、メモリを抑える。
+    更新・削除で古くなったポスティングは残るが、検索時に正規化済みテキストとの
+    部分一致で確認するため結果には出ない（テキストが変わった分だけ追記する）。
+    """
+    
+    def __init__(self, app=None):
+        self.sync_overlap = timedelta(seconds=5)
+        self._postings = {}       # bigram → 商品IDの array
+        self._grams_by_char = {}  # 文字 → その文字を含むbigramの集合（1文字検索用）
+        self._docs = {}           # 商品ID → (正規化テキスト, 商品名の終端, カテゴリの終端)
+        self._built = False
+        self.deletions = None
+        self._version = None
+        self._deletions = None
+        self._synced_at = None
+        self._lock = threading.RLock()
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.sync_overlap = timedelta(seconds=app.config['SEARCH_SYNC_OVERLAP'])
+        self.deletions = SharedCounter(app.config['SEARCH_DELETIONS_FILE'])
+        app.extensions['search_index'] = self
+    
+    def _put(self, product_id, name, category, description):
+        name, category = normalize(name), normalize(category)
+        # フィールドは区切り文字（検索語には含まれない）でつないで1つの文字列にする
+        text = f'{name}{_FIELD_SEPARATOR}{category}{_FIELD_SEPARATOR}{normalize(description)}'
+        old = self._docs.get(product_id)
+        if old is not None and old[0] == text:
+            return
+        self._docs[product_id] = (text, len(name), len(name) + 1 + len(category))
+        
+        grams = bigrams(text)
+        if old is not None:
+            # 既に追記済みのbigramは追記しない（在庫だけの更新ではポスティングは増えない）
+            grams -= bigrams(old[0])
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is None:
+                posting = self._postings[gram] = array('i')
+                for char in set(gram):
+                    self._grams_by_char.setdefault(char, set()).add(gram)
+            posting.append(product_id)
+    
+    def upsert(self, product):
+        """商品の追加・更新を反映（作成・更新ルートからコミット後に呼ぶ）"""
+        with self._lock:
+            if self._built:
+                self._put(product.id, product.name, product.category, product.description)
+    
+    def remove(self, product_id):
+        """商品の削除を反映（削除ルートからコミット後に呼ぶ）。他のワーカーには削除回数で知らせる"""
+        self.deletions.increment()
+        with self._lock:
+            self._docs.pop(product_id, None)
+    
+    def build(self):
+        """全商品からインデックスを作り直す（アプリコンテキスト内で呼ぶ）"""
+        with self._lock:
+            version = catalog_cache.version.value
+            deletions = self.deletions.value
+            started = datetime.utcnow()
+            self._postings = {}
+            self._grams_by_char = {}
+            self._docs = {}
+            rows = db.session.execute(
+                select(Product.id, Product.name, Product.category, Product.description)
+                .execution_options(yield_per=5000)
+            )
+            for row in rows:
+                self._put(*row)
+            self._built = True
+            self._version = version
+            self._deletions = deletions
+            self._synced_at = started
+    
+    def sync(self):
+        """
+        カタログバージョンが変わっていれば、他のワーカーでの変更を取り込む
+        
+        前回の同期以降に updated_at が変わった商品を入れ直す。削除回数が変わった（またはDBを直接変更して
+        件数が合わない）ときは、商品IDの集合を突き合わせて削除分を取り除く。
+        ワーカー間の時刻やコミット順のずれに備え、sync_overlap だけ遡って取り込む
+        """
+        version = catalog_cache.version.value
+        if self._built and version == self._version:
+            return
+        with self._lock:
+            if not self._built:
+                self.build()
+                return
+            if version == self._version:
+                return
+            deletions = self.deletions.value
+            started = datetime.utcnow()
+            rows = db.session.execute(
+                select(Product.id, Product.name, Product.category, Product.description)
+                .where(Product.updated_at >= self._synced_at - self.sync_overlap)
+            ).all()
+            for row in rows:
+                self._put(*row)
+            
+            # 削除と追加が同数だと件数は変わらないため、件数だけでは削除を見落とす
+            deleted = deletions != self._deletions
+            if deleted or db.session.execute(select(func.count(Product.id))).scalar() != len(self._docs):
+                existing = set(db.session.execute(select(Product.id)).scalars())
+                for product_id in self._docs.keys() - existing:
+                    del self._docs[product_id]
+            self._version = version
+            self._deletions = deletions
+            self._synced_at = started
+    
+    def _term_candidates(self, term):
+        if len(term) == 1:
+            grams = self._grams_by_char.get(term, ())
+            return set().union(*(self._postings[g] for g in grams))
+        postings = []
+        for gram in bigrams(term):
+            posting = self._postings.get(gram)
+            if not posting:
+                return set()
+            postings.append(posting)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+        return candidates
+    
+    def search(self, query, limit):
+        """
+        検索して (総ヒット数, 上位limit件の商品IDリスト) を返す
+        
+        空白区切りの語はすべて含む（AND）。各語は商品名 > カテゴリ > 説明 の順に重く、
+        商品名の先頭一致は加点する。同点は新しい商品（IDが大きい）を先にする
+        """
+        terms = segments(normalize(query))
+        if not terms:
+            return 0, []
+        self.sync()
+        
+        with self._lock:
+            candidates = None
+            for term in sorted(terms, key=len, reverse=True):
+                found = self._term_candidates(term)
+                candidates = found if candidates is None else candidates & found
+                if not candidates:
+                    return 0, []
+            
+            # bigramがすべて含まれていても連続しているとは限らず、古いポスティングも残っているため、
+            # 現在のテキストとの部分一致を確認する。最初に現れる位置でどのフィールドかを判定
+            docs = self._docs
+            scored = []
+            for product_id in candidates:
+                doc = docs.get(product_id)
+                if doc is None:
+                    continue
+                text, name_end, category_end = doc
+                score = 0
+                for term in terms:
+                    position = text.find(term)
+                    if position < 0:
+                        break
+                    if position == 0:
+                        score += NAME_WEIGHT + NAME_PREFIX_BONUS
+                    elif position < name_end:
+                        score += NAME_WEIGHT
+                    elif position < category_end:
+                        score += CATEGORY_WEIGHT
+                    else:
+                        score += DESCRIPTION_WEIGHT
+                else:
+                    scored.append((score, product_id))
+        
+        top = heapq.nlargest(limit, scored)
+        return len(scored), [product_id for _, product_id in top]
+    
+    def stats(self):
+        """監視用の統計情報（このワーカー分）"""
+        with self._lock:
+            return {
+                'built': self._built,
+                'documents': len(self._docs),
+                'grams': len(self._postings),
+                'postings': sum(len(p) for p in self._postings.values()),
+                'version': self._version,
+            }
+
+
+search_index = SearchIndex()
@@ -0,0 +1,359 @@
+"""
+Stripe Webhookイベントの記録と非同期処理
+
+Webhookはイベントを stripe_events テーブルに記録（イベントIDで重複排除）して即座に200を返す。
+処理はワーカー内のバックグラウンドスレッドが行い、テーブルをキューとして使う。
+複数ワーカーが同じイベントを処理しないよう、条件付きUPDATEでイベントを確保してから処理する。
+
+- payment_intent.succeeded: 保留中（pending）の注文を確定（paid）。金額不一致ならキャンセルして在庫を戻す
+- payment_intent.payment_failed / canceled: 保留中の注文をキャンセルして在庫を戻す
+（キャンセル時は売上集計からも差し引く）
+
+同じPaymentIntentに複数のイベントがあれば、反映するのは1件だけ:
+succeeded があればそれ（失敗の後に再試行で成功することがあるため、到着順によらず成功を優先）、
+なければ最も新しい（created_at）もの。payment_failed は、そのイベントより前に作成された注文だけをキャンセルする
+（それより後の注文は、失敗後の再試行に対するもの）
+
+STRIPE_PENDING_ORDER_TTL を過ぎても確定しない保留中の注文は、Stripeに状態を問い合わせて片付ける
+（存在しないPaymentIntentのIDで作られた注文が在庫を押さえ続けないように）
+"""
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from app.models import db, Order, StripeEvent
+from app.services.catalog_cache import catalog_cache
+from app.services.inventory import release_stock
+from app.services.sales_rollup import record_order
+from app.services.stripe_gateway import stripe_gateway, PaymentGatewayError, ResourceMissingError
+
+logger = logging.getLogger(__name__)
+
+SUCCEEDED = 'payment_intent.succeeded'
+PAYMENT_FAILED = 'payment_intent.payment_failed'
+HANDLED_TYPES = (
+    SUCCEEDED,
+    PAYMENT_FAILED,
+    'payment_intent.canceled',
+)
+# 期限切れでも、お金が動いている途中なのでキャンセルせずに待つPaymentIntentの状態
+_IN_FLIGHT_STATUSES = ('processing', 'requires_capture')
+
+
+def record_event(payload):
+    """
+    署名検証済みのイベント（JSON文字列）を記録
+    
+    戻り値: 新規ならTrue、処理済み・記録済みの重複イベントならFalse
+    """
+    event = json.loads(payload)
+    data_object = event.get('data', {}).get('object', {})
+    payment_intent_id = data_object.get('id') if data_object.get('object') == 'payment_intent' else None
+    
+    row = StripeEvent(
+        id=event['id'],
+        type=event['type'],
+        payment_intent_id=payment_intent_id,
+        payload=payload,
+        # 扱わない種類のイベントは記録のみ
+        status='pending' if event['type'] in HANDLED_TYPES else 'processed'
+    )
+    db.session.add(row)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return row.status == 'pending'
+
+
+def _claim(event_id, stale_before):
+    """イベントを処理中として確保（他ワーカーが確保済みならFalse）"""
+    result = db.session.execute(
+        update(StripeEvent)
+        .where(
+            StripeEvent.id == event_id,
+            or_(
+                StripeEvent.status == 'pending',
+                # 処理中のままワーカーが落ちたイベントは再確保できる
+                (StripeEvent.status == 'processing') & (StripeEvent.claimed_at < stale_before)
+            )
+        )
+        .values(status='processing', claimed_at=datetime.utcnow(), attempts=StripeEvent.attempts + 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _cancel_order(order):
+    """保留中の注文をキャンセルして在庫を戻す"""
+    quantities = {}
+    for item in order.items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    release_stock(quantities)
+    record_order(order.created_at, [
+        (item.product_id, item.quantity, item.price, item.category) for item in order.items
+    ], sign=-1)
+    order.status = 'cancelled'
+
+
+def _superseded(row):
+    """同じPaymentIntentに、このイベントより優先するイベント（成功・より新しいもの）があればTrue"""
+    if row.type == SUCCEEDED or row.payment_intent_id is None:
+        return False
+    newer = or_(StripeEvent.type == SUCCEEDED, StripeEvent.created_at > row.created_at)
+    return db.session.query(StripeEvent.id).filter(
+        StripeEvent.payment_intent_id == row.payment_intent_id,
+        StripeEvent.id != row.id,
+        StripeEvent.type.in_(HANDLED_TYPES),
+        # 処理を諦めたイベントは数えない（処理待ちの成功イベントは数える）
+        StripeEvent.status != 'failed',
+        newer
+    ).first() is not None
+
+
+def _apply(event, received_at):
+    """イベント内容を注文に反映（呼び出し側でcommit）。在庫が変わればTrue"""
+    intent = event['data']['object']
+    pending_orders = Order.query.filter_by(
+        stripe_payment_intent_id=intent['id'],
+        status='pending'
+    ).all()
+    return _apply_to_orders(event, pending_orders, received_at)
+
+
+def _apply_to_orders(event, pending_orders, received_at):
+    intent = event['data']['object']
+    stock_changed = False
+    if event['type'] == SUCCEEDED:
+        # 注文作成より先にイベントが届いた場合に備えて、検証済みとして記録
+        stripe_gateway.remember_succeeded(intent['id'], intent['amount'])
+        for order in pending_orders:
+            if int(order.total) == intent['amount']:
+                order.status = 'paid'
+            else:
+                _cancel_order(order)
+                stock_changed = True
+    else:
+        for order in pending_orders:
+            if event['type'] == PAYMENT_FAILED and order.created_at > received_at:
+                continue  # 失敗後の再試行に対する注文
+            _cancel_order(order)
+            stock_changed = True
+    return stock_changed
+
+
+def process_event(event_id):
+    """1件のイベントを処理。確保できなければ何もしない"""
+    stale_before = datetime.utcnow() - timedelta(seconds=current_app.config['STRIPE_EVENT_CLAIM_TIMEOUT'])
+    if not _claim(event_id, stale_before):
+        return False
+    
+    row = db.session.get(StripeEvent, event_id)
+    try:
+        # 優先するイベントがあれば、記録だけして反映しない
+        stock_changed = False if _superseded(row) else _apply(json.loads(row.payload), row.created_at)
+        row.status = 'processed'
+        row.processed_at = datetime.utcnow()
+        row.last_error = None
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        row = db.session.get(StripeEvent, event_id)
+        max_attempts = current_app.config['STRIPE_EVENT_MAX_ATTEMPTS']
+        row.status = 'failed' if row.attempts >= max_attempts else 'pending'
+        row.last_error = str(e)
+        db.session.commit()
+        return False
+    
+    if stock_changed:
+        catalog_cache.invalidate(stock_only=True)
+    return True
+
+
+def drain(limit=100):
+    """処理待ちのイベントを古い順に処理。処理した件数を返す"""
+    stale_before = datetime.utcnow() - timedelta(seconds=current_app.config['STRIPE_EVENT_CLAIM_TIMEOUT'])
+    event_ids = [
+        row.id for row in db.session.query(StripeEvent.id)
+        .filter(or_(
+            StripeEvent.status == 'pending',
+            (StripeEvent.status == 'processing') & (StripeEvent.claimed_at < stale_before)
+        ))
+        .order_by(StripeEvent.created_at)
+        .limit(limit)
+        .all()
+    ]
+    processed = sum(1 for event_id in event_ids if process_event(event_id))
+    _reconcile_pending_orders()
+    return processed
+
+
+def _decisive_events(payment_intent_ids):
+    """PaymentIntentごとに反映する処理済みイベント（成功があればそれ、なければ最新）"""
+    rows = (
+        db.session.query(StripeEvent)
+        .filter(
+            StripeEvent.payment_intent_id.in_(payment_intent_ids),
+            StripeEvent.status == 'processed',
+            StripeEvent.type.in_(HANDLED_TYPES)
+        )
+        .order_by(StripeEvent.created_at.desc(), StripeEvent.id.desc())
+        .all()
+    )
+    decisive = {}
+    for row in rows:
+        current = decisive.get(row.payment_intent_id)
+        if current is None or (row.type == SUCCEEDED and current.type != SUCCEEDED):
+            decisive[row.payment_intent_id] = row
+    return decisive
+
+
+def _reconcile_pending_orders():
+    """
+    イベント処理後に作成された保留中の注文を、処理済みイベントに合わせて確定・キャンセル
+    
+    注文作成とイベント処理がほぼ同時だった場合の取りこぼし対策
+    """
+    handled_intents = (
+        db.session.query(StripeEvent.payment_intent_id)
+        .filter(StripeEvent.status == 'processed', StripeEvent.type.in_(HANDLED_TYPES))
+    )
+    orders = Order.query.filter(
+        Order.status == 'pending',
+        Order.stripe_payment_intent_id.in_(handled_intents)
+    ).all()
+    if not orders:
+        return
+    
+    events = _decisive_events({order.stripe_payment_intent_id for order in orders})
+    stock_changed = False
+    for order in orders:
+        row = events[order.stripe_payment_intent_id]
+        stock_changed |= _apply_to_orders(json.loads(row.payload), [order], row.created_at)
+    db.session.commit()
+    if stock_changed:
+        catalog_cache.invalidate(stock_only=True)
+
+
+def expire_pending_orders(limit=100):
+    """
+    STRIPE_PENDING_ORDER_TTL を過ぎた保留中の注文をStripeに確認して確定・キャンセル。片付けた件数を返す
+    
+    成功していれば確定（金額不一致ならキャンセル）、処理中なら待ち、それ以外（存在しない・失敗など）はキャンセルして在庫を戻す。
+    Stripeに問い合わせられなければ次の回に回す
+    """
+    ttl = current_app.config['STRIPE_PENDING_ORDER_TTL']
+    if not ttl:
+        return 0
+    expired_before = datetime.utcnow() - timedelta(seconds=ttl)
+    orders = (
+        Order.query
+        .filter(Order.status == 'pending', Order.created_at < expired_before)
+        .order_by(Order.created_at)
+        .limit(limit)
+        .all()
+    )
+    
+    expired = 0
+    stock_changed = False
+    for order in orders:
+        try:
+            intent = stripe_gateway.verify_payment_intent(order.stripe_payment_intent_id)
+        except ResourceMissingError:
+            status = 'cancelled'
+        except PaymentGatewayError as e:
+            logger.warning('保留中の注文のPaymentIntentを確認できませんでした', extra={
+                'order_id': order.id, 'error': str(e)
+            })
+            continue
+        else:
+            if intent.status in _IN_FLIGHT_STATUSES:
+                continue
+            amount_matches = intent.amount is None or int(order.total) == intent.amount
+            status = 'paid' if intent.succeeded and amount_matches else 'cancelled'
+        
+        # 他のワーカー・イベント処理が先に確定させていたら何もしない
+        claimed = db.session.execute(
+            update(Order)
+            .where(Order.id == order.id, Order.status == 'pending')
+            .values(status=status)
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+        if claimed and status == 'cancelled':
+            _cancel_order(order)
+            stock_changed = True
+        db.session.commit()
+        if claimed:
+            expired += 1
+            logger.info('期限切れの保留中の注文を片付けました', extra={'order_id': order.id, 'status': status})
+    
+    if stock_changed:
+        catalog_cache.invalidate(stock_only=True)
+    return expired
+
+
+class EventConsumer:
+    """
+    ワーカー内のイベント処理スレッド
+    
+    Webhook受信時に notify() で起こされ、それ以外も一定間隔で取りこぼしと期限切れの保留中の注文を処理する。
+    スレッドは最初の notify() で起動する（Gunicornのfork後に起動させるため）
+    """
+    
+    def __init__(self, app=None):
+        self.app = None
+        self.asynchronous = True
+        self.poll_interval = 5
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.app = app
+        self.asynchronous = app.config['STRIPE_EVENTS_ASYNC']
+        self.poll_interval = app.config['STRIPE_EVENT_POLL_INTERVAL']
+        app.extensions['stripe_event_consumer'] = self
+    
+    def notify(self):
+        """新しいイベントがあることを知らせる"""
+        if not self.asynchronous:
+            # 同期モード（テスト・開発用）: その場で処理する
+            drain()
+            return
+        self._ensure_started()
+        self._wakeup.set()
+    
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name='stripe-event-consumer',
+                    daemon=True
+                )
+                self._thread.start()
+    
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            with self.app.app_context():
+                try:
+                    drain()
+                    expire_pending_orders()
+                except Exception:
+                    logger.exception('Stripeイベント処理エラー')
+                finally:
+                    db.session.remove()
+
+
+event_consumer = EventConsumer()
@@ -0,0 +1,197 @@
+"""
+Stripe APIクライアント
+
+グローバルな stripe.api_key を使わず、プロセスごとに1つの StripeClient を共有する。
+- HTTP接続はスレッドごとの requests.Session で再利用（gevent ではプロセス内の1つを共有）
+- 接続・読み込みタイムアウトを明示（遅いStripe応答でワーカーを30秒占有しない）
+- ネットワークエラーは上限付きでリトライ（stripeライブラリの指数バックオフ + ジッター）
+- 決済成功を確認したPaymentIntentは短時間キャッシュし、注文作成時の再取得を省く
+- STRIPE_API_BASE でローカルのスタブHTTPサーバーに向けられる
+- stripe パッケージの読み込みは重い（約1秒）ため、実際に使うときまで遅らせる
+"""
+import os
+import threading
+from contextlib import contextmanager
+from app.services.request_metrics import request_metrics
+from app.utils.file_cache import FileTTLCache
+from app.utils.workers import gevent_patched
+
+MOCK_INTENT_PREFIX = 'pi_mock_'
+
+
+class PaymentGatewayError(Exception):
+    """Stripe API呼び出しの失敗（stripe.error.StripeError を包む）"""
+
+
+class WebhookSignatureError(PaymentGatewayError):
+    """Webhookの署名検証に失敗"""
+
+
+class ResourceMissingError(PaymentGatewayError):
+    """指定したID（PaymentIntentなど）がStripeに存在しない"""
+
+
+@contextmanager
+def _translate_errors():
+    import stripe
+    try:
+        yield
+    except stripe.error.StripeError as e:
+        if getattr(e, 'code', None) == 'resource_missing':
+            raise ResourceMissingError(str(e)) from e
+        raise PaymentGatewayError(str(e)) from e
+
+
+class VerifiedIntent:
+    """検証済みPaymentIntentの要約"""
+    __slots__ = ('id', 'status', 'amount')
+    
+    def __init__(self, id, status, amount):
+        self.id = id
+        self.status = status
+        self.amount = amount
+    
+    @property
+    def succeeded(self):
+        return self.status == 'succeeded'
+
+
+class StripeGateway:
+    """Stripe API呼び出しの共通窓口"""
+    
+    def __init__(self, app=None):
+        self.secret_key = ''
+        self.api_base = None
+        self.timeout = (3.0, 10.0)
+        self.max_retries = 2
+        self.pool_maxsize = 10
+        self.verified_intents = None
+        self._client = None
+        self._client_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.secret_key = app.config.get('STRIPE_SECRET_KEY', '')
+        self.api_base = app.config.get('STRIPE_API_BASE') or None
+        self.timeout = (
+            app.config['STRIPE_CONNECT_TIMEOUT'],
+            app.config['STRIPE_READ_TIMEOUT']
+        )
+        self.max_retries = app.config['STRIPE_MAX_RETRIES']
+        self.pool_maxsize = app.config['STRIPE_POOL_MAXSIZE']
+        self.verified_intents = FileTTLCache(
+            app.config['STRIPE_INTENT_CACHE_DIR'],
+            app.config['STRIPE_VERIFIED_INTENT_TTL']
+        )
+        self._client = None
+        app.extensions['stripe_gateway'] = self
+    
+    @property
+    def enabled(self):
+        """本物のStripeキーが設定されているか（未設定ならモックモード）"""
+        key = self.secret_key
+        return bool(key) and key.startswith('sk_') and 'dummy' not in key.lower()
+    
+    @property
+    def client(self):
+        # fork後の子プロセスでは親の接続を使わないよう、プロセスごとに作り直す
+        pid = os.getpid()
+        if self._client is None or self._client_pid != pid:
+            with self._lock:
+                if self._client is None or self._client_pid != pid:
+                    import stripe
+                    base_addresses = {'api': self.api_base} if self.api_base else {}
+                    self._client = stripe.StripeClient(
+                        self.secret_key,
+                        http_client=stripe.RequestsClient(timeout=self.timeout, session=self._shared_session()),
+                        max_network_retries=self.max_retries,
+                        base_addresses=base_addresses
+                    )
+                    self._client_pid = pid
+        return self._client
+    
+    def _shared_session(self):
+        """
+        gevent ワーカー用の共有セッション
+        
+        スレッドローカルはグリーンレット（=リクエスト）ごとになり接続が再利用されないため、
+        接続プール付きのセッションを1つ共有する。スレッドワーカーでは None（スレッドごと）
+        """
+        if not gevent_patched():
+            return None
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=self.pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+    
+    def create_payment_intent(self, amount, metadata, idempotency_key=None):
+        """PaymentIntent作成（日本円）。idempotency_keyはStripeにもそのまま渡す"""
+        options = {'idempotency_key': f'pi-{metadata["user_id"]}-{idempotency_key}'} if idempotency_key else {}
+        with request_metrics.timed('stripe'), _translate_errors():
+            return self.client.payment_intents.create(params={
+                'amount': int(amount),
+                'currency': 'jpy',
+                'metadata': metadata,
+                # 自動決済方法を有効化
+                'automatic_payment_methods': {'enabled': True}
+            }, options=options)
+    
+    def cached_intent(self, payment_intent_id):
+        """
+        Stripeに問い合わせず、検証済みキャッシュだけを見る（未確認ならNone）
+        
+        Webhookで注文を確定するモードで使う
+        """
+        if not self.enabled:
+            return self.verify_payment_intent(payment_intent_id)
+        cached = self.verified_intents.get(payment_intent_id)
+        if cached:
+            return VerifiedIntent(payment_intent_id, cached['status'], cached['amount'])
+        return None
+    
+    def verify_payment_intent(self, payment_intent_id):
+        """
+        PaymentIntentの状態を取得して VerifiedIntent を返す
+        
+        成功済みのものはキャッシュから返し、Stripeへの再問い合わせを省く。
+        モックモードでは pi_mock_ のIDを成功扱いとする（金額は不明なのでNone）
+        """
+        if not self.enabled:
+            status = 'succeeded' if payment_intent_id.startswith(MOCK_INTENT_PREFIX) else 'unknown'
+            return VerifiedIntent(payment_intent_id, status, None)
+        
+        cached = self.cached_intent(payment_intent_id)
+        if cached:
+            return cached
+        
+        with request_metrics.timed('stripe'), _translate_errors():
+            intent = self.client.payment_intents.retrieve(payment_intent_id)
+        verified = VerifiedIntent(intent.id, intent.status, intent.amount)
+        if verified.succeeded:
+            self.remember_succeeded(verified.id, verified.amount)
+        return verified
+    
+    def construct_webhook_event(self, payload, sig_header, secret):
+        """Webhookの署名を検証してイベントを返す（ローカル計算のみ、外部通信なし）"""
+        import stripe
+        try:
+            return stripe.Webhook.construct_event(payload, sig_header, secret)
+        except (ValueError, stripe.error.SignatureVerificationError) as e:
+            raise WebhookSignatureError(str(e)) from e
+    
+    def preload(self):
+        """stripe パッケージを読み込んでおく（preload_app 時にマスタープロセスで呼ぶ）"""
+        if self.enabled:
+            import stripe  # noqa: F401
+    
+    def remember_succeeded(self, payment_intent_id, amount):
+        """決済成功を確認したPaymentIntentをキャッシュ"""
+        self.verified_intents.set(payment_intent_id, {'status': 'succeeded', 'amount': amount})
+
+
+stripe_gateway = StripeGateway()
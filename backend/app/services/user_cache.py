@@ -0,0 +1,63 @@
+"""
+ユーザー情報のワーカー内TTLキャッシュ
+
+/me とトークンバージョン検証で使うユーザー情報を各ワーカーに短時間保持する。
+権限変更・トークン失効時は全ワーカー共有のバージョン（SharedCounter）を進めて
+即座に無効化するため、降格はTTLを待たずに反映される。
+"""
+import threading
+import time
+from app.models import db, User
+from app.utils.shared_memory import SharedCounter
+
+
+class UserCache:
+    """ユーザーIDをキーにしたTTL + バージョン無効化キャッシュ"""
+    
+    def __init__(self, app=None):
+        self.ttl = 60
+        self.max_entries = 10000
+        self.version = None
+        self._entries = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.ttl = app.config['AUTH_USER_CACHE_TTL']
+        self.max_entries = app.config['AUTH_USER_CACHE_MAX_ENTRIES']
+        self.version = SharedCounter(app.config['USERS_VERSION_FILE'])
+        app.extensions['user_cache'] = self
+    
+    def get(self, user_id):
+        """
+        ユーザー情報（to_dict() + tokenVersion）を返す。存在しなければNone
+        
+        キャッシュが期限切れ・無効化済みの場合のみDBを参照する
+        """
+        version = self.version.value
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry and entry[0] == version and entry[1] > now:
+            return entry[2]
+        
+        user = db.session.get(User, user_id)
+        record = None
+        if user:
+            record = user.to_dict()
+            record['tokenVersion'] = user.token_version
+        
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[user_id] = (version, now + self.ttl, record)
+        return record
+    
+    def invalidate(self):
+        """全ワーカーのユーザーキャッシュを無効化"""
+        if self.version is not None:
+            self.version.increment()
+
+
+user_cache = UserCache()
@@ -0,0 +1 @@
+# 共通ユーティリティパッケージ
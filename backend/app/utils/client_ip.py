@@ -0,0 +1,18 @@
+"""クライアントIPの取得"""
+from flask import current_app, request
+
+
+def client_ip():
+    """
+    リクエスト元のIPアドレス
+    
+    nginx が Cloudflare の CF-Connecting-IP から復元した実IPを X-Real-IP で渡すため、
+    CLIENT_IP_HEADER（デフォルト X-Real-IP）があればそれを使う。
+    バックエンドに直接届く構成では CLIENT_IP_HEADER を空にする（ヘッダーを偽装できるため）
+    """
+    header = current_app.config['CLIENT_IP_HEADER']
+    if header:
+        value = request.headers.get(header, '').strip()
+        if value:
+            return value
+    return request.remote_addr or ''
@@ -0,0 +1,45 @@
+"""
+レスポンスの事前圧縮
+
+キャッシュに入れる時点で gzip / brotli の圧縮済みバイト列を作っておき、
+リクエストごとには Accept-Encoding に合わせて選ぶだけにする。
+brotli は任意の依存（なければ gzip のみ）。
+"""
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # 任意の依存
+    brotli = None
+
+# 同じ品質値なら先にあるものを優先
+PREFERRED_ENCODINGS = ('br', 'gzip')
+
+
+def compress_variants(body, min_bytes, gzip_level, brotli_quality):
+    """
+    圧縮済みの表現を {エンコーディング: バイト列} で返す
+    
+    min_bytes 未満の本文や、圧縮しても小さくならないものは含めない
+    """
+    if len(body) < min_bytes:
+        return {}
+    variants = {}
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, quality=brotli_quality)
+    # mtime=0 で同じ本文からは常に同じバイト列になるようにする
+    variants['gzip'] = gzip.compress(body, compresslevel=gzip_level, mtime=0)
+    return {name: data for name, data in variants.items() if len(data) < len(body)}
+
+
+def negotiate_encoding(available):
+    """Accept-Encoding から、用意済みのエンコーディングのうち最も優先度が高いものを選ぶ（なければNone）"""
+    best, best_quality = None, 0
+    for name in PREFERRED_ENCODINGS:
+        if name not in available:
+            continue
+        quality = request.accept_encodings[name]
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
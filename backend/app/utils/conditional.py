@@ -0,0 +1,57 @@
+"""条件付きGET（ETag / Last-Modified / 304）用ユーティリティ"""
+from datetime import timezone
+from flask import request, make_response
+from sqlalchemy import func
+
+
+class Validators:
+    """レスポンスの検証子（ETagとLast-Modified）"""
+    
+    def __init__(self, etag, last_modified=None):
+        self.etag = etag
+        # HTTP日付は秒精度のため、マイクロ秒を切り捨ててUTCのawareに揃える
+        if last_modified is not None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+        self.last_modified = last_modified
+    
+    def matches(self):
+        """リクエストの If-None-Match / If-Modified-Since と一致するか"""
+        # If-None-Match がある場合は If-Modified-Since より優先（RFC 9110）
+        if request.if_none_match:
+            return request.if_none_match.contains_weak(self.etag)
+        if request.if_modified_since and self.last_modified:
+            return self.last_modified <= request.if_modified_since
+        return False
+    
+    def apply(self, response, cache_control='no-cache'):
+        """レスポンスに検証子ヘッダーを付与"""
+        response.set_etag(self.etag, weak=True)
+        if self.last_modified:
+            response.last_modified = self.last_modified
+        response.headers['Cache-Control'] = cache_control
+        return response
+    
+    def not_modified(self, cache_control='no-cache'):
+        """304レスポンスを生成"""
+        return self.apply(make_response('', 304), cache_control)
+
+
+def collection_validators(query, updated_column, prefix):
+    """
+    一覧用の検証子を集約クエリ（max(updated_at) と件数）から生成
+    
+    queryには絞り込み済みのクエリを渡す（並び替え・limitは含めない）
+    """
+    row = query.with_entities(
+        func.max(updated_column),
+        func.count()
+    ).order_by(None).one()
+    last_modified, count = row
+    stamp = last_modified.isoformat() if last_modified else '0'
+    return Validators(f'{prefix}-{count}-{stamp}', last_modified)
+
+
+def row_validators(row_id, updated_at, prefix):
+    """詳細用の検証子を行の updated_at から生成"""
+    stamp = updated_at.isoformat() if updated_at else '0'
+    return Validators(f'{prefix}-{row_id}-{stamp}', updated_at)
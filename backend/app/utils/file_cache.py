@@ -0,0 +1,69 @@
+"""
+ワーカー間で共有する小さなTTLキャッシュ（ファイルベース）
+
+キーごとにJSONファイルを1つ書き、同一ホストの全Gunicornワーカーから読めるようにする。
+書き込みは一時ファイル + rename で行うため、読み込み側が不完全な内容を見ることはない。
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+
+class FileTTLCache:
+    """ディレクトリ配下にJSONで保存するTTL付きキャッシュ"""
+    
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+    
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f'{digest}.json')
+    
+    def get(self, key):
+        """値を返す。未登録・期限切れならNone"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('expires', 0) < time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry.get('value')
+    
+    def set(self, key, value, ttl=None):
+        """値を保存（JSONシリアライズ可能な値のみ）"""
+        entry = {'expires': time.time() + (ttl or self.ttl), 'value': value}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def prune(self):
+        """期限切れのエントリを削除"""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    expired = json.load(f).get('expires', 0) < now
+            except (OSError, ValueError):
+                expired = name.endswith('.tmp')
+            if expired:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
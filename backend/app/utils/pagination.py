@@ -0,0 +1,37 @@
+"""キーセットページネーション用ユーティリティ"""
+import base64
+from datetime import datetime
+
+
+def encode_cursor(created_at, row_id):
+    """(created_at, id) をURLセーフな不透明カーソル文字列に変換"""
+    raw = f'{created_at.isoformat()}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    カーソル文字列を (created_at, id) に復元
+
+    不正なカーソルの場合は ValueError を送出する
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        created_at, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeError) as e:
+        raise ValueError('カーソルが不正です') from e
+
+
+def parse_limit(raw, default, maximum):
+    """limitパラメータを解釈（未指定ならdefault、上限はmaximum）"""
+    if raw is None or raw == '':
+        return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ValueError('limitは整数で指定してください') from None
+    if limit <= 0:
+        raise ValueError('limitは1以上である必要があります')
+    return min(limit, maximum)
@@ -0,0 +1,25 @@
+"""
+カラムタプルからのシリアライズ
+
+読み取り専用の一覧では、ORMオブジェクトを組み立てずに必要なカラムだけをSELECTし、
+結果行（タプル）をAPIフィールド名と zip して辞書にする。
+datetime はそのまま残し、JSONプロバイダー（app/json_provider.py）が ISO 8601 に変換する。
+"""
+
+
+def api_columns(model, fields=None, extra=()):
+    """
+    APIフィールド名のタプルと、SELECTするカラムのリストを返す
+    
+    model.API_FIELDS（APIフィールド名 → カラム属性名）を使う。
+    extra のカラムは末尾に追加する（カーソル生成用。キーより後ろなので辞書には入らない）
+    """
+    keys = tuple(fields) if fields is not None else tuple(model.API_FIELDS)
+    columns = [getattr(model, model.API_FIELDS[key]) for key in keys]
+    columns.extend(extra)
+    return keys, columns
+
+
+def rows_to_dicts(keys, rows):
+    """結果行をAPIフィールド名の辞書のリストに変換"""
+    return [dict(zip(keys, row)) for row in rows]
@@ -0,0 +1,156 @@
+"""
+Gunicornワーカー間で共有する軽量カウンター
+
+同一ホスト上の全ワーカーが同じファイルをmmapし、8バイトの整数を共有する。
+外部サービス（Redis等）を使わずにワーカー間で値を共有するために使う。
+複数の値（ヒストグラムなど）は SharedCounterArray で1ファイルにまとめる。
+"""
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows（開発環境）ではプロセス内ロックのみ
+    fcntl = None
+
+_FORMAT = '<q'
+_SIZE = struct.calcsize(_FORMAT)
+
+
+class SharedCounterArray:
+    """ファイルをmmapしたワーカー間共有カウンターの配列（整数 size 個）"""
+    
+    def __init__(self, path, size=1):
+        self.path = path
+        self.size = size
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < _SIZE * size:
+            os.ftruncate(self._fd, _SIZE * size)
+        self._map = mmap.mmap(self._fd, _SIZE * size)
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+    
+    def _lock_fd(self):
+        # flockはオープンしたファイル単位のため、fork後（preload_app）は開き直して親と共有しない
+        pid = os.getpid()
+        if self._pid != pid:
+            self._fd = os.open(self.path, os.O_RDWR)
+            self._pid = pid
+        return self._fd
+    
+    @contextmanager
+    def _exclusive(self):
+        """プロセス内・プロセス間の両方で排他"""
+        with self._lock:
+            fd = self._lock_fd()
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+    
+    def get(self, index):
+        """1つの値を読む（ロック不要。8バイト境界の読み込みは分断されない）"""
+        return struct.unpack_from(_FORMAT, self._map, index * _SIZE)[0]
+    
+    def add(self, deltas):
+        """(インデックス, 加算値) の組をまとめて加算（1回のロックで）"""
+        with self._exclusive():
+            for index, delta in deltas:
+                offset = index * _SIZE
+                struct.pack_into(_FORMAT, self._map, offset, struct.unpack_from(_FORMAT, self._map, offset)[0] + delta)
+    
+    def set_max(self, index, value):
+        """値が value より小さければ value にする（時刻の記録など）"""
+        with self._exclusive():
+            offset = index * _SIZE
+            if struct.unpack_from(_FORMAT, self._map, offset)[0] < value:
+                struct.pack_into(_FORMAT, self._map, offset, value)
+    
+    def snapshot(self):
+        """全ての値を一貫した状態で読む"""
+        with self._exclusive():
+            return list(struct.unpack_from(f'<{self.size}q', self._map, 0))
+
+
+class SharedCounter(SharedCounterArray):
+    """ファイルをmmapしたワーカー間共有カウンター"""
+    
+    def __init__(self, path):
+        super().__init__(path, 1)
+    
+    @property
+    def value(self):
+        """現在値を読む（ロック不要）"""
+        return self.get(0)
+    
+    def increment(self, delta=1):
+        """値を加算して加算後の値を返す（プロセス間で排他）"""
+        with self._exclusive():
+            value = struct.unpack_from(_FORMAT, self._map, 0)[0] + delta
+            struct.pack_into(_FORMAT, self._map, 0, value)
+            return value
+
+
+class SharedTokenBuckets(SharedCounterArray):
+    """
+    ワーカー間で共有するトークンバケットの表（レート制限用）
+    
+    1バケット = (キーのハッシュ, トークン残量×10^6, 最終更新時刻μs) の3整数。
+    キーのハッシュから決まる位置から PROBES 個を探し、なければ空き、
+    空きもなければ最も長く使われていないバケットを上書きする（満タンから数え直す）。
+    """
+    PROBES = 8
+    
+    def __init__(self, path, slots):
+        super().__init__(path, slots * 3)
+        self.slots = slots
+    
+    def _find(self, key_hash):
+        """キーのバケット位置と、既存かどうか"""
+        start = key_hash % self.slots
+        victim, victim_updated = None, None
+        for probe in range(min(self.PROBES, self.slots)):
+            slot = (start + probe) % self.slots
+            stored = struct.unpack_from(_FORMAT, self._map, slot * 3 * _SIZE)[0]
+            if stored == key_hash:
+                return slot, True
+            updated = 0 if stored == 0 else struct.unpack_from(_FORMAT, self._map, (slot * 3 + 2) * _SIZE)[0]
+            if victim is None or updated < victim_updated:
+                victim, victim_updated = slot, updated
+        return victim, False
+    
+    def take(self, key_hash, capacity, rate, now_us, consume=True):
+        """
+        トークンを1つ取る（consume=False なら取らずに残りがあるかだけ見る）
+        
+        capacity: バケットの大きさ（連続で許す回数）、rate: 1秒あたりの補充数
+        戻り値: (許可したか, 次の1トークンまでの秒数)
+        """
+        scale = 1_000_000
+        with self._exclusive():
+            slot, exists = self._find(key_hash)
+            if not exists and not consume:
+                return True, 0.0  # 満タンのバケットは作らない（他のキーを追い出さない）
+            offset = slot * 3 * _SIZE
+            if exists:
+                _, tokens, updated = struct.unpack_from('<3q', self._map, offset)
+                # 時計が戻った場合は補充しない
+                tokens = min(capacity * scale, tokens + int(max(0, now_us - updated) * rate))
+            else:
+                tokens = capacity * scale
+            allowed = tokens >= scale
+            if consume:
+                if allowed:
+                    tokens -= scale
+                struct.pack_into('<3q', self._map, offset, key_hash, tokens, now_us)
+        retry_after = 0.0 if allowed else (scale - tokens) / (rate * scale)
+        return allowed, retry_after
@@ -0,0 +1,15 @@
+"""
+Gunicornワーカー種別に関するヘルパー
+
+gevent ワーカーではスレッド・ソケットがグリーンレット用に置き換わるため、
+ネイティブスレッドや接続の共有方法を切り替える必要がある。
+"""
+
+
+def gevent_patched():
+    """geventのモンキーパッチ（Gunicornの gevent ワーカー）が有効か"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
@@ -0,0 +1,43 @@
+"""
+preload_app 用のウォームアップ
+
+Gunicornのマスタープロセスでアプリを読み込んだ後、ワーカーをforkする前に呼ぶ。
+重いパッケージの読み込み・カタログキャッシュの充填・検索インデックスの構築をここで済ませ、
+fork後はコピーオンライトで全ワーカーが共有する（ワーカーの再起動も速くなる）。
+"""
+import gc
+from app.models import db
+from app.services.password_hasher import password_hasher
+from app.services.search_index import search_index
+from app.services.stripe_gateway import stripe_gateway
+
+
+def warm_up(app):
+    """パッケージ読み込み・カタログ充填・検索インデックス構築を行い、fork前の状態を固める"""
+    stripe_gateway.preload()
+    password_hasher.preload()
+    
+    # 実際のリクエストと同じ経路で通すことで、同じキーでキャッシュに入る
+    client = app.test_client()
+    for path in app.config['CATALOG_WARM_PATHS']:
+        try:
+            response = client.get(path)
+        except Exception as e:
+            app.logger.warning('ウォームアップに失敗しました: %s (%s)', path, e)
+            continue
+        if response.status_code != 200:
+            app.logger.warning('ウォームアップに失敗しました: %s (%s)', path, response.status_code)
+    
+    with app.app_context():
+        try:
+            search_index.build()
+        except Exception as e:
+            app.logger.warning('検索インデックスを作成できませんでした: %s', e)
+        
+        # マスターの接続はワーカーに引き継がない
+        for engine in db.engines.values():
+            engine.dispose()
+    
+    # 読み込み済みオブジェクトをGCの対象から外し、fork後にGCが参照カウント領域へ書き込んで
+    # ページがコピーされるのを防ぐ
+    gc.freeze()
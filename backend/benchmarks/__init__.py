@@ -0,0 +1 @@
+# ベンチマーク・負荷試験スクリプト
@@ -0,0 +1,142 @@
+"""
+売上分析のベンチマーク
+
+1年分の注文（デフォルト20万件、明細は1〜3行）を作り、次を計測する。
+- flask analytics backfill 相当（backfill()）の所要時間
+- 期間90日の商品別ランキング・日別推移: 集計テーブル（/api/admin/analytics） と 注文テーブルの走査（GROUP BY）
+- 注文作成1件あたりの集計更新（record_order）の時間
+
+使い方:
+    python -m benchmarks.analytics --orders 200000 --repeat 20
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select
+from app import create_app
+from app.models import db, User, Product, Order, OrderItem
+from app.services.sales_rollup import backfill, product_categories, record_order
+from benchmarks.common import auth_header, make_config
+
+DAYS = 365
+
+
+def seed(args, rng):
+    admin = User(email='analytics-admin@example.com', display_name='admin', is_admin=True)
+    admin.password_hash = 'x'
+    db.session.add(admin)
+    db.session.execute(insert(Product), [
+        {'name': f'商品{i}', 'price': 500 + i, 'stock': 1000, 'category': f'カテゴリ{i % 10}'}
+        for i in range(args.products)
+    ])
+    db.session.flush()
+    
+    started = datetime.utcnow() - timedelta(days=DAYS)
+    batch = 10000
+    for offset in range(0, args.orders, batch):
+        count = min(batch, args.orders - offset)
+        db.session.execute(insert(Order), [
+            {'user_id': admin.id, 'total': 0, 'status': 'cancelled' if rng.random() < 0.05 else 'paid',
+             'created_at': started + timedelta(seconds=rng.randrange(DAYS * 86400))}
+            for _ in range(count)
+        ])
+    order_ids = db.session.execute(select(Order.id)).scalars().all()
+    for offset in range(0, len(order_ids), batch):
+        db.session.execute(insert(OrderItem), [
+            {'order_id': order_id, 'product_id': rng.randint(1, args.products), 'product_name': 'x',
+             'quantity': rng.randint(1, 3), 'price': rng.randint(500, 5000)}
+            for order_id in order_ids[offset:offset + batch]
+            for _ in range(rng.randint(1, 3))
+        ])
+    db.session.commit()
+    return admin.id
+
+
+def scan_products(start, end):
+    """集計テーブルを使わない場合の商品別ランキング"""
+    return db.session.execute(
+        select(OrderItem.product_id, func.sum(OrderItem.quantity), func.sum(OrderItem.price * OrderItem.quantity),
+               func.count(func.distinct(OrderItem.order_id)))
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(Order.created_at >= start, Order.created_at < end, Order.status != 'cancelled')
+        .group_by(OrderItem.product_id)
+        .order_by(func.sum(OrderItem.price * OrderItem.quantity).desc())
+        .limit(20)
+    ).all()
+
+
+def scan_daily(start, end):
+    day = func.date(Order.created_at)
+    return db.session.execute(
+        select(day, func.sum(OrderItem.quantity), func.sum(OrderItem.price * OrderItem.quantity))
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .where(Order.created_at >= start, Order.created_at < end, Order.status != 'cancelled')
+        .group_by(day)
+    ).all()
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def run(args):
+    rng = random.Random(0)
+    app = create_app(make_config(args.database_url))
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin_id = seed(args, rng)
+        
+        started = time.perf_counter()
+        processed = backfill(chunk_days=args.chunk_days)
+        print(f'orders={args.orders} products={args.products}')
+        print(f'  バックフィル: {processed}件 {time.perf_counter() - started:.2f}s（{args.chunk_days}日ずつ）')
+    
+    client = app.test_client()
+    headers = auth_header(app, admin_id)
+    end = datetime.utcnow().date()
+    start = end - timedelta(days=89)
+    query = f'from={start.isoformat()}&to={end.isoformat()}'
+    
+    def api(path):
+        response = client.get(f'/api/admin/analytics/{path}?{query}', headers=headers)
+        assert response.status_code == 200, response.get_json()
+    
+    print(f'  期間90日（中央値、{args.repeat}回）')
+    print(f'    商品別ランキング  集計テーブル {timed(lambda: api("products"), args.repeat):7.2f}ms')
+    print(f'    日別推移          集計テーブル {timed(lambda: api("daily"), args.repeat):7.2f}ms')
+    with app.app_context():
+        scan_start = datetime(start.year, start.month, start.day)
+        scan_end = datetime(end.year, end.month, end.day) + timedelta(days=1)
+        print(f'    商品別ランキング  注文の走査   {timed(lambda: scan_products(scan_start, scan_end), args.repeat):7.2f}ms')
+        print(f'    日別推移          注文の走査   {timed(lambda: scan_daily(scan_start, scan_end), args.repeat):7.2f}ms')
+        
+        product_ids = [rng.randint(1, args.products) for _ in range(3)]
+        
+        def one_order():
+            # 注文作成と同じく、明細に記録するカテゴリの取得も含める
+            categories = product_categories(product_ids)
+            record_order(datetime.utcnow(), [(product_id, 1, 1000, categories.get(product_id)) for product_id in product_ids])
+            db.session.commit()
+        print(f'  注文1件の集計更新（3明細、commit込み）: {timed(one_order, args.repeat):.2f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='未指定なら一時SQLiteファイル')
+    parser.add_argument('--orders', type=int, default=200000)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--chunk-days', type=int, default=7)
+    parser.add_argument('--repeat', type=int, default=20)
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+商品一括インポート・エクスポートのベンチマーク
+
+- 1件ずつ: 既存の POST /api/products と同じく1行ごとに add + commit
+- 一括: POST /api/products/bulk に CSV / JSON Lines を流し込む（BULK_IMPORT_BATCH_SIZE 件ごとに executemany）
+- エクスポート: GET /api/products/export を最後まで読む所要時間と、Pythonのピークメモリ（tracemalloc）
+
+使い方:
+    python -m benchmarks.bulk_import --rows 100000 --single-rows 2000
+"""
+import argparse
+import csv
+import io
+import json
+import time
+import tracemalloc
+from app import create_app
+from app.models import db, User, Product
+from benchmarks.common import auth_header, make_config
+
+FIELDS = ('name', 'price', 'description', 'stock', 'category')
+
+
+def make_rows(count):
+    for i in range(count):
+        yield {
+            'name': f'一括商品{i}',
+            'price': 500 + i % 9000,
+            'description': f'一括インポートのベンチマーク用の商品です。No.{i}',
+            'stock': i % 30,
+            'category': f'カテゴリ{i % 12}',
+        }
+
+
+def csv_body(count):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+    writer.writeheader()
+    writer.writerows(make_rows(count))
+    return buffer.getvalue().encode('utf-8')
+
+
+def jsonl_body(count):
+    return ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in make_rows(count)).encode('utf-8')
+
+
+def reset_products():
+    db.session.query(Product).delete()
+    db.session.commit()
+
+
+def run_single(app, count):
+    with app.app_context():
+        reset_products()
+        started = time.perf_counter()
+        for row in make_rows(count):
+            db.session.add(Product(**row))
+            db.session.commit()
+        return time.perf_counter() - started
+
+
+def run_bulk(app, client, headers, fmt, body):
+    with app.app_context():
+        reset_products()
+    started = time.perf_counter()
+    response = client.post(f'/api/products/bulk?format={fmt}', data=body, headers=headers)
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 200, response.get_json()
+    return elapsed, response.get_json()
+
+
+def read_export(client, headers, fmt):
+    response = client.get(f'/api/products/export?format={fmt}', headers=headers, buffered=False)
+    size = 0
+    for chunk in response.response:
+        size += len(chunk)
+    response.close()
+    return size
+
+
+def run_export(client, headers, fmt):
+    """1回目で時間、2回目で tracemalloc のピークを計測（tracemalloc 自体が遅いため分ける）"""
+    started = time.perf_counter()
+    size = read_export(client, headers, fmt)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    read_export(client, headers, fmt)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, size, peak
+
+
+def run(args):
+    app = create_app(make_config(args.database_url, BULK_IMPORT_BATCH_SIZE=args.batch_size))
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin = User(email='bulk-admin@example.com', display_name='admin', is_admin=True)
+        admin.password_hash = 'x'
+        db.session.add(admin)
+        db.session.commit()
+        admin_id = admin.id
+    client = app.test_client()
+    headers = auth_header(app, admin_id)
+    
+    if args.single_rows:
+        elapsed = run_single(app, args.single_rows)
+        print(f'1件ずつ commit  {args.single_rows}行  {elapsed:7.2f}s  {args.single_rows / elapsed:9.0f}行/s')
+    
+    for fmt, make_body in (('csv', csv_body), ('jsonl', jsonl_body)):
+        body = make_body(args.rows)
+        elapsed, report = run_bulk(app, client, headers, fmt, body)
+        print(f'一括 {fmt:<5}     {args.rows}行  {elapsed:7.2f}s  {args.rows / elapsed:9.0f}行/s'
+              f'  （本文 {len(body) / 1024 / 1024:.1f}MiB, 作成 {report["created"]}, 失敗 {report["failed"]}）')
+    
+    for fmt in ('csv', 'jsonl'):
+        elapsed, size, peak = run_export(client, headers, fmt)
+        print(f'エクスポート {fmt:<5} {elapsed:7.2f}s  {size / 1024 / 1024:6.1f}MiB  ピークメモリ {peak / 1024 / 1024:6.1f}MiB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='未指定なら一時SQLiteファイル')
+    parser.add_argument('--rows', type=int, default=100000, help='一括インポート・エクスポートの行数')
+    parser.add_argument('--single-rows', type=int, default=2000, help='1件ずつ commit する比較の行数（0で省略）')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+事前圧縮キャッシュのベンチマーク
+
+商品一覧（キャッシュ済み）を次の方法で返したときの、1リクエストあたりの転送バイト数とCPU時間を比べる。
+- 無圧縮
+- リクエストごとに gzip 圧縮（リバースプロキシやミドルウェアで圧縮する場合に相当）
+- 事前圧縮済みの gzip / brotli
+あわせて、キャッシュ充填（カタログ変更後の最初の1回）にかかる時間の増分も出力する。
+
+使い方:
+    python -m benchmarks.compression --products 10000 --requests 200
+"""
+import argparse
+import gzip
+import time
+from sqlalchemy import insert
+from app import create_app
+from app.models import db, Product
+from app.services.catalog_cache import catalog_cache
+from app.utils.compression import brotli
+from benchmarks.common import make_config
+
+
+def measure(client, args, accept_encoding=None, compress_per_request=False):
+    """(平均転送バイト数, 1リクエストあたりのCPU秒)"""
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    path = f'/api/products?limit={args.limit}' if args.limit else '/api/products'
+    client.get(path, headers=headers)  # キャッシュ充填
+    size = 0
+    started = time.process_time()
+    for _ in range(args.requests):
+        body = client.get(path, headers=headers).data
+        if compress_per_request:
+            body = gzip.compress(body, compresslevel=args.gzip_level)
+        size = len(body)
+    return size, (time.process_time() - started) / args.requests
+
+
+def fill_time(client, args, headers):
+    """カタログ無効化後の最初のリクエスト（DB取得 + シリアライズ + 圧縮）の時間"""
+    path = f'/api/products?limit={args.limit}' if args.limit else '/api/products'
+    timings = []
+    for _ in range(3):
+        with client.application.app_context():
+            catalog_cache.invalidate()
+        started = time.perf_counter()
+        client.get(path, headers=headers)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def run(args):
+    config = make_config(
+        args.database_url,
+        CATALOG_GZIP_LEVEL=args.gzip_level,
+        CATALOG_BROTLI_QUALITY=args.brotli_quality
+    )
+    app = create_app(config)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(insert(Product), [
+            {'name': f'商品{i}', 'price': 1000 + i, 'description': f'説明{i} ' * 10,
+             'stock': i % 50, 'category': f'カテゴリ{i % 20}'}
+            for i in range(args.products)
+        ])
+        db.session.commit()
+    client = app.test_client()
+    
+    scenarios = [
+        ('無圧縮', None, False),
+        ('gzip（リクエストごと）', None, True),
+        ('gzip（事前圧縮）', 'gzip', False),
+    ]
+    if brotli is not None:
+        scenarios.append(('brotli（事前圧縮）', 'br', False))
+    else:
+        print('brotli がインストールされていないため、brotli は計測しません')
+    
+    print(f'products={args.products} limit={args.limit or "なし"} requests={args.requests} '
+          f'gzip_level={args.gzip_level} brotli_quality={args.brotli_quality}')
+    for label, accept_encoding, per_request in scenarios:
+        size, cpu = measure(client, args, accept_encoding, per_request)
+        print(f'  {size / 1024:9.1f}KiB  CPU {cpu * 1000:7.3f}ms/req  {label}')
+    
+    # 圧縮のコストはキャッシュ充填時にだけかかる
+    app.config['CATALOG_COMPRESS_ENABLED'] = False
+    plain = fill_time(client, args, {})
+    app.config['CATALOG_COMPRESS_ENABLED'] = True
+    compressed = fill_time(client, args, {'Accept-Encoding': 'br, gzip'})
+    print(f'  キャッシュ充填: 圧縮なし {plain * 1000:.1f}ms / 圧縮あり {compressed * 1000:.1f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='未指定なら一時SQLiteファイル')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--limit', type=int, help='1ページの件数（未指定なら PRODUCTS_DEFAULT_PAGE_SIZE）')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--gzip-level', type=int, default=6)
+    parser.add_argument('--brotli-quality', type=int, default=5)
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
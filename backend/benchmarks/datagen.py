@@ -0,0 +1,380 @@
+"""
+負荷試験・ベンチマーク用の合成データ生成
+
+ユーザー・商品・注文（明細つき）を本番規模（数百万件）で生成する。
+- 同じ --seed・--end なら同じデータになる（ユーザー・商品・注文はそれぞれ別の乱数列のため、
+  注文数だけ変えても商品・ユーザーは変わらない）
+- 商品の人気・ユーザーの購入頻度は Zipf 分布、カートは1〜5商品（1商品が多い）
+- 注文日時は --days 日間に、増加傾向・週末の山・夜の山をつけて分布させ、古い順にIDを振る
+- パスワードハッシュは1回だけ計算して全ユーザーで共有する（bcrypt を件数分回さない）
+- 書き込みは PostgreSQL では COPY、それ以外では executemany（--batch-size 行ごと、ORMを通さない）
+- 最後に売上集計（daily_sales など）を注文履歴から作り直す
+
+既存データに追記する（--reset で全テーブルを作り直す）。
+生成したデータはアプリのキャッシュ・検索インデックスに載らないため、サーバーは生成後に起動し直すこと。
+
+使い方:
+    python -m benchmarks.datagen --database-url postgresql://... --reset \\
+        --users 200000 --products 50000 --orders 2000000 --seed 42
+"""
+import argparse
+import bisect
+import csv
+import io
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+from flask_migrate import stamp
+from sqlalchemy import func, insert, select, text
+from app import create_app
+from app.models import db, User, Product, Order, OrderItem
+from app.services.password_hasher import password_hasher
+from app.services.sales_rollup import backfill
+from benchmarks.common import make_config
+
+ANIMALS = ['アザラシ', 'クマ', 'うさぎ', 'ねこ', 'いぬ', 'ペンギン', 'ひつじ', 'パンダ', 'きつね', 'ふくろう']
+ITEMS = ['編みぐるみ', 'マフラー', 'コースター', 'トートバッグ', 'ポーチ', 'ブランケット', 'ニット帽', 'キーホルダー', '小物入れ', 'ミトン']
+COLORS = ['ピンク', '白', '水色', 'ベージュ', '赤', 'グレー', 'からし色', 'ミント', '黒', 'ラベンダー']
+PHRASES = [
+    'やわらかい毛糸で丁寧に編みました。', 'プレゼントにも最適です。', 'お部屋のインテリアにおすすめ。',
+    'ストライプ模様がおしゃれ。', '手洗いできます。', '冬のお出かけにぴったり。',
+    'つぶらな瞳がチャームポイント。', 'コットン100%の毛糸を使用。', 'バッグに取り付けられます。',
+    'ハンドメイドのため一点ずつ表情が異なります。',
+]
+CATEGORIES = ['編みぐるみ', '小物', 'ファッション', 'インテリア', 'キッズ']
+# 商品の種類ごとの価格帯（円）
+PRICE_RANGES = {
+    '編みぐるみ': (1800, 4800), 'マフラー': (3000, 8000), 'コースター': (600, 1800), 'トートバッグ': (3500, 9000),
+    'ポーチ': (1200, 3500), 'ブランケット': (6000, 18000), 'ニット帽': (2000, 5000), 'キーホルダー': (500, 1500),
+    '小物入れ': (1500, 4000), 'ミトン': (1800, 4500),
+}
+FAMILY_NAMES = ['佐藤', '鈴木', '高橋', '田中', '伊藤', '渡辺', '山本', '中村', '小林', '加藤', '吉田', '山田']
+GIVEN_NAMES = ['陽菜', '結衣', '葵', '凛', '蓮', '湊', '大翔', '悠真', '美咲', '花子', '太郎', 'さくら']
+
+# カートの商品数（1〜5）と数量（1〜3）の重み
+CART_SIZE_WEIGHTS = [55, 25, 12, 5, 3]
+QUANTITY_WEIGHTS = [85, 12, 3]
+# 時間帯（日本時間0〜23時）の重み。昼休みと夜に山がある
+HOUR_WEIGHTS = [3, 2, 1, 1, 1, 1, 2, 4, 5, 5, 6, 7, 9, 8, 6, 6, 6, 7, 9, 11, 13, 13, 10, 6]
+JST = timedelta(hours=9)
+# 注文状態の目安（日数 → 状態）。古い注文ほど配送済み
+SHIPPED_AFTER_DAYS = 2
+DELIVERED_AFTER_DAYS = 5
+CANCEL_RATE = 0.03
+# SQLAlchemy が SQLite の DateTime 列に書く形式
+_SQLITE_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def zipf_cum_weights(count, exponent):
+    """順位 1..count の Zipf 分布の累積重み（rng.choices の cum_weights 用）"""
+    return list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+class ZipfPicker:
+    """ID列から Zipf 分布で選ぶ（人気順はIDと無関係になるようシャッフルする）"""
+    
+    def __init__(self, ids, exponent, rng):
+        self.ids = list(ids)
+        rng.shuffle(self.ids)
+        self.cum_weights = zipf_cum_weights(len(self.ids), exponent)
+        self.total = self.cum_weights[-1]
+        self.rng = rng
+    
+    def pick(self):
+        index = bisect.bisect(self.cum_weights, self.rng.random() * self.total)
+        return self.ids[min(index, len(self.ids) - 1)]
+
+
+class BulkWriter:
+    """
+    行タプルをためて、batch_size 行ごとにまとめて書き込む
+    
+    PostgreSQL は COPY ... FROM STDIN（CSV）、SQLite はドライバーの executemany、それ以外は Core の executemany。
+    parent を渡すと、書き込む前に parent を先に書き込む（外部キーの参照先を先に入れる）
+    """
+    
+    def __init__(self, table, columns, batch_size, parent=None):
+        self.table = table
+        self.columns = columns
+        self.batch_size = batch_size
+        self.parent = parent
+        self.rows = []
+        self.written = 0
+        self.dialect = db.session.get_bind().dialect.name
+    
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+    
+    def flush(self):
+        if not self.rows:
+            return
+        if self.parent is not None:
+            self.parent.flush()
+        if self.dialect == 'postgresql':
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(self.rows)
+            buffer.seek(0)
+            cursor = db.session.connection().connection.dbapi_connection.cursor()
+            try:
+                cursor.copy_expert(
+                    f'COPY {self.table.name} ({", ".join(self.columns)}) FROM STDIN WITH (FORMAT csv)',
+                    buffer
+                )
+            finally:
+                cursor.close()
+        elif self.dialect == 'sqlite':
+            # SQLAlchemy の型変換を通さずドライバーの executemany に渡す。日時は SQLAlchemy と同じ文字列形式にする
+            # （str() ではマイクロ秒が0のとき省かれ、文字列比較のキーセットページネーションで境界の行が重複する）
+            placeholders = ', '.join('?' * len(self.columns))
+            db.session.connection().exec_driver_sql(
+                f'INSERT INTO {self.table.name} ({", ".join(self.columns)}) VALUES ({placeholders})',
+                [tuple(v.strftime(_SQLITE_DATETIME_FORMAT) if isinstance(v, datetime) else v for v in row)
+                 for row in self.rows]
+            )
+        else:
+            db.session.execute(insert(self.table), [dict(zip(self.columns, row)) for row in self.rows])
+        db.session.commit()
+        self.written += len(self.rows)
+        self.rows = []
+
+
+def _next_id(model):
+    return (db.session.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def _reset_sequences():
+    """明示的にIDを入れたテーブルのシーケンスを進める（PostgreSQL）"""
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return
+    for table in ('users', 'products', 'orders', 'order_items'):
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {table}), 1))"
+        ))
+    db.session.commit()
+
+
+def _report(label, count, started):
+    elapsed = time.perf_counter() - started
+    print(f'  {label}: {count:,}件 {elapsed:.1f}s（{count / elapsed if elapsed else 0:,.0f}件/s）')
+
+
+def generate_users(args, rng, now):
+    """ユーザーを生成して (最初のID, 最後のID) を返す。最初のユーザーは管理者"""
+    password_hash = password_hasher.hash(args.password)
+    first_id = _next_id(User)
+    writer = BulkWriter(User.__table__, ('id', 'email', 'password_hash', 'display_name', 'is_admin',
+                                         'token_version', 'created_at'), args.batch_size)
+    started = time.perf_counter()
+    for user_id in range(first_id, first_id + args.users):
+        is_admin = user_id == first_id
+        writer.add((
+            user_id,
+            f'admin{user_id}@example.com' if is_admin else f'user{user_id}@example.com',
+            password_hash,
+            f'{rng.choice(FAMILY_NAMES)} {rng.choice(GIVEN_NAMES)}',
+            is_admin,
+            0,
+            now - timedelta(seconds=rng.randrange(args.days * 86400)),
+        ))
+    writer.flush()
+    _report('ユーザー', writer.written, started)
+    return first_id, first_id + args.users - 1
+
+
+def generate_products(args, rng, now):
+    """商品を生成して {商品ID: (商品名, 価格)} を返す（注文明細の生成に使う）"""
+    first_id = _next_id(Product)
+    writer = BulkWriter(Product.__table__, ('id', 'name', 'price', 'description', 'image_url', 'stock',
+                                            'category', 'created_at', 'updated_at'), args.batch_size)
+    catalog = {}
+    started = time.perf_counter()
+    for product_id in range(first_id, first_id + args.products):
+        color, animal, item = rng.choice(COLORS), rng.choice(ANIMALS), rng.choice(ITEMS)
+        low, high = PRICE_RANGES[item]
+        # 100円単位の価格。安い側に寄せる
+        price = float(round((low + (high - low) * rng.random() ** 2) / 100) * 100)
+        name = f'{color}の{animal}{item} No.{product_id}'
+        created_at = now - timedelta(seconds=rng.randrange(args.days * 86400))
+        row = (
+            product_id,
+            name,
+            price,
+            f'{animal}をモチーフにした{color}の{item}。' + ''.join(rng.sample(PHRASES, 3)),
+            f'/images/products/{rng.randrange(1, 9)}.png',
+            # 在庫は少数が多い（ハンドメイドのため）。注文で減らさないので負荷試験でも売り切れにくい
+            int(rng.expovariate(1 / 20)) + args.min_stock,
+            rng.choice(CATEGORIES),
+            created_at,
+            created_at,
+        )
+        writer.add(row)
+        catalog[product_id] = (name, price, row[6])
+    writer.flush()
+    _report('商品', writer.written, started)
+    return catalog
+
+
+def order_timestamps(args, rng, now):
+    """
+    注文日時を古い順に返すジェネレーター
+    
+    日ごとの件数は増加傾向（最終日は初日の --growth 倍）と週末の山をつけて配分し、
+    時刻は HOUR_WEIGHTS（日本時間）に従う
+    """
+    start = (now + JST).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=args.days - 1)
+    day_weights = []
+    for day in range(args.days):
+        trend = 1 + (args.growth - 1) * day / max(args.days - 1, 1)
+        weekend = 1.3 if (start + timedelta(days=day)).weekday() >= 5 else 1.0
+        day_weights.append(trend * weekend)
+    total_weight = sum(day_weights)
+    
+    hours = list(range(24))
+    remaining = args.orders
+    for day, weight in enumerate(day_weights):
+        if day == args.days - 1:
+            count = remaining
+        else:
+            count = min(remaining, int(round(args.orders * weight / total_weight)))
+        remaining -= count
+        day_start = start + timedelta(days=day) - JST
+        # 最終日は現在時刻までに収める
+        available = max(1, min(86400, int((now - day_start).total_seconds())))
+        offsets = []
+        for hour in rng.choices(hours, weights=HOUR_WEIGHTS, k=count):
+            offset = hour * 3600 + rng.randrange(3600)
+            offsets.append(offset if offset < available else rng.randrange(available))
+        for offset in sorted(offsets):
+            yield day_start + timedelta(seconds=offset)
+
+
+def order_status(created_at, now, rng):
+    if rng.random() < CANCEL_RATE:
+        return 'cancelled'
+    age = now - created_at
+    if age > timedelta(days=DELIVERED_AFTER_DAYS):
+        return 'delivered'
+    if age > timedelta(days=SHIPPED_AFTER_DAYS):
+        return 'shipped'
+    return 'paid'
+
+
+def generate_orders(args, rng, now, user_ids, catalog):
+    """注文と明細を生成（明細の単価は商品の価格）"""
+    users = ZipfPicker(range(user_ids[0], user_ids[1] + 1), args.user_zipf, rng)
+    products = ZipfPicker(catalog.keys(), args.product_zipf, rng)
+    cart_sizes = list(range(1, len(CART_SIZE_WEIGHTS) + 1))
+    cart_cum_weights = list(itertools.accumulate(CART_SIZE_WEIGHTS))
+    quantities = list(range(1, len(QUANTITY_WEIGHTS) + 1))
+    quantity_cum_weights = list(itertools.accumulate(QUANTITY_WEIGHTS))
+    
+    order_id = _next_id(Order)
+    item_id = _next_id(OrderItem)
+    orders = BulkWriter(Order.__table__, ('id', 'user_id', 'total', 'status', 'stripe_payment_intent_id',
+                                          'created_at', 'updated_at'), args.batch_size)
+    items = BulkWriter(OrderItem.__table__, ('id', 'order_id', 'product_id', 'product_name', 'quantity',
+                                             'price', 'category'), args.batch_size, parent=orders)
+    started = time.perf_counter()
+    for created_at in order_timestamps(args, rng, now):
+        cart = set()
+        size = rng.choices(cart_sizes, cum_weights=cart_cum_weights)[0]
+        # 人気商品が重なったら引き直す（上限つき）
+        for _ in range(size * 3):
+            cart.add(products.pick())
+            if len(cart) >= size:
+                break
+        total = 0.0
+        for product_id in sorted(cart):
+            name, price, category = catalog[product_id]
+            quantity = rng.choices(quantities, cum_weights=quantity_cum_weights)[0]
+            items.add((item_id, order_id, product_id, name, quantity, price, category))
+            item_id += 1
+            total += price * quantity
+        orders.add((order_id, users.pick(), total, order_status(created_at, now, rng),
+                    f'pi_synthetic_{order_id}', created_at, created_at))
+        order_id += 1
+    items.flush()
+    orders.flush()
+    _report('注文', orders.written, started)
+    print(f'  注文明細: {items.written:,}件（1注文あたり {items.written / max(orders.written, 1):.2f}）')
+
+
+def _catalog_from_db():
+    return {
+        row.id: (row.name, row.price, row.category)
+        for row in db.session.execute(select(Product.id, Product.name, Product.price, Product.category))
+    }
+
+
+def _user_range_from_db():
+    first, last = db.session.execute(select(func.min(User.id), func.max(User.id))).one()
+    return first, last
+
+
+def run(args):
+    config = make_config(args.database_url) if args.database_url else None
+    app = create_app(config) if config else create_app()
+    now = (args.end or datetime.utcnow()).replace(microsecond=0)
+    
+    with app.app_context():
+        print(f'データベース: {db.engine.url.render_as_string(hide_password=True)}  seed={args.seed}')
+        if args.reset:
+            db.drop_all()
+            db.create_all()
+            stamp()
+            print('  全テーブルを作り直しました')
+        
+        # 種類ごとに別の乱数列を使い、件数を変えても他の種類のデータが変わらないようにする
+        user_ids = (
+            generate_users(args, random.Random(f'{args.seed}-users'), now) if args.users
+            else _user_range_from_db()
+        )
+        catalog = (
+            generate_products(args, random.Random(f'{args.seed}-products'), now) if args.products
+            else _catalog_from_db()
+        )
+        if args.orders:
+            if user_ids[0] is None or not catalog:
+                raise SystemExit('注文を作るにはユーザーと商品が必要です')
+            generate_orders(args, random.Random(f'{args.seed}-orders'), now, user_ids, catalog)
+        _reset_sequences()
+        
+        if args.orders and not args.skip_rollups:
+            started = time.perf_counter()
+            processed = backfill()
+            _report('売上集計', processed, started)
+        print(f'ログイン: admin{user_ids[0]}@example.com / {args.password}（管理者）、'
+              f'user<ID>@example.com / {args.password}')
+
+
+def build_parser():
+    """引数の定義（benchmarks.loadtest もデフォルト値を使う）"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='未指定なら DATABASE_URL（Config）のDB')
+    parser.add_argument('--reset', action='store_true', help='全テーブルを削除して作り直す')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--days', type=int, default=365, help='注文・登録日時を分布させる日数')
+    parser.add_argument('--end', type=datetime.fromisoformat, default=None,
+                        help='最新の注文日時（UTC、例: 2025-01-31T12:00:00）。デフォルトは現在時刻。同じ値なら同じデータになる')
+    parser.add_argument('--growth', type=float, default=2.0, help='最終日の注文数が初日の何倍か')
+    parser.add_argument('--product-zipf', type=float, default=1.1, help='商品人気の Zipf 指数（大きいほど偏る）')
+    parser.add_argument('--user-zipf', type=float, default=0.6, help='ユーザーの購入頻度の Zipf 指数')
+    parser.add_argument('--min-stock', type=int, default=100, help='商品在庫の下限（負荷試験で売り切れないように）')
+    parser.add_argument('--password', default='password123', help='全ユーザー共通のパスワード')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--skip-rollups', action='store_true', help='売上集計を作り直さない')
+    return parser
+
+
+def main():
+    run(build_parser().parse_args())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,362 @@
+"""
+API全体の負荷試験（回帰検知つき）
+
+create_app() をこのプロセス内で起動し（SQLite または PostgreSQL）、benchmarks.datagen で
+データを生成してから、複数のクライアントスレッドで次のシナリオを重みつきで混ぜて流す。
+- browse: 商品一覧（3割は次ページも）→ 商品詳細2件（人気商品に偏る）
+- login: ログイン（bcrypt を含む）
+- checkout: PaymentIntent作成（モック決済）→ 注文作成（Idempotency-Key つき）
+- history: 注文一覧（summary）→ 注文詳細
+
+エンドポイントごとに件数・エラー数・スループット・p50/p95/p99・1リクエストあたりのSQL数を出す。
+SQL数はリクエストを処理したスレッドで数える（テストクライアントは呼び出し元のスレッドで処理するため）。
+
+--save-baseline で結果をJSONに保存し、--baseline で比較する。
+p95・スループット・SQL数・エラー率が許容幅を超えて悪化したら終了コード1で終わる。
+レイテンシとスループットはマシンに依存するため、それらで比較するベースラインは比較するマシンで作ること。
+リポジトリに置くベースラインは --portable で保存し、マシンに依存しないSQL数とエラー率だけで比較する。
+
+使い方:
+    # リポジトリのベースライン（SQL/req・エラー率のみ）
+    python -m benchmarks.loadtest --portable --save-baseline benchmarks/baselines/loadtest-sqlite.json
+    python -m benchmarks.loadtest --baseline benchmarks/baselines/loadtest-sqlite.json
+    # 同じマシンでの変更前後の比較（p95・スループットも）
+    python -m benchmarks.loadtest --save-baseline /tmp/loadtest-before.json
+    python -m benchmarks.loadtest --baseline /tmp/loadtest-before.json
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from sqlalchemy import event, select
+from app import create_app
+from app.models import db, Order
+from benchmarks import datagen
+from benchmarks.common import auth_header, make_config, percentile
+
+SCENARIOS = ('browse', 'login', 'checkout', 'history')
+DEFAULT_MIX = 'browse=70,login=5,checkout=10,history=15'
+# 生成データの最新注文日時（固定してデータを毎回同じにする）
+DATASET_END = datetime(2025, 1, 31, 12, 0, 0)
+PAGE_SIZE = 24
+# ベースラインと比較する指標。--portable のベースラインはマシンに依存しないものだけ
+GATES = ('latency', 'throughput', 'queries', 'errors')
+PORTABLE_GATES = ('queries', 'errors')
+# --portable で保存しない、マシンに依存する値
+_MACHINE_DEPENDENT_STATS = ('rps', 'p50_ms', 'p95_ms', 'p99_ms')
+
+
+def parse_mix(raw):
+    """'browse=70,login=5,...' → {シナリオ: 重み}"""
+    mix = {}
+    for part in raw.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f'不明なシナリオ: {name}（{" / ".join(SCENARIOS)}）')
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError('重みがすべて0です')
+    return mix
+
+
+def seed(args):
+    """datagen のデフォルト値で、件数と乱数の種だけ変えてデータを生成"""
+    dataset = datagen.build_parser().parse_args([])
+    dataset.users, dataset.products, dataset.orders = args.users, args.products, args.orders
+    dataset.seed, dataset.end, dataset.password = args.seed, DATASET_END, args.password
+    
+    db.drop_all()
+    db.create_all()
+    user_ids = datagen.generate_users(dataset, random.Random(f'{args.seed}-users'), DATASET_END)
+    catalog = datagen.generate_products(dataset, random.Random(f'{args.seed}-products'), DATASET_END)
+    if args.orders:
+        datagen.generate_orders(dataset, random.Random(f'{args.seed}-orders'), DATASET_END, user_ids, catalog)
+    datagen._reset_sequences()
+    # 1人目は管理者なので除く
+    return list(range(user_ids[0] + 1, user_ids[1] + 1)), catalog
+
+
+class QueryCounter:
+    """スレッドごとのSQL実行数"""
+    
+    def __init__(self, engine):
+        self._local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+    
+    def _on_execute(self, *args):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+    
+    def reset(self):
+        self._local.count = 0
+    
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+
+class Recorder:
+    """エンドポイントごとの計測結果（計測中でなければ捨てる）"""
+    
+    def __init__(self):
+        self.samples = {}
+        self.recording = False
+        self._lock = threading.Lock()
+    
+    def add(self, name, elapsed, queries, ok):
+        if not self.recording:
+            return
+        with self._lock:
+            latencies, query_counts, errors = self.samples.setdefault(name, ([], [], [0]))
+            latencies.append(elapsed)
+            query_counts.append(queries)
+            if not ok:
+                errors[0] += 1
+
+
+class Client:
+    """1クライアント（スレッド）。ユーザー1人としてシナリオを繰り返す"""
+    
+    def __init__(self, app, index, args, user_ids, catalog, counter, recorder):
+        self.rng = random.Random(f'{args.seed}-client-{index}')
+        self.client = app.test_client()
+        self.args = args
+        self.counter = counter
+        self.recorder = recorder
+        self.user_id = self.rng.choice(user_ids)
+        self.headers = auth_header(app, self.user_id)
+        self.catalog = catalog
+        self.products = datagen.ZipfPicker(catalog.keys(), args.product_zipf, self.rng)
+    
+    def request(self, name, method, path, expected, **kwargs):
+        self.counter.reset()
+        started = time.perf_counter()
+        response = self.client.open(path, method=method, **kwargs)
+        elapsed = time.perf_counter() - started
+        ok = response.status_code == expected
+        self.recorder.add(name, elapsed, self.counter.count, ok)
+        return response if ok else None
+    
+    def browse(self):
+        response = self.request('products.list', 'GET', f'/api/products?limit={PAGE_SIZE}', 200)
+        cursor = response and response.headers.get('X-Next-Cursor')
+        if cursor and self.rng.random() < 0.3:
+            self.request('products.list', 'GET', f'/api/products?limit={PAGE_SIZE}&cursor={cursor}', 200)
+        for _ in range(2):
+            self.request('products.detail', 'GET', f'/api/products/{self.products.pick()}', 200)
+    
+    def login(self):
+        self.request('auth.login', 'POST', '/api/auth/login', 200, json={
+            'email': f'user{self.user_id}@example.com', 'password': self.args.password
+        })
+    
+    def checkout(self):
+        items = []
+        for product_id in sorted({self.products.pick() for _ in range(self.rng.randint(1, 3))}):
+            name, price, _ = self.catalog[product_id]
+            items.append({'productId': product_id, 'productName': name, 'price': price, 'quantity': 1})
+        total = int(sum(item['price'] for item in items))
+        
+        response = self.request('stripe.create_payment_intent', 'POST', '/api/stripe/create-payment-intent', 200,
+                                json={'amount': total}, headers={**self.headers, 'Idempotency-Key': uuid.uuid4().hex})
+        if response is None:
+            return
+        self.request('orders.create', 'POST', '/api/orders', 201, json={
+            'items': items, 'total': total, 'stripePaymentIntentId': response.get_json()['paymentIntentId']
+        }, headers={**self.headers, 'Idempotency-Key': uuid.uuid4().hex})
+    
+    def history(self):
+        response = self.request('orders.list', 'GET', '/api/orders?summary=true&limit=20', 200,
+                                headers=self.headers)
+        orders = response.get_json() if response else None
+        if orders:
+            self.request('orders.detail', 'GET', f'/api/orders/{self.rng.choice(orders)["id"]}', 200,
+                         headers=self.headers)
+    
+    def run(self, mix, stop):
+        names, weights = list(mix), list(mix.values())
+        while not stop.is_set():
+            getattr(self, self.rng.choices(names, weights=weights)[0])()
+
+
+def summarize(samples, duration):
+    endpoints = {}
+    for name, (latencies, query_counts, errors) in sorted(samples.items()):
+        endpoints[name] = {
+            'requests': len(latencies),
+            'errors': errors[0],
+            'rps': round(len(latencies) / duration, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'queries': round(sum(query_counts) / len(query_counts), 2),
+        }
+    requests = sum(e['requests'] for e in endpoints.values())
+    latencies = [value for values, _, _ in samples.values() for value in values]
+    total = {
+        'requests': requests,
+        'errors': sum(e['errors'] for e in endpoints.values()),
+        'rps': round(requests / duration, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'queries': round(sum(sum(counts) for _, counts, _ in samples.values()) / max(requests, 1), 2),
+    }
+    return endpoints, total
+
+
+def print_results(endpoints, total):
+    print(f'  {"エンドポイント":<30}{"件数":>8}{"エラー":>7}{"req/s":>9}{"p50":>9}{"p95":>9}{"p99":>9}{"SQL/req":>9}')
+    for name, stats in [*endpoints.items(), ('合計', total)]:
+        print(f'  {name:<30}{stats["requests"]:>8}{stats["errors"]:>7}{stats["rps"]:>9.1f}'
+              f'{stats["p50_ms"]:>8.1f}ms{stats["p95_ms"]:>7.1f}ms{stats["p99_ms"]:>7.1f}ms{stats["queries"]:>9.2f}')
+
+
+def compare(result, baseline, args):
+    """ベースラインとの比較（ベースラインの gates の指標だけ）。悪化した項目のメッセージを返す"""
+    if baseline['settings'] != result['settings']:
+        raise SystemExit(f'ベースラインと条件が違います: {baseline["settings"]} != {result["settings"]}')
+    
+    gates = baseline.get('gates', GATES)
+    print(f'比較する指標: {", ".join(gates)}')
+    regressions = []
+    
+    def check(label, current, base):
+        if 'latency' in gates:
+            latency_limit = max(base['p95_ms'] * (1 + args.latency_tolerance), base['p95_ms'] + args.latency_floor_ms)
+            if current['p95_ms'] > latency_limit:
+                regressions.append(f'{label}: p95 {base["p95_ms"]}ms → {current["p95_ms"]}ms')
+        if 'queries' in gates and current['queries'] > base['queries'] + args.query_tolerance:
+            regressions.append(f'{label}: SQL/req {base["queries"]} → {current["queries"]}')
+        if 'errors' in gates:
+            error_rate = current['errors'] / max(current['requests'], 1)
+            base_error_rate = base['errors'] / max(base['requests'], 1)
+            if error_rate > base_error_rate + args.error_tolerance:
+                regressions.append(f'{label}: エラー率 {base_error_rate:.1%} → {error_rate:.1%}')
+    
+    for name, base in baseline['endpoints'].items():
+        current = result['endpoints'].get(name)
+        if current is None:
+            regressions.append(f'{name}: リクエストがありません')
+        else:
+            check(name, current, base)
+    check('合計', result['total'], baseline['total'])
+    if 'throughput' in gates and result['total']['rps'] < baseline['total']['rps'] * (1 - args.throughput_tolerance):
+        regressions.append(f'合計: スループット {baseline["total"]["rps"]} → {result["total"]["rps"]} req/s')
+    return regressions
+
+
+def portable_baseline(result):
+    """マシンに依存する値（レイテンシ・スループット）を除き、SQL数とエラー率だけで比較するベースライン"""
+    def strip(stats):
+        return {key: value for key, value in stats.items() if key not in _MACHINE_DEPENDENT_STATS}
+    return {
+        'settings': result['settings'],
+        'gates': list(PORTABLE_GATES),
+        'endpoints': {name: strip(stats) for name, stats in result['endpoints'].items()},
+        'total': strip(result['total']),
+    }
+
+
+def _write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+
+def run(args):
+    app = create_app(make_config(args.database_url, **({'BCRYPT_ROUNDS': args.rounds} if args.rounds else {})))
+    with app.app_context():
+        started = time.perf_counter()
+        user_ids, catalog = seed(args)
+        print(f'データ生成: {time.perf_counter() - started:.1f}s')
+        dialect = db.engine.dialect.name
+        counter = QueryCounter(db.engine)
+        order_count = db.session.scalar(select(db.func.count(Order.id)))
+    
+    mix = args.mix
+    recorder = Recorder()
+    stop = threading.Event()
+    clients = [Client(app, i, args, user_ids, catalog, counter, recorder) for i in range(args.clients)]
+    threads = [threading.Thread(target=client.run, args=(mix, stop)) for client in clients]
+    for thread in threads:
+        thread.start()
+    
+    # ウォームアップ（キャッシュ・接続プールを温める）の後から計測する
+    time.sleep(args.warmup)
+    recorder.recording = True
+    started = time.perf_counter()
+    time.sleep(args.duration)
+    recorder.recording = False
+    duration = time.perf_counter() - started
+    stop.set()
+    for thread in threads:
+        thread.join()
+    
+    endpoints, total = summarize(recorder.samples, duration)
+    print(f'{dialect} users={len(user_ids) + 1} products={len(catalog)} orders={order_count} '
+          f'clients={args.clients} duration={args.duration}s mix={mix}')
+    print_results(endpoints, total)
+    
+    result = {
+        'settings': {
+            'database': dialect, 'users': args.users, 'products': args.products, 'orders': args.orders,
+            'seed': args.seed, 'clients': args.clients, 'mix': mix, 'rounds': args.rounds,
+            'warmup': args.warmup, 'duration': args.duration,
+        },
+        'endpoints': endpoints,
+        'total': total,
+    }
+    if args.output:
+        _write_json(args.output, result)
+    if args.save_baseline:
+        _write_json(args.save_baseline, portable_baseline(result) if args.portable else result)
+    if args.save_baseline:
+        print(f'ベースラインを保存しました: {args.save_baseline}')
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args)
+        if regressions:
+            print('ベースラインから悪化しました:')
+            for message in regressions:
+                print(f'  - {message}')
+            sys.exit(1)
+        print('ベースラインとの比較: OK')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='未指定なら一時SQLiteファイル（指定したDBは全テーブルを作り直す）')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--password', default='password123')
+    # 本番の work factor ではログインが bcrypt の待ち行列に偏り、他のシナリオの変化が埋もれる
+    parser.add_argument('--rounds', type=int, default=10, help='bcrypt の work factor（0なら BCRYPT_ROUNDS）')
+    parser.add_argument('--product-zipf', type=float, default=1.1, help='閲覧・購入する商品の偏り')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'シナリオの重み（デフォルト {DEFAULT_MIX}）')
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--output', help='結果をJSONで書き出す')
+    parser.add_argument('--save-baseline', help='結果をベースラインとして保存')
+    parser.add_argument('--portable', action='store_true',
+                        help='マシンに依存しない指標（SQL/req・エラー率）だけのベースラインを保存する（リポジトリに置くもの）')
+    parser.add_argument('--baseline', help='比較するベースライン（悪化したら終了コード1）')
+    parser.add_argument('--latency-tolerance', type=float, default=0.3, help='p95の許容増加率')
+    parser.add_argument('--latency-floor-ms', type=float, default=2.0, help='p95の増加がこれ以下なら許容')
+    parser.add_argument('--throughput-tolerance', type=float, default=0.2, help='スループットの許容減少率')
+    parser.add_argument('--query-tolerance', type=float, default=0.5, help='SQL/req の許容増加数')
+    parser.add_argument('--error-tolerance', type=float, default=0.01, help='エラー率の許容増加（割合）')
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
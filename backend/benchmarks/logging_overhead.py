@@ -0,0 +1,109 @@
+"""
+ログ出力がリクエストのレイテンシに与える影響のベンチマーク
+
+stdout を「1回の書き込みに --write-delay-ms かかる」ストリームに差し替え
+（詰まったパイプ・遅いログドライバーの代わり）、商品詳細（1リクエストでアクセスログ1行）を
+複数スレッドで読み続けて、次の2つを比較する。
+- sync: リクエストスレッドで直接書く（LOG_ASYNC=false。print() と同じ）
+- async: キューに積んでバックグラウンドスレッドで書く（LOG_ASYNC=true）
+
+使い方:
+    python -m benchmarks.logging_overhead --threads 8 --duration 5 --write-delay-ms 1
+"""
+import argparse
+import logging
+import sys
+import threading
+import time
+from app import create_app
+from app.models import db, Product
+from benchmarks.common import make_config, percentile
+
+
+class SlowStream:
+    """書き込みごとに待つストリーム（書いた行数を数えるだけで内容は捨てる）"""
+    
+    def __init__(self, delay):
+        self.delay = delay
+        self.lines = 0
+        self._lock = threading.Lock()
+    
+    def write(self, text):
+        with self._lock:
+            time.sleep(self.delay)
+            self.lines += text.count('\n')
+        return len(text)
+    
+    def flush(self):
+        pass
+
+
+def measure(mode, args):
+    stream = SlowStream(args.write_delay_ms / 1000)
+    original, sys.stdout = sys.stdout, stream
+    try:
+        app = create_app(make_config(
+            args.database_url,
+            LOG_ASYNC=mode == 'async',
+            LOG_QUEUE_SIZE=args.queue_size
+        ))
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            db.session.add_all([Product(name=f'商品{i}', price=1000, stock=10) for i in range(50)])
+            db.session.commit()
+        
+        latencies = []
+        lock = threading.Lock()
+        stop = threading.Event()
+        
+        def worker():
+            client = app.test_client()
+            count = 0
+            local = []
+            while not stop.is_set():
+                started = time.perf_counter()
+                client.get(f'/api/products/{count % 50 + 1}')
+                local.append(time.perf_counter() - started)
+                count += 1
+            with lock:
+                latencies.extend(local)
+        
+        threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        written_during_run = stream.lines
+        
+        # バックグラウンドスレッドに残ったログを書き出してから数える
+        for handler in logging.getLogger().handlers:
+            if hasattr(handler, 'stop'):
+                handler.stop()
+    finally:
+        sys.stdout = original
+    
+    print(f'  {mode:<6} {len(latencies) / elapsed:8.0f} req/s  '
+          f'p50 {percentile(latencies, 50) * 1000:6.2f}ms  p99 {percentile(latencies, 99) * 1000:6.2f}ms  '
+          f'書き込んだ行 {written_during_run}（計測中）/ {stream.lines}（終了時）/ リクエスト {len(latencies)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='未指定なら一時SQLiteファイル')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--write-delay-ms', type=float, default=1.0)
+    parser.add_argument('--queue-size', type=int, default=10000)
+    args = parser.parse_args()
+    print(f'threads={args.threads} duration={args.duration}s write-delay={args.write_delay_ms}ms')
+    for mode in ('sync', 'async'):
+        measure(mode, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+ログイン集中時のベンチマーク
+
+ログインを連続で送るスレッドと、商品詳細を読むスレッドを同時に動かし、
+ログインのレイテンシ（p50/p99）と、その間の商品読み込みスループットを計測する。
+--pool-size / --max-pending / --rounds を変えて比較する。
+
+使い方:
+    python -m benchmarks.login_storm --login-threads 8 --read-threads 4 --duration 10
+"""
+import argparse
+import threading
+import time
+from app import create_app
+from app.models import db, User, Product
+from benchmarks.common import make_config, percentile
+
+
+def run(args):
+    app = create_app(make_config(
+        args.database_url,
+        BCRYPT_ROUNDS=args.rounds,
+        BCRYPT_POOL_SIZE=args.pool_size,
+        BCRYPT_MAX_PENDING=args.max_pending,
+        # 読み込みは毎回DBに行くようにキャッシュを無効化
+        CATALOG_CACHE_ENABLED=False
+    ))
+    
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(email='storm@example.com', display_name='storm')
+        user.set_password('password123')
+        db.session.add(user)
+        db.session.add_all([Product(name=f'商品{i}', price=1000, stock=10) for i in range(50)])
+        db.session.commit()
+    
+    login_latencies = []
+    login_status = {}
+    reads = [0]
+    lock = threading.Lock()
+    stop = threading.Event()
+    
+    def login_worker():
+        client = app.test_client()
+        payload = {'email': 'storm@example.com', 'password': 'password123'}
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = client.post('/api/auth/login', json=payload)
+            elapsed = time.perf_counter() - started
+            with lock:
+                login_latencies.append(elapsed)
+                login_status[response.status_code] = login_status.get(response.status_code, 0) + 1
+    
+    def read_worker():
+        client = app.test_client()
+        count = 0
+        while not stop.is_set():
+            client.get(f'/api/products/{count % 50 + 1}')
+            count += 1
+        with lock:
+            reads[0] += count
+    
+    threads = (
+        [threading.Thread(target=login_worker) for _ in range(args.login_threads)] +
+        [threading.Thread(target=read_worker) for _ in range(args.read_threads)]
+    )
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    
+    print(f'bcrypt rounds={args.rounds}, pool={args.pool_size}, max_pending={args.max_pending}')
+    print(f'ログイン: {len(login_latencies)}件 ステータス={login_status}')
+    print(f'  p50={percentile(login_latencies, 50) * 1000:.1f}ms '
+          f'p99={percentile(login_latencies, 99) * 1000:.1f}ms')
+    print(f'商品読み込み: {reads[0] / args.duration:.1f} req/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='未指定なら一時SQLiteファイル')
+    parser.add_argument('--login-threads', type=int, default=8)
+    parser.add_argument('--read-threads', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--pool-size', type=int, default=2)
+    parser.add_argument('--max-pending', type=int, default=16)
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
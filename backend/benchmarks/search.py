@@ -0,0 +1,118 @@
+"""
+商品検索のベンチマーク
+
+合成した日本語の商品データ（デフォルト10万件）で、文字bigramインデックスの
+構築時間・メモリ増分・検索レイテンシ（p50/p99）を計測し、SQLの LIKE '%語%' と比べる。
+あわせて、商品1件の更新をインデックスに反映する時間も出力する。
+
+使い方:
+    python -m benchmarks.search --products 100000 --queries 200
+"""
+import argparse
+import random
+import time
+from sqlalchemy import insert, or_, select
+from app import create_app
+from app.models import db, Product
+from app.services.search_index import search_index
+from benchmarks.common import make_config, percentile
+from benchmarks.datagen import ANIMALS, CATEGORIES, COLORS, ITEMS, PHRASES
+
+QUERIES = ['アザラシ', 'あざらし', 'マフラー', 'ピンク うさぎ', 'プレゼント', '毛糸', 'ニット帽 黒',
+           'インテリア', 'ミトン', 'きつねのポーチ', 'ハンドメイド', 'ｺｰｽﾀｰ', 'ラベンダー', '冬']
+
+
+def make_products(count, rng):
+    for i in range(count):
+        color, animal, item = rng.choice(COLORS), rng.choice(ANIMALS), rng.choice(ITEMS)
+        yield {
+            'name': f'{color}の{animal}{item} No.{i}',
+            'price': rng.randint(500, 9000),
+            'description': f'{animal}をモチーフにした{color}の{item}。' + ''.join(rng.sample(PHRASES, 3)),
+            'category': rng.choice(CATEGORIES),
+            'stock': rng.randint(0, 30),
+        }
+
+
+def rss_mib():
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    import resource
+    return pages * resource.getpagesize() / (1024 * 1024)
+
+
+def like_search(query, limit):
+    """比較用: SQLの部分一致（インデックスが使えず全件走査）"""
+    stmt = select(Product.id)
+    for term in query.split():
+        pattern = f'%{term}%'
+        stmt = stmt.where(or_(
+            Product.name.like(pattern), Product.category.like(pattern), Product.description.like(pattern)
+        ))
+    return db.session.execute(stmt.order_by(Product.id.desc()).limit(limit)).scalars().all()
+
+
+def timed(fn, queries, limit):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query, limit)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def run(args):
+    app = create_app(make_config(args.database_url))
+    rng = random.Random(0)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        batch = []
+        for row in make_products(args.products, rng):
+            batch.append(row)
+            if len(batch) == 5000:
+                db.session.execute(insert(Product), batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(Product), batch)
+        db.session.commit()
+        
+        before = rss_mib()
+        started = time.perf_counter()
+        search_index.build()
+        build_time = time.perf_counter() - started
+        stats = search_index.stats()
+        print(f'products={args.products} 構築 {build_time:.2f}s  RSS増分 {rss_mib() - before:.0f}MiB  '
+              f'bigram {stats["grams"]}種 postings {stats["postings"]}')
+        
+        queries = [rng.choice(QUERIES) for _ in range(args.queries)]
+        for label, fn in (('bigramインデックス', search_index.search), ('SQL LIKE', like_search)):
+            if label == 'SQL LIKE' and args.skip_like:
+                continue
+            timings = timed(fn, queries, args.limit)
+            print(f'  {label}: p50={percentile(timings, 50) * 1000:.2f}ms p99={percentile(timings, 99) * 1000:.2f}ms')
+        
+        for query in QUERIES[:5]:
+            total, ids = search_index.search(query, 3)
+            names = [db.session.get(Product, i).name for i in ids]
+            print(f'  「{query}」 {total}件 上位: {names}')
+        
+        product = db.session.get(Product, 1)
+        started = time.perf_counter()
+        for _ in range(100):
+            search_index.upsert(product)
+        print(f'  1件の更新反映: {(time.perf_counter() - started) / 100 * 1000:.3f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='未指定なら一時SQLiteファイル')
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--skip-like', action='store_true', help='SQL LIKE との比較を省く')
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+シリアライズのマイクロベンチマーク
+
+商品10,000件と注文1,000件（明細つき）を、次の組み合わせでJSONのbytesにする時間を計測する。
+- ORMオブジェクト + to_dict() / カラムタプル + rows_to_dicts()
+- 標準json / orjson（インストールされていれば）
+DBからの取得時間も含む（ORMではオブジェクトの組み立てがここに入るため）。
+
+使い方:
+    python -m benchmarks.serialization --products 10000 --orders 1000 --repeat 5
+"""
+import argparse
+import random
+import statistics
+import time
+from sqlalchemy import insert, select
+from sqlalchemy.orm import selectinload
+from app import create_app
+from app.json_provider import OrjsonProvider, StdlibJSONProvider, orjson
+from app.models import db, User, Product, Order, OrderItem
+from app.utils.serialization import api_columns, rows_to_dicts
+from benchmarks.common import make_config
+
+
+def seed(args):
+    user = User(email='bench@example.com', display_name='bench')
+    user.password_hash = 'x'
+    db.session.add(user)
+    db.session.flush()
+    db.session.execute(insert(Product), [
+        {'name': f'商品{i}', 'price': 1000 + i, 'description': f'説明{i} ' * 10,
+         'stock': i % 50, 'category': f'カテゴリ{i % 20}', 'image_url': f'/api/images/{i:064x}.png'}
+        for i in range(args.products)
+    ])
+    db.session.execute(insert(Order), [
+        {'user_id': user.id, 'total': 3000, 'status': 'paid', 'stripe_payment_intent_id': f'pi_{i}'}
+        for i in range(args.orders)
+    ])
+    order_ids = db.session.execute(select(Order.id)).scalars().all()
+    rng = random.Random(0)
+    db.session.execute(insert(OrderItem), [
+        {'order_id': order_id, 'product_id': rng.randint(1, args.products),
+         'product_name': f'商品{n}', 'quantity': n + 1, 'price': 1000}
+        for order_id in order_ids for n in range(args.items)
+    ])
+    db.session.commit()
+
+
+def products_orm():
+    return [p.to_dict() for p in Product.query.order_by(Product.id).all()]
+
+
+def products_tuples():
+    keys, columns = api_columns(Product)
+    return rows_to_dicts(keys, db.session.execute(select(*columns).order_by(Product.id)).all())
+
+
+def orders_orm():
+    orders = Order.query.options(selectinload(Order.items)).order_by(Order.id).all()
+    return [o.to_dict() for o in orders]
+
+
+def orders_tuples():
+    keys, columns = api_columns(Order)
+    orders = rows_to_dicts(keys, db.session.execute(select(*columns).order_by(Order.id)).all())
+    item_keys, item_columns = api_columns(OrderItem)
+    items = {}
+    rows = db.session.execute(select(*item_columns).order_by(OrderItem.id)).all()
+    for item in rows_to_dicts(item_keys, rows):
+        items.setdefault(item['orderId'], []).append(item)
+    for order in orders:
+        order['items'] = items.get(order['id'], [])
+    return orders
+
+
+def measure(build, provider, repeat):
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        body = provider.dumps_bytes(build())
+        timings.append(time.perf_counter() - started)
+        size = len(body)
+    return statistics.median(timings), size
+
+
+def run(args):
+    app = create_app(make_config(args.database_url))
+    providers = {'stdlib': StdlibJSONProvider(app)}
+    if orjson is not None:
+        providers['orjson'] = OrjsonProvider(app)
+    else:
+        print('orjson がインストールされていないため、標準jsonのみ計測します')
+    
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(args)
+        
+        print(f'products={args.products} orders={args.orders} items/order={args.items} repeat={args.repeat}（中央値）')
+        cases = [
+            ('商品一覧', 'ORM + to_dict', products_orm),
+            ('商品一覧', 'カラムタプル', products_tuples),
+            ('注文一覧', 'ORM + to_dict', orders_orm),
+            ('注文一覧', 'カラムタプル', orders_tuples),
+        ]
+        for target, method, build in cases:
+            for name, provider in providers.items():
+                elapsed, size = measure(build, provider, args.repeat)
+                print(f'  {target} {name:<7} {elapsed * 1000:8.1f}ms  {size / 1024:6.0f}KiB  {method}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='未指定なら一時SQLiteファイル')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--orders', type=int, default=1000)
+    parser.add_argument('--items', type=int, default=3, help='1注文あたりの明細数')
+    parser.add_argument('--repeat', type=int, default=5)
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+起動時間のベンチマーク
+
+Gunicornを起動して最初の応答が返るまで（コールド起動）と、ワーカーを強制終了してから
+新しいワーカーが最初の応答を返すまで（fork → 最初の応答）を計測する。
+preload_app の有無（GUNICORN_PRELOAD）で比較する。Linux専用（/proc で子プロセスを調べる）。
+
+使い方:
+    python -m benchmarks.startup --respawns 5
+    python -m benchmarks.startup --modes preload --workers 1
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import requests
+from app import create_app
+from app.models import db, Product
+from benchmarks.common import make_config, config_env, percentile
+from benchmarks.worker_profiles import BACKEND_DIR, _free_port
+
+
+def _worker_pids(master_pid):
+    try:
+        with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+            return {int(pid) for pid in f.read().split()}
+    except FileNotFoundError:
+        return set()
+
+
+def _wait_first_response(url, deadline, process):
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Gunicornが終了しました（exit={process.returncode}）')
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return time.perf_counter()
+        except requests.RequestException:
+            pass
+        time.sleep(0.005)
+    raise RuntimeError('応答待ちがタイムアウトしました')
+
+
+def measure(mode, args, env):
+    """1モード分の コールド起動時間 と ワーカー再起動時間のリスト を返す"""
+    port = _free_port()
+    url = f'http://127.0.0.1:{port}/api/products'
+    env = dict(os.environ, **env,
+               GUNICORN_PRELOAD='true' if mode == 'preload' else 'false',
+               GUNICORN_WORKERS=str(args.workers))
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+         '--bind', f'127.0.0.1:{port}', '--access-logfile', '/dev/null', 'wsgi:app'],
+        cwd=BACKEND_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        cold = _wait_first_response(url, started + 60, process) - started
+        # 全ワーカーが揃うまで待つ
+        while len(_worker_pids(process.pid)) < args.workers:
+            time.sleep(0.05)
+        
+        respawns = []
+        for _ in range(args.respawns):
+            # 全ワーカーを落とし、新しいワーカーが応答するまでを計る
+            old = _worker_pids(process.pid)
+            killed = time.perf_counter()
+            for pid in old:
+                os.kill(pid, signal.SIGKILL)
+            while _worker_pids(process.pid) & old:
+                time.sleep(0.001)
+            respawns.append(_wait_first_response(url, killed + 60, process) - killed)
+            while len(_worker_pids(process.pid)) < args.workers:
+                time.sleep(0.05)
+        return cold, respawns
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+
+
+def run(args):
+    config = make_config(args.database_url)
+    app = create_app(config)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add_all([Product(name=f'商品{i}', price=1000, stock=10) for i in range(args.products)])
+        db.session.commit()
+    env = config_env(config)
+    
+    print(f'workers={args.workers} products={args.products} respawns={args.respawns}')
+    for mode in args.modes.split(','):
+        cold, respawns = measure(mode, args, env)
+        print(f'[{mode}] コールド起動: {cold * 1000:.0f}ms')
+        print(f'  fork → 最初の応答: p50={percentile(respawns, 50) * 1000:.0f}ms '
+              f'max={max(respawns) * 1000:.0f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='未指定なら一時SQLiteファイル')
+    parser.add_argument('--modes', default='no-preload,preload', help='no-preload / preload（カンマ区切り）')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--respawns', type=int, default=5)
+    parser.add_argument('--products', type=int, default=1000)
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
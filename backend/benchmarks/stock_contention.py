@@ -0,0 +1,97 @@
+"""
+在庫引当の並行性ストレステスト
+
+在庫の少ない人気商品1つに対して複数スレッドから同時に注文し、
+売り越し（在庫を超える注文成立・在庫のマイナス）が起きないことを検証する。
+あわせて注文のスループット（orders/sec）を計測する。
+
+使い方:
+    python -m benchmarks.stock_contention --threads 16 --orders 50 --stock 200
+    python -m benchmarks.stock_contention --database-url postgresql://...
+"""
+import argparse
+import sys
+import threading
+import time
+from app import create_app
+from app.models import db, User, Product
+from benchmarks.common import make_config, auth_header
+
+
+def run(database_url, threads, orders_per_thread, stock, quantity):
+    app = create_app(make_config(database_url))
+    
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(email='bench@example.com', display_name='bench', password_hash='x')
+        product = Product(name='人気商品', price=1000, stock=stock)
+        db.session.add_all([user, product])
+        db.session.commit()
+        user_id, product_id = user.id, product.id
+    
+    headers = auth_header(app, user_id)
+    payload = {
+        'items': [{
+            'productId': product_id,
+            'productName': '人気商品',
+            'quantity': quantity,
+            'price': 1000
+        }],
+        'total': 1000 * quantity
+    }
+    
+    results = {'created': 0, 'rejected': 0, 'errors': 0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+    
+    def worker():
+        client = app.test_client()
+        barrier.wait()
+        for _ in range(orders_per_thread):
+            response = client.post('/api/orders', json=payload, headers=headers)
+            key = {201: 'created', 400: 'rejected'}.get(response.status_code, 'errors')
+            with lock:
+                results[key] += 1
+    
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    
+    with app.app_context():
+        final_stock = db.session.get(Product, product_id).stock
+    
+    sold = results['created'] * quantity
+    total = threads * orders_per_thread
+    print(f'注文リクエスト: {total} ({threads}スレッド x {orders_per_thread})')
+    print(f'成立: {results["created"]}, 在庫不足: {results["rejected"]}, エラー: {results["errors"]}')
+    print(f'販売数: {sold} / 初期在庫: {stock}, 最終在庫: {final_stock}')
+    print(f'スループット: {total / elapsed:.1f} req/s, 成立 {results["created"] / elapsed:.1f} orders/s')
+    
+    oversold = final_stock < 0 or sold + final_stock != stock
+    if oversold:
+        print('❌ 売り越しを検出しました')
+    else:
+        print('✅ 売り越しなし')
+    return not oversold
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='未指定なら一時SQLiteファイル')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--orders', type=int, default=50, help='スレッドあたりの注文数')
+    parser.add_argument('--stock', type=int, default=200)
+    parser.add_argument('--quantity', type=int, default=1, help='1注文あたりの数量')
+    args = parser.parse_args()
+    
+    ok = run(args.database_url, args.threads, args.orders, args.stock, args.quantity)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
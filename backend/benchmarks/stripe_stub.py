@@ -0,0 +1,134 @@
+"""
+ローカル用のStripe APIスタブサーバー
+
+PaymentIntentの作成・取得だけを実装した最小限のHTTPサーバー。
+STRIPE_API_BASE をこのサーバーに向けると、実際のStripeに接続せずに
+タイムアウト・リトライ・キャッシュの挙動や負荷試験を確認できる。
+Webhook用に、ローカルで署名した偽イベントを作るヘルパーもある。
+
+使い方:
+    python -m benchmarks.stripe_stub --port 12111 --delay 0.05
+    STRIPE_SECRET_KEY=sk_test_stub STRIPE_API_BASE=http://127.0.0.1:12111 python app.py
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class StripeStubHandler(BaseHTTPRequestHandler):
+    # server属性: intents(dict), delay(秒), requests(呼び出し回数)
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _send(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.send_header('Request-Id', f'req_{uuid.uuid4().hex[:14]}')
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # クライアント側がタイムアウトで切断した
+            pass
+    
+    def _before(self):
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.delay:
+            time.sleep(self.server.delay)
+    
+    def do_POST(self):
+        self._before()
+        if self.path != '/v1/payment_intents':
+            return self._send(404, {'error': {'type': 'invalid_request_error', 'message': 'not found'}})
+        length = int(self.headers.get('Content-Length') or 0)
+        params = parse_qs(self.rfile.read(length).decode('utf-8'))
+        intent_id = f'pi_stub_{uuid.uuid4().hex[:24]}'
+        intent = {
+            'id': intent_id,
+            'object': 'payment_intent',
+            'amount': int(params.get('amount', ['0'])[0]),
+            'currency': params.get('currency', ['jpy'])[0],
+            # スタブでは作成と同時に決済成功とする
+            'status': 'succeeded',
+            'client_secret': f'{intent_id}_secret_{uuid.uuid4().hex[:24]}',
+        }
+        with self.server.lock:
+            self.server.intents[intent_id] = intent
+        self._send(200, intent)
+    
+    def do_GET(self):
+        self._before()
+        prefix = '/v1/payment_intents/'
+        intent = self.server.intents.get(self.path[len(prefix):]) if self.path.startswith(prefix) else None
+        if not intent:
+            return self._send(404, {'error': {
+                'type': 'invalid_request_error', 'code': 'resource_missing', 'message': 'No such payment_intent'
+            }})
+        self._send(200, intent)
+
+
+def sign_webhook_payload(payload, secret, timestamp=None):
+    """ローカルでWebhookの Stripe-Signature ヘッダー値を生成（偽イベントのテスト用）"""
+    timestamp = int(timestamp or time.time())
+    signature = hmac.new(
+        secret.encode('utf-8'),
+        f'{timestamp}.{payload}'.encode('utf-8'),
+        hashlib.sha256
+    ).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+def make_payment_intent_event(payment_intent_id, amount, event_type='payment_intent.succeeded'):
+    """テスト用のPaymentIntentイベント（JSON文字列）を生成"""
+    return json.dumps({
+        'id': f'evt_stub_{uuid.uuid4().hex[:24]}',
+        'object': 'event',
+        'type': event_type,
+        'data': {'object': {
+            'id': payment_intent_id,
+            'object': 'payment_intent',
+            'amount': amount,
+            'status': 'succeeded' if event_type == 'payment_intent.succeeded' else 'requires_payment_method',
+        }},
+    })
+
+
+def start_stub_server(port=0, delay=0.0):
+    """スタブサーバーをバックグラウンドスレッドで起動して返す（server.server_port で実ポート）"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), StripeStubHandler)
+    server.intents = {}
+    server.delay = delay
+    server.requests = 0
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=12111)
+    parser.add_argument('--delay', type=float, default=0.0, help='各レスポンスの遅延（秒）')
+    args = parser.parse_args()
+    
+    server = start_stub_server(args.port, args.delay)
+    print(f'Stripeスタブ起動: http://127.0.0.1:{server.server_port}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
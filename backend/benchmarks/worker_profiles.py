@@ -0,0 +1,180 @@
+"""
+Gunicornワーカー種別（sync / gthread / gevent）の比較ベンチマーク
+
+同じDB・同じStripeスタブ（応答遅延つき）に対して、ワーカー種別ごとにGunicornを起動し、
+商品一覧の閲覧と購入（PaymentIntent作成 → 注文作成）を混ぜた負荷をかける。
+プロファイルごとのスループットと、閲覧・購入それぞれの p50/p99 を出力する。
+
+使い方:
+    python -m benchmarks.worker_profiles --clients 32 --duration 15 --stripe-delay 0.2
+    python -m benchmarks.worker_profiles --profiles sync,gthread --workers 4 --threads 8
+"""
+import argparse
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import requests
+from app import create_app
+from app.models import db, User, Product
+from benchmarks.common import make_config, config_env, auth_header, percentile
+from benchmarks.stripe_stub import start_stub_server
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _profile_env(profile, args):
+    if profile == 'sync':
+        return {'GUNICORN_WORKER_CLASS': 'sync', 'GUNICORN_THREADS': '1'}
+    if profile == 'gthread':
+        return {'GUNICORN_WORKER_CLASS': 'gthread', 'GUNICORN_THREADS': str(args.threads)}
+    if profile == 'gevent':
+        return {'GUNICORN_WORKER_CLASS': 'gevent', 'GUNICORN_WORKER_CONNECTIONS': str(args.connections)}
+    raise ValueError(f'未知のプロファイル: {profile}')
+
+
+def start_gunicorn(profile, args, env):
+    """Gunicornを起動し、応答するまで待つ"""
+    port = _free_port()
+    env = dict(os.environ, **env, **_profile_env(profile, args), GUNICORN_WORKERS=str(args.workers))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+         '--bind', f'127.0.0.1:{port}', '--access-logfile', '/dev/null', 'wsgi:app'],
+        cwd=BACKEND_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{profile}: Gunicornが起動できませんでした（exit={process.returncode}）')
+        try:
+            if requests.get(f'{base_url}/api/products', timeout=1).status_code == 200:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'{profile}: Gunicornの起動がタイムアウトしました')
+
+
+def run_load(base_url, headers, product_ids, args):
+    """閲覧と購入を混ぜた負荷をかけ、操作ごとのレイテンシとステータスを集計"""
+    latencies = {'catalog': [], 'checkout': []}
+    statuses = {}
+    lock = threading.Lock()
+    stop = threading.Event()
+    
+    def checkout(session):
+        product_id = random.choice(product_ids)
+        response = session.post(f'{base_url}/api/stripe/create-payment-intent',
+                                json={'amount': 1000}, headers=headers, timeout=30)
+        if response.status_code != 200:
+            return response
+        return session.post(f'{base_url}/api/orders', headers=headers, timeout=30, json={
+            'items': [{'productId': product_id, 'productName': f'商品{product_id}', 'quantity': 1, 'price': 1000}],
+            'total': 1000,
+            'stripePaymentIntentId': response.json()['paymentIntentId'],
+        })
+    
+    def client():
+        session = requests.Session()
+        rng = random.Random()
+        while not stop.is_set():
+            kind = 'checkout' if rng.random() < args.checkout_ratio else 'catalog'
+            started = time.perf_counter()
+            try:
+                if kind == 'checkout':
+                    status = checkout(session).status_code
+                else:
+                    status = session.get(f'{base_url}/api/products', params={'limit': 20}, timeout=30).status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies[kind].append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+    
+    threads = [threading.Thread(target=client) for _ in range(args.clients)]
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    return latencies, statuses
+
+
+def run(args):
+    config = make_config(
+        args.database_url,
+        STRIPE_SECRET_KEY='sk_test_stub',
+        CATALOG_CACHE_ENABLED=not args.no_cache
+    )
+    app = create_app(config)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(email='bench@example.com', display_name='bench')
+        user.set_password('password123')
+        db.session.add(user)
+        db.session.add_all([Product(name=f'商品{i}', price=1000, stock=10 ** 9) for i in range(args.products)])
+        db.session.commit()
+        user_id = user.id
+        product_ids = [p.id for p in Product.query.all()]
+    headers = auth_header(app, user_id)
+    
+    stub = start_stub_server(delay=args.stripe_delay)
+    env = dict(
+        config_env(config),
+        STRIPE_SECRET_KEY='sk_test_stub',
+        STRIPE_API_BASE=f'http://127.0.0.1:{stub.server_port}',
+        CATALOG_CACHE_ENABLED='false' if args.no_cache else 'true',
+    )
+    
+    print(f'workers={args.workers} clients={args.clients} duration={args.duration}s '
+          f'checkout={args.checkout_ratio:.0%} stripe_delay={args.stripe_delay * 1000:.0f}ms')
+    for profile in args.profiles.split(','):
+        process, base_url = start_gunicorn(profile, args, env)
+        try:
+            latencies, statuses = run_load(base_url, headers, product_ids, args)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=30)
+        
+        total = sum(len(v) for v in latencies.values())
+        print(f'[{profile}] {total / args.duration:.1f} req/s ステータス={statuses}')
+        for kind, values in latencies.items():
+            print(f'  {kind}: {len(values)}件 p50={percentile(values, 50) * 1000:.1f}ms '
+                  f'p99={percentile(values, 99) * 1000:.1f}ms')
+    stub.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='未指定なら一時SQLiteファイル')
+    parser.add_argument('--profiles', default='sync,gthread,gevent')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='gthread のスレッド数')
+    parser.add_argument('--connections', type=int, default=100, help='gevent の同時接続数')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--checkout-ratio', type=float, default=0.2)
+    parser.add_argument('--stripe-delay', type=float, default=0.2, help='Stripeスタブの応答遅延（秒）')
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--no-cache', action='store_true', help='カタログキャッシュを無効化')
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,12 @@
 import os
+import multiprocessing
 from datetime import timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
 
+basedir = os.path.abspath(os.path.dirname(__file__))
+
 class Config:
     """Flask設定クラス"""
     
@@ -13,19 +16,153 @@ class Config:
     # データベース設定
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # SQLALCHEMY_ENGINE_OPTIONS は create_app() で接続先とワーカー数から生成する（app/db_engine.py）
+    PG_MAX_CONNECTIONS = int(os.getenv('PG_MAX_CONNECTIONS', 100))
+    DB_RESERVED_CONNECTIONS = int(os.getenv('DB_RESERVED_CONNECTIONS', 10))  # マイグレーション・管理用に残す接続数
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', 5))
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 5000))
+    # 読み取りレプリカ（カンマ区切りのURL。空ならすべてプライマリ）。振り分けは app/db_routing.py
+    DATABASE_REPLICA_URLS = os.getenv('DATABASE_REPLICA_URLS', '')
+    DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv('DB_REPLICA_MAX_LAG_SECONDS', 5))  # これより遅れたレプリカは使わない
+    DB_REPLICA_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', 2))  # 遅延を測る間隔（秒、ワーカーごと）
+    # 自分の書き込みからこの秒数はプライマリを読む（遅延の上限 + 確認間隔より短くはならない）
+    DB_READ_YOUR_WRITES_SECONDS = float(os.getenv('DB_READ_YOUR_WRITES_SECONDS', 10))
+    DB_STICKY_FILE = os.getenv('DB_STICKY_FILE', os.path.join(basedir, 'instance', 'db_sticky'))
+    DB_STICKY_SLOTS = int(os.getenv('DB_STICKY_SLOTS', 65536))  # 最終書き込み時刻を覚えておく枠の数（1枠8バイト）
+    
+    # Gunicorn設定（gunicorn.conf.py と接続プールの計算で共有）
+    GUNICORN_WORKERS = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+    GUNICORN_WORKER_CLASS = os.getenv('GUNICORN_WORKER_CLASS', 'sync')  # sync | gthread | gevent
+    GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', 1))  # gthread のスレッド数
+    GUNICORN_WORKER_CONNECTIONS = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))  # gevent の同時接続数
+    GUNICORN_PRELOAD = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'  # マスターでアプリを読み込みforkで共有
+    GUNICORN_ACCESS_LOG = os.getenv('GUNICORN_ACCESS_LOG', '')  # 空ならGunicornのアクセスログは出さない（アプリのapp.accessを使う）
     
     # JWT設定
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'dev-jwt-secret')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
     
+    # ユーザー情報キャッシュ設定（権限変更時はバージョンファイルで全ワーカーを無効化）
+    AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', 60))
+    AUTH_USER_CACHE_MAX_ENTRIES = int(os.getenv('AUTH_USER_CACHE_MAX_ENTRIES', 10000))
+    USERS_VERSION_FILE = os.getenv('USERS_VERSION_FILE', os.path.join(basedir, 'instance', 'users_version'))
+    
+    # パスワードハッシュ設定（bcrypt）
+    # ROUNDSを変更すると、既存ユーザーのハッシュは次回ログイン時に再計算される
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+    BCRYPT_POOL_SIZE = int(os.getenv('BCRYPT_POOL_SIZE', 2))
+    BCRYPT_MAX_PENDING = int(os.getenv('BCRYPT_MAX_PENDING', 16))
+    BCRYPT_TIMEOUT = float(os.getenv('BCRYPT_TIMEOUT', 10))
+    
     # 管理者設定
     ADMIN_EMAIL_DOMAIN = os.getenv('ADMIN_EMAIL_DOMAIN', '@admin.com')
     
+    # 商品画像設定
+    IMAGE_STORAGE_DIR = os.getenv('IMAGE_STORAGE_DIR', os.path.join(basedir, 'instance', 'images'))
+    IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', 5 * 1024 * 1024))
+    
     # CORS設定
     CORS_ORIGINS = ['http://localhost:3000']
+    CORS_EXPOSE_HEADERS = ['X-Next-Cursor', 'X-Total-Count', 'X-Request-ID']
+    
+    # JSONエンコーダー（auto: orjson があれば使う / orjson / stdlib）
+    JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'auto')
+    
+    # 商品一覧設定
+    PRODUCTS_DEFAULT_PAGE_SIZE = int(os.getenv('PRODUCTS_DEFAULT_PAGE_SIZE', 50))  # limit 未指定時の件数
+    PRODUCTS_MAX_PAGE_SIZE = int(os.getenv('PRODUCTS_MAX_PAGE_SIZE', 100))
+    
+    # 商品検索設定
+    SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', 100))
+    SEARCH_SYNC_OVERLAP = int(os.getenv('SEARCH_SYNC_OVERLAP', 5))  # 他ワーカーの変更を取り込むときに遡る秒数
+    SEARCH_DELETIONS_FILE = os.getenv('SEARCH_DELETIONS_FILE', os.path.join(basedir, 'instance', 'search_deletions'))  # 商品削除の回数（全ワーカーで共有）
+    
+    # 商品一括インポート・エクスポート設定
+    BULK_IMPORT_BATCH_SIZE = int(os.getenv('BULK_IMPORT_BATCH_SIZE', 1000))  # 1トランザクションで書き込む行数
+    BULK_IMPORT_MAX_ERRORS = int(os.getenv('BULK_IMPORT_MAX_ERRORS', 1000))  # 結果に含めるエラー行数の上限
+    BULK_EXPORT_FETCH_SIZE = int(os.getenv('BULK_EXPORT_FETCH_SIZE', 1000))  # サーバーサイドカーソルから一度に取り出す行数
+    
+    # 売上分析設定
+    ANALYTICS_UTC_OFFSET_HOURS = int(os.getenv('ANALYTICS_UTC_OFFSET_HOURS', 9))  # 集計日の区切り（デフォルトは日本時間）。変えたらバックフィルする
+    ANALYTICS_DEFAULT_DAYS = int(os.getenv('ANALYTICS_DEFAULT_DAYS', 30))  # 期間未指定時の日数
+    ANALYTICS_MAX_DAYS = int(os.getenv('ANALYTICS_MAX_DAYS', 366))
+    
+    # 注文履歴設定
+    ORDERS_DEFAULT_PAGE_SIZE = int(os.getenv('ORDERS_DEFAULT_PAGE_SIZE', 20))  # limit 未指定時の件数
+    ORDERS_MAX_PAGE_SIZE = int(os.getenv('ORDERS_MAX_PAGE_SIZE', 50))
+    
+    # Idempotency-Key設定
+    IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT', 15))  # 処理中の重複リクエストが待つ最大秒数
+    IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', 120))  # 処理中のまま放置されたキーを引き継ぐまでの秒数
+    IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+    
+    # カタログキャッシュ設定（バージョンファイルは全ワーカーで共有）
+    CATALOG_CACHE_ENABLED = os.getenv('CATALOG_CACHE_ENABLED', 'true').lower() == 'true'
+    CATALOG_CACHE_MAX_ENTRIES = int(os.getenv('CATALOG_CACHE_MAX_ENTRIES', 1024))
+    CATALOG_VERSION_FILE = os.getenv('CATALOG_VERSION_FILE', os.path.join(basedir, 'instance', 'catalog_version'))
+    # preload_app 時にマスタープロセスで読み込んでおくパス（カンマ区切り。フロントエンドの商品一覧の1ページ目）
+    CATALOG_WARM_PATHS = [p for p in os.getenv('CATALOG_WARM_PATHS', '/api/products?limit=100').split(',') if p]
+    # 事前圧縮（圧縮はキャッシュ充填時に1回。brotli は brotli パッケージがあれば）
+    CATALOG_COMPRESS_ENABLED = os.getenv('CATALOG_COMPRESS_ENABLED', 'true').lower() == 'true'
+    CATALOG_COMPRESS_MIN_BYTES = int(os.getenv('CATALOG_COMPRESS_MIN_BYTES', 1024))
+    CATALOG_GZIP_LEVEL = int(os.getenv('CATALOG_GZIP_LEVEL', 6))
+    CATALOG_BROTLI_QUALITY = int(os.getenv('CATALOG_BROTLI_QUALITY', 5))
+    
+    # ログ設定（1行1JSON。書き込みはワーカーごとのバックグラウンドスレッドで行う）
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # json | text（開発用）
+    LOG_ASYNC = os.getenv('LOG_ASYNC', 'true').lower() == 'true'  # false ならリクエストスレッドで直接書く
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))  # 溢れた分は捨てる（リクエストを待たせない）
+    LOG_ACCESS = os.getenv('LOG_ACCESS', 'true').lower() == 'true'  # アクセスログ（app.access）
+    # ロガーごとにERROR未満を残す割合（カンマ区切り。例: app.access=0.1）
+    LOG_SAMPLE_RATES = os.getenv('LOG_SAMPLE_RATES', 'app.jwt=0.1,app.services.rate_limit=0.1')
+    
+    # リクエスト計測設定（Server-Timing ヘッダーと /metrics。ヒストグラムは METRICS_DIR のファイルで全ワーカー共有）
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(basedir, 'instance', 'metrics'))
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # 設定すると /metrics に Bearer トークンが必要
+    SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'true').lower() == 'true'
+    METRICS_N_PLUS_ONE_THRESHOLD = int(os.getenv('METRICS_N_PLUS_ONE_THRESHOLD', 10))  # 同じSQLがこの回数を超えたら警告
+    METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1))  # ワーカー内で溜めた値を共有ファイルに書く間隔（秒）
+    
+    # クライアントIPを読むヘッダー（nginx が CF-Connecting-IP から復元して渡す。空なら接続元アドレス）
+    CLIENT_IP_HEADER = os.getenv('CLIENT_IP_HEADER', 'X-Real-IP')
+    
+    # レート制限設定（トークンバケット。状態は RATE_LIMIT_FILE を全ワーカーで共有）
+    # 形式: 回数/second|minute|hour|day（空なら制限なし）
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_FILE = os.getenv('RATE_LIMIT_FILE', os.path.join(basedir, 'instance', 'rate_limit'))
+    RATE_LIMIT_SLOTS = int(os.getenv('RATE_LIMIT_SLOTS', 65536))  # 同時に覚えておくキーの数（1キー24バイト）
+    RATE_LIMIT_LOGIN_PER_IP = os.getenv('RATE_LIMIT_LOGIN_PER_IP', '20/minute')
+    RATE_LIMIT_LOGIN_PER_USER = os.getenv('RATE_LIMIT_LOGIN_PER_USER', '5/minute')  # メールアドレスごとのログイン失敗
+    RATE_LIMIT_REGISTER_PER_IP = os.getenv('RATE_LIMIT_REGISTER_PER_IP', '10/hour')
+    RATE_LIMIT_PAYMENT_PER_IP = os.getenv('RATE_LIMIT_PAYMENT_PER_IP', '30/minute')
+    RATE_LIMIT_PAYMENT_PER_USER = os.getenv('RATE_LIMIT_PAYMENT_PER_USER', '10/minute')
+    
+    # 負荷制限設定（nginx の X-Request-Start からの待ち時間が予算を超えたら処理せずに503。0で無効）
+    LOAD_SHED_QUEUE_BUDGET_MS = int(os.getenv('LOAD_SHED_QUEUE_BUDGET_MS', 500))  # レート制限のかかる重いAPI
+    LOAD_SHED_MAX_QUEUE_MS = int(os.getenv('LOAD_SHED_MAX_QUEUE_MS', 10000))  # それ以外
     
     # Stripe設定
     STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
     STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY', '')
+    STRIPE_API_BASE = os.getenv('STRIPE_API_BASE', '')  # テスト用スタブサーバーのURL（空ならStripe本番API）
+    STRIPE_CONNECT_TIMEOUT = float(os.getenv('STRIPE_CONNECT_TIMEOUT', 3))
+    STRIPE_READ_TIMEOUT = float(os.getenv('STRIPE_READ_TIMEOUT', 10))
+    STRIPE_MAX_RETRIES = int(os.getenv('STRIPE_MAX_RETRIES', 2))
+    STRIPE_POOL_MAXSIZE = int(os.getenv('STRIPE_POOL_MAXSIZE', 50))  # gevent ワーカーでStripeへ同時に張る接続数
+    STRIPE_VERIFIED_INTENT_TTL = int(os.getenv('STRIPE_VERIFIED_INTENT_TTL', 600))
+    STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', '')
+    # 注文の確定方法: sync = 注文作成時にStripeへ問い合わせ / webhook = Webhookで確定（注文はpendingで作成）
+    STRIPE_ORDER_FINALIZATION = os.getenv('STRIPE_ORDER_FINALIZATION', 'sync')
+    STRIPE_EVENTS_ASYNC = os.getenv('STRIPE_EVENTS_ASYNC', 'true').lower() == 'true'
+    STRIPE_EVENT_POLL_INTERVAL = float(os.getenv('STRIPE_EVENT_POLL_INTERVAL', 5))
+    STRIPE_EVENT_CLAIM_TIMEOUT = int(os.getenv('STRIPE_EVENT_CLAIM_TIMEOUT', 300))
+    STRIPE_EVENT_MAX_ATTEMPTS = int(os.getenv('STRIPE_EVENT_MAX_ATTEMPTS', 5))
+    # Webhookで確定しないまま在庫を押さえる保留中の注文の期限（秒）。過ぎたらStripeに確認して確定・キャンセル。0なら無期限
+    STRIPE_PENDING_ORDER_TTL = int(os.getenv('STRIPE_PENDING_ORDER_TTL', 1800))
+    STRIPE_INTENT_CACHE_DIR = os.getenv('STRIPE_INTENT_CACHE_DIR', os.path.join(basedir, 'instance', 'stripe_intents'))
 
 
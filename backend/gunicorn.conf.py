@@ -1,11 +1,19 @@
 """Gunicorn設定ファイル"""
 import os
-import multiprocessing
+import sys
 
-# ワーカー設定
-workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
-worker_class = 'sync'
-worker_connections = 1000
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from config import Config
+
+# ワーカー設定（DB接続プールの大きさもこの値から計算する）
+workers = Config.GUNICORN_WORKERS
+worker_class = Config.GUNICORN_WORKER_CLASS  # sync | gthread | gevent
+if worker_class == 'gevent':
+    # preload_app でマスターが作るロック・スレッドもgevent用になるよう、アプリの読み込み前にパッチする
+    from gevent import monkey
+    monkey.patch_all()
+threads = Config.GUNICORN_THREADS  # gthread のみ有効
+worker_connections = Config.GUNICORN_WORKER_CONNECTIONS  # gevent のみ有効
 timeout = 30
 keepalive = 2
 
@@ -13,7 +21,8 @@ keepalive = 2
 bind = '0.0.0.0:5000'
 
 # ログ設定
-accesslog = '-'
+# アクセスログはアプリ（app.access、JSON・request_id付き、非同期書き込み）が出す
+accesslog = Config.GUNICORN_ACCESS_LOG or None
 errorlog = '-'
 loglevel = 'info'
 
@@ -28,8 +37,44 @@ tmp_upload_dir = None
 # リロード設定（開発環境のみ）
 reload = os.getenv('FLASK_ENV') == 'development'
 
+# プリロード（マスターでアプリを読み込み、温めた状態をforkで共有。reload時は無効）
+preload_app = Config.GUNICORN_PRELOAD and not reload
+
 # 高度な設定
 max_requests = 1000
 max_requests_jitter = 50
 graceful_timeout = 30
 
+
+
+# フック
+def when_ready(server):
+    """preload_app 時、ワーカーをforkする前にマスターでアプリを温める"""
+    if not preload_app:
+        return
+    from app.warmup import warm_up
+    warm_up(server.app.wsgi())
+
+
+def post_fork(server, worker):
+    """fork直後に、親プロセスから引き継いだDB接続プールを破棄"""
+    from app.db_engine import dispose_engines_after_fork
+    dispose_engines_after_fork()
+
+
+def post_worker_init(worker):
+    """gevent ワーカーでは、psycopg2 の待ち処理を協調的にする（ソケットのパッチは Gunicorn が済ませている）"""
+    if worker_class != 'gevent':
+        return
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        worker.log.warning('psycogreen がないため、DBクエリ中はワーカー全体がブロックされます')
+        return
+    patch_psycopg()
+
+
+def worker_exit(server, worker):
+    """ワーカー終了時（max_requests での入れ替えを含む）に、溜めているリクエスト計測を書き出す"""
+    from app.services.request_metrics import request_metrics
+    request_metrics.flush()
@@ -1,6 +1,7 @@
 """初期データ投入スクリプト"""
 from app import create_app
 from app.models import db, User, Product
+from flask_migrate import stamp
 from datetime import datetime
 
 def seed_database():
@@ -10,6 +11,8 @@ def seed_database():
         # 既存データをクリア
         db.drop_all()
         db.create_all()
+        # create_all で最新スキーマを作ったので、マイグレーションは最新まで適用済みとする
+        stamp()
         
         print("データベースを初期化しました")
         
@@ -0,0 +1,161 @@
+"""Stripe Webhookの受信（ローカルで署名した偽イベント）と、イベントの反映順・保留中の注文の期限切れ"""
+import json
+from datetime import timedelta
+import pytest
+from app import create_app
+from app.models import db, Order, Product, StripeEvent, User
+from app.services.stripe_events import drain, event_consumer, expire_pending_orders, record_event
+from app.services.stripe_gateway import stripe_gateway
+from benchmarks.common import auth_header, make_config
+from benchmarks.stripe_stub import make_payment_intent_event, sign_webhook_payload, start_stub_server
+
+INTENT_ID = 'pi_test_1'
+WEBHOOK_SECRET = 'whsec_test_local'
+
+
+@pytest.fixture
+def app():
+    config = make_config(
+        STRIPE_SECRET_KEY='sk_test_local',
+        STRIPE_ORDER_FINALIZATION='webhook',
+        STRIPE_EVENTS_ASYNC=False,
+        STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET,
+        BCRYPT_ROUNDS=4
+    )
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Product(name='商品', price=100, stock=5, category='c', description='d'))
+        db.session.commit()
+    return app
+
+
+def _event(event_id, event_type):
+    return json.dumps({
+        'id': event_id,
+        'type': event_type,
+        'data': {'object': {'object': 'payment_intent', 'id': INTENT_ID, 'amount': 100}}
+    })
+
+
+@pytest.fixture
+def notified(monkeypatch):
+    """イベント処理スレッドへの通知を記録するだけにする（処理はテストから drain() で行う）"""
+    calls = []
+    monkeypatch.setattr(event_consumer, 'notify', lambda: calls.append(True))
+    return calls
+
+
+def _post_webhook(app, payload, signature=None):
+    return app.test_client().post(
+        '/api/stripe/webhook',
+        data=payload,
+        content_type='application/json',
+        headers={'Stripe-Signature': signature or sign_webhook_payload(payload, WEBHOOK_SECRET)}
+    )
+
+
+def _event_count(app):
+    with app.app_context():
+        return StripeEvent.query.count()
+
+
+def _create_order(app):
+    with app.app_context():
+        user = User(email='u@example.com', display_name='U')
+        user.set_password('password1')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    response = app.test_client().post('/api/orders', json={
+        'items': [{'productId': 1, 'productName': '商品', 'price': 100, 'quantity': 1}],
+        'total': 100,
+        'stripePaymentIntentId': INTENT_ID
+    }, headers=auth_header(app, user_id))
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def _state(app, order_id):
+    with app.app_context():
+        return db.session.get(Order, order_id).status, db.session.get(Product, 1).stock
+
+
+def test_failure_before_order_does_not_cancel_it(app):
+    with app.app_context():
+        record_event(_event('evt_1', 'payment_intent.payment_failed'))
+        drain()
+    order_id = _create_order(app)
+    assert _state(app, order_id) == ('pending', 4)
+    
+    with app.app_context():
+        record_event(_event('evt_2', 'payment_intent.succeeded'))
+        drain()
+    assert _state(app, order_id) == ('paid', 4)
+
+
+def test_success_wins_over_earlier_failure_in_same_batch(app):
+    # 失敗の方が古いが、成功が届いていれば失敗は反映しない
+    order_id = _create_order(app)
+    with app.app_context():
+        record_event(_event('evt_1', 'payment_intent.payment_failed'))
+        record_event(_event('evt_2', 'payment_intent.succeeded'))
+        drain()
+    assert _state(app, order_id) == ('paid', 4)
+
+
+def test_failure_after_order_cancels_it(app):
+    order_id = _create_order(app)
+    with app.app_context():
+        record_event(_event('evt_1', 'payment_intent.payment_failed'))
+        drain()
+    assert _state(app, order_id) == ('cancelled', 5)
+
+
+def test_expired_pending_orders_are_checked_with_stripe(app):
+    server = start_stub_server()
+    app.config['STRIPE_API_BASE'] = f'http://127.0.0.1:{server.server_port}'
+    stripe_gateway.init_app(app)
+    try:
+        order_id = _create_order(app)  # スタブに存在しないPaymentIntent
+        with app.app_context():
+            assert expire_pending_orders() == 0  # 期限前
+            order = db.session.get(Order, order_id)
+            order.created_at -= timedelta(seconds=app.config['STRIPE_PENDING_ORDER_TTL'] + 1)
+            db.session.commit()
+            assert expire_pending_orders() == 1
+        assert _state(app, order_id) == ('cancelled', 5)
+    finally:
+        server.shutdown()
+
+
+def test_webhook_rejects_bad_signature(app, notified):
+    payload = make_payment_intent_event(INTENT_ID, 100)
+    response = _post_webhook(app, payload, sign_webhook_payload(payload, 'whsec_wrong'))
+    assert response.status_code == 400
+    assert _event_count(app) == 0
+    assert not notified
+
+
+def test_webhook_records_signed_event_and_confirms_order(app, notified):
+    order_id = _create_order(app)
+    notified.clear()  # 注文作成時の照合の通知
+    payload = make_payment_intent_event(INTENT_ID, 100)
+    
+    # 記録だけしてすぐに200を返す（注文はまだ保留中）
+    response = _post_webhook(app, payload)
+    assert response.status_code == 200
+    assert _event_count(app) == 1
+    assert len(notified) == 1
+    assert _state(app, order_id) == ('pending', 4)
+    
+    # 同じイベントIDの再送は重複として記録せず、200を返す
+    response = _post_webhook(app, payload)
+    assert response.status_code == 200
+    assert _event_count(app) == 1
+    assert len(notified) == 1
+    
+    # イベント処理スレッドが処理すると確定し、在庫は戻さない
+    with app.app_context():
+        assert drain() == 1
+    assert _state(app, order_id) == ('paid', 4)
@@ -65,18 +65,55 @@ export const authAPI = {
 };
 
 // 商品API
+// 商品一覧の1ページの件数（バックエンドの PRODUCTS_MAX_PAGE_SIZE 以下。CATALOG_WARM_PATHS と合わせる）
+const PRODUCTS_PAGE_SIZE = 100;
+
 export const productsAPI = {
-  getAll: () => api.get('/products'),
+  getPage: (params) => api.get('/products', { params: { limit: PRODUCTS_PAGE_SIZE, ...params } }),
+  // X-Next-Cursor をたどって全ページを取得（data は全件の配列）
+  getAll: async (params = {}) => {
+    const items = [];
+    let cursor;
+    let response;
+    do {
+      response = await productsAPI.getPage(cursor ? { ...params, cursor } : params);
+      items.push(...response.data);
+      cursor = response.headers['x-next-cursor'];
+    } while (cursor);
+    return { ...response, data: items };
+  },
   getById: (id) => api.get(`/products/${id}`),
+  search: (q, params) => api.get('/products/search', { params: { q, ...params } }),
   create: (data) => api.post('/products', data),
   update: (id, data) => api.put(`/products/${id}`, data),
   delete: (id) => api.delete(`/products/${id}`),
+  bulkImport: (file, format) => api.post('/products/bulk', file, {
+    params: { format },
+    headers: { 'Content-Type': format === 'jsonl' ? 'application/x-ndjson' : 'text/csv' },
+    timeout: 0, // 件数に応じて時間がかかるためタイムアウトしない
+  }),
+  export: (format = 'csv') => api.get('/products/export', { params: { format }, responseType: 'blob', timeout: 0 }),
 };
 
 // 注文API
+// 注文履歴の1ページの件数（バックエンドの ORDERS_MAX_PAGE_SIZE 以下）
+const ORDERS_PAGE_SIZE = 50;
+
 export const ordersAPI = {
   create: (data) => api.post('/orders', data),
-  getAll: () => api.get('/orders'),
+  getPage: (params) => api.get('/orders', { params: { limit: ORDERS_PAGE_SIZE, ...params } }),
+  // X-Next-Cursor をたどって全ページを取得（data は全件の配列）
+  getAll: async (params = {}) => {
+    const items = [];
+    let cursor;
+    let response;
+    do {
+      response = await ordersAPI.getPage(cursor ? { ...params, cursor } : params);
+      items.push(...response.data);
+      cursor = response.headers['x-next-cursor'];
+    } while (cursor);
+    return { ...response, data: items };
+  },
   getById: (id) => api.get(`/orders/${id}`),
 };
 
@@ -85,5 +122,13 @@ export const stripeAPI = {
   createPaymentIntent: (data) => api.post('/stripe/create-payment-intent', data),
 };
 
+// 売上分析API（管理者）
+export const analyticsAPI = {
+  getDaily: (params) => api.get('/admin/analytics/daily', { params }),
+  getProducts: (params) => api.get('/admin/analytics/products', { params }),
+  getProductDaily: (id, params) => api.get(`/admin/analytics/products/${id}`, { params }),
+  getCategories: (params) => api.get('/admin/analytics/categories', { params }),
+};
+
 export default api;
 
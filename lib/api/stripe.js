@@ -16,14 +16,16 @@ const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5000/api';
  * 3. client_secretを受け取る
  * 4. このclient_secretを使ってカード決済を行う
  */
-export async function createPaymentIntent(amount) {
+export async function createPaymentIntent(amount, idempotencyKey) {
   const token = localStorage.getItem('token');
   
   const response = await fetch(`${API_URL}/stripe/create-payment-intent`, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
-      'Authorization': `Bearer ${token}`
+      'Authorization': `Bearer ${token}`,
+      // 再送時に同じPaymentIntentを返してもらうためのキー
+      ...(idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {})
     },
     body: JSON.stringify({ amount })
   });
@@ -85,14 +87,16 @@ export async function getStripeConfig() {
  * 説明:
  * 決済成功後、注文データをバックエンドに送信してDBに保存
  */
-export async function createOrder(orderData) {
+export async function createOrder(orderData, idempotencyKey) {
   const token = localStorage.getItem('token');
   
   const response = await fetch(`${API_URL}/orders`, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
-      'Authorization': `Bearer ${token}`
+      'Authorization': `Bearer ${token}`,
+      // 再送時に注文が二重作成されないためのキー
+      ...(idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {})
     },
     body: JSON.stringify(orderData)
   });
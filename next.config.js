@@ -1,8 +1,19 @@
 /** @type {import('next').NextConfig} */
+const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5000/api';
+
 const nextConfig = {
   reactStrictMode: true,
   output: 'standalone', // Docker用にstandalone出力を有効化
+  // 商品画像（/api/images/...）はバックエンドの画像ストアから配信
+  // 本番ではnginxが /api/ をバックエンドに振り分けるため、主に開発環境用
+  async rewrites() {
+    return [
+      {
+        source: '/api/images/:path*',
+        destination: `${API_URL}/images/:path*`,
+      },
+    ];
+  },
 }
 
 module.exports = nextConfig
-